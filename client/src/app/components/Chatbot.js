@@ -3,6 +3,33 @@
 import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 
+// Parse one server-sent event frame into { id, event, data }. Keep-alive
+// comments and retry hints carry no data and return null.
+const parseSSEFrame = (frame) => {
+  let id = null;
+  let event = 'message';
+  const data = [];
+  for (const line of frame.split('\n')) {
+    if (!line || line.startsWith(':')) {
+      continue;
+    }
+    const colon = line.indexOf(':');
+    const field = colon === -1 ? line : line.slice(0, colon);
+    let value = colon === -1 ? '' : line.slice(colon + 1);
+    if (value.startsWith(' ')) {
+      value = value.slice(1);
+    }
+    if (field === 'id') {
+      id = value;
+    } else if (field === 'event') {
+      event = value;
+    } else if (field === 'data') {
+      data.push(value);
+    }
+  }
+  return data.length ? { id, event, data: data.join('\n') } : null;
+};
+
 const ChatBot = ({ visible, setVisible, isFullView = false }) => {
   const [question, setQuestion] = useState('');
   const [messages, setMessages] = useState([]);
@@ -17,6 +44,9 @@ const ChatBot = ({ visible, setVisible, isFullView = false }) => {
   ]);
 
   const messagesEndRef = useRef(null);
+  // Multi-turn session on the server: the chart is sent to the model once
+  // and follow-ups see the earlier turns
+  const sessionIdRef = useRef(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -39,6 +69,19 @@ const ChatBot = ({ visible, setVisible, isFullView = false }) => {
     }
   };
 
+  const ensureSession = async (userInfo) => {
+    if (!sessionIdRef.current) {
+      try {
+        const res = await axios.post('http://localhost:5000/chat/sessions', userInfo);
+        sessionIdRef.current = res.data.session_id;
+      } catch (error) {
+        // Without a session every question is answered on its own
+        console.error('Error starting chat session:', error);
+      }
+    }
+    return sessionIdRef.current;
+  };
+
   const handleAsk = async () => {
     const userInfo = JSON.parse(localStorage.getItem("astro_user_info"));
     if (!userInfo) return alert("Please generate your chart first.");
@@ -58,86 +101,109 @@ const ChatBot = ({ visible, setVisible, isFullView = false }) => {
     setMessages(prev => [...prev, { role: "bot", text: "", id: botMessageIndex }]);
     setStreamingMessages(prev => new Set([...prev, botMessageIndex])); // Mark as streaming
 
-    try {
-      const response = await fetch('http://localhost:5000/chat/stream', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          ...userInfo,
-          question: currentQuestion,
-        }),
-      });
+    const updateBotText = (text) => {
+      setMessages(prev =>
+        prev.map(msg =>
+          msg.id === botMessageIndex
+            ? { ...msg, text }
+            : msg
+        )
+      );
+    };
 
-      if (!response.ok) {
-        throw new Error('Network response was not ok');
-      }
+    // The birth details go along so an expired session is restarted transparently
+    const sessionId = await ensureSession(userInfo);
+    const body = { ...userInfo, session_id: sessionId, question: currentQuestion };
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
+    try {
       let accumulatedText = "";
+      let lastEventId = null;
+      let finished = false;
+
+      // If the connection drops mid-answer, reconnect with Last-Event-ID and
+      // the server replays the events we missed
+      for (let attempt = 0; attempt < 3 && !finished; attempt++) {
+        const headers = { 'Content-Type': 'application/json' };
+        if (lastEventId) {
+          headers['Last-Event-ID'] = lastEventId;
+        }
+        const response = await fetch('http://localhost:5000/chat/stream', {
+          method: 'POST',
+          headers,
+          body: JSON.stringify(body),
+        });
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) {
-          // Final update to ensure we have the complete text
-          setMessages(prev =>
-            prev.map(msg =>
-              msg.id === botMessageIndex
-                ? { ...msg, text: accumulatedText }
-                : msg
-            )
-          );
-          break;
+        if (!response.ok) {
+          throw new Error('Network response was not ok');
+        }
+        if (response.headers.get('X-Session-Id')) {
+          sessionIdRef.current = response.headers.get('X-Session-Id');
         }
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n');
-
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            const data = line.slice(6).trim();
-            if (data === '[DONE]') {
-              setIsTyping(false);
-              // Mark streaming as complete and ensure final text is saved
-              setMessages(prev =>
-                prev.map(msg =>
-                  msg.id === botMessageIndex
-                    ? { ...msg, text: accumulatedText }
-                    : msg
-                )
-              );
-              setStreamingMessages(prev => {
-                const newSet = new Set(prev);
-                newSet.delete(botMessageIndex);
-                return newSet;
-              });
-              return;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (!finished) {
+          let result;
+          try {
+            result = await reader.read();
+          } catch (networkError) {
+            console.warn('Stream interrupted, resuming:', networkError);
+            break;
+          }
+          if (result.done) {
+            break;
+          }
+
+          buffer += decoder.decode(result.value, { stream: true });
+
+          // Events are separated by a blank line
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const event = parseSSEFrame(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            if (!event) {
+              continue;
+            }
+            if (event.id) {
+              lastEventId = event.id;
             }
-            if (data) {
-              accumulatedText += data;
-              // Update UI more frequently for better streaming experience
-              setMessages(prev =>
-                prev.map(msg =>
-                  msg.id === botMessageIndex
-                    ? { ...msg, text: accumulatedText }
-                    : msg
-                )
-              );
+            if (event.event === 'done') {
+              finished = true;
+              break;
             }
+            if (event.event === 'error') {
+              throw new Error(event.data);
+            }
+            accumulatedText += event.data;
+            // Update UI more frequently for better streaming experience
+            updateBotText(accumulatedText);
           }
         }
       }
 
+      if (!finished) {
+        throw new Error('Stream ended before the answer was complete');
+      }
+
+      setIsTyping(false);
+      // Mark streaming as complete and ensure final text is saved
+      updateBotText(accumulatedText);
+      setStreamingMessages(prev => {
+        const newSet = new Set(prev);
+        newSet.delete(botMessageIndex);
+        return newSet;
+      });
+
     } catch (e) {
       console.error('Streaming error:', e);
       // Fallback to regular API call
       try {
-        const res = await axios.post('http://localhost:5000/chat', {
-          ...userInfo,
-          question: currentQuestion,
-        });
+        const res = await axios.post('http://localhost:5000/chat', body);
+        if (res.data.session_id) {
+          sessionIdRef.current = res.data.session_id;
+        }
         setMessages(prev => 
           prev.map(msg => 
             msg.id === botMessageIndex 
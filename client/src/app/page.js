@@ -27,7 +27,7 @@ export default function Home() {
   const [tob, setTob] = useState('');
   const [placeQuery, setPlaceQuery] = useState('');
   const [suggestions, setSuggestions] = useState([]);
-  const [selectedCoords, setSelectedCoords] = useState({ lat: null, lon: null });
+  const [selectedCoords, setSelectedCoords] = useState({ lat: null, lon: null, timezone: null });
   const [loading, setLoading] = useState(false);
 
   const [d1Chart, setD1Chart] = useState(null);
@@ -43,17 +43,41 @@ export default function Home() {
     setPlaceQuery(query);
 
     if (query.length > 2) {
-      const res = await geocodingClient.forwardGeocode({
-        query,
-        limit: 5,
-        countries: ['IN'],
-      }).send();
-
-      const results = res.body.features.map(feature => ({
-        place_name: feature.place_name,
-        lat: feature.center[1],
-        lon: feature.center[0],
-      }));
+      // The server's offline gazetteer answers without a third-party call;
+      // Mapbox is only asked about places it does not know, or when the
+      // server cannot be reached
+      let results = [];
+      try {
+        const local = await axios.get('http://localhost:5000/places', {
+          params: { q: query, limit: 5, country: 'IN' },
+        });
+        results = local.data.places.map(place => ({
+          place_name: [place.name, place.admin1, place.country_name].filter(Boolean).join(', '),
+          lat: place.lat,
+          lon: place.lon,
+          timezone: place.timezone,
+        }));
+      } catch (error) {
+        console.error('Place search failed, using Mapbox:', error);
+      }
+
+      if (results.length === 0) {
+        try {
+          const res = await geocodingClient.forwardGeocode({
+            query,
+            limit: 5,
+            countries: ['IN'],
+          }).send();
+
+          results = res.body.features.map(feature => ({
+            place_name: feature.place_name,
+            lat: feature.center[1],
+            lon: feature.center[0],
+          }));
+        } catch (error) {
+          console.error('Geocoding failed:', error);
+        }
+      }
 
       setSuggestions(results);
     } else {
@@ -61,10 +85,25 @@ export default function Home() {
     }
   };
 
-  const handlePlaceSelect = (place) => {
+  const handlePlaceSelect = async (place) => {
     setPlaceQuery(place.place_name);
-    setSelectedCoords({ lat: place.lat, lon: place.lon });
     setSuggestions([]);
+
+    let timezone = place.timezone;
+    if (!timezone) {
+      // Geocoder results carry no timezone; look it up from the coordinates,
+      // falling back to the browser's if the server cannot be reached
+      try {
+        const res = await axios.get('http://localhost:5000/places', {
+          params: { lat: place.lat, lon: place.lon },
+        });
+        timezone = res.data.timezone;
+      } catch (error) {
+        console.error('Timezone lookup failed:', error);
+        timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+      }
+    }
+    setSelectedCoords({ lat: place.lat, lon: place.lon, timezone });
   };
 
   const handleSubmit = async () => {
@@ -73,10 +112,13 @@ export default function Home() {
       return;
     }
 
+    // Timezone of the birth place, not of the browser
+    const timezone = selectedCoords.timezone;
+
     setLoading(true);
     try {
       const res = await axios.post('http://localhost:5000/charts', {
-        dob, tob, lat: selectedCoords.lat, lon: selectedCoords.lon
+        dob, tob, lat: selectedCoords.lat, lon: selectedCoords.lon, timezone
       });
 
       setD1Chart(res.data.d1 || null);
@@ -89,7 +131,7 @@ export default function Home() {
         dob, tob,
         lat: selectedCoords.lat,
         lon: selectedCoords.lon,
-        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+        timezone,
       }));
 
     } catch (error) {
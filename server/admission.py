@@ -0,0 +1,371 @@
+"""Admission control and priority queueing for LLM calls.
+
+Without a limit, a spike sends every /chat, /chat/stream and
+/chat/next-questions request to the provider at once. The provider
+throttles, and every request gets slow instead of a few waiting. Each LLM
+call in chat.py and sessions.py now passes this controller first:
+
+    for chunk in admission.stream("chat_stream", prompt, get_router().stream):
+        ...
+
+Budgets are per provider: the one the router ranks first, and for hedged
+or failed-over attempts the provider that serves them (llm_router.py):
+
+    concurrency   LLM_CONCURRENCY_<PROVIDER>, else LLM_CONCURRENCY (16), the
+                  same limit llm_registry applies to the provider's client
+    token rate    LLM_TPM_<PROVIDER>, else LLM_TPM, in estimated tokens per
+                  minute (unlimited when unset). A call is charged its prompt
+                  (4 characters a token) plus ADMISSION_OUTPUT_TOKENS up front.
+                  The charge is corrected to the real answer length when the
+                  call ends.
+
+When a budget is spent, calls queue by priority, FIFO within a class:
+interactive streams (chat_stream), then blocking chat (chat), then
+follow-up suggestions (next_questions), then background session summaries
+(summary), then bulk readings from reports.py (report). Each class waits
+at most ADMISSION_MAX_WAIT_<CLASS> seconds. Shedding is deadline-aware. A
+call is rejected at once if its estimated wait is already longer than its
+deadline. The estimate is the queued calls ahead of it times the recent
+call duration, divided by the concurrency. A call is also rejected when
+the queue holds ADMISSION_MAX_QUEUE calls, or when it reaches its deadline
+while queued. A rejected call raises Overloaded, and the servers answer it
+with 503 and Retry-After.
+
+Queue depth, running calls, queue wait and outcomes are on /metrics.
+Budgets are per process.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+import cancellation
+from llm_registry import concurrency_limit
+from llm_router import get_router
+from metrics import Counter, Gauge, Histogram
+
+# Lower runs first
+PRIORITIES = {"chat_stream": 0, "chat": 1, "next_questions": 2, "summary": 3, "report": 4}
+DEFAULT_MAX_WAIT = {"chat_stream": 10.0, "chat": 10.0, "next_questions": 2.0, "summary": 30.0, "report": 300.0}
+
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+OUTPUT_TOKENS = int(os.getenv("ADMISSION_OUTPUT_TOKENS", "600"))
+# Assumed call duration until calls have been timed
+PRIOR_CALL_SECONDS = float(os.getenv("ADMISSION_PRIOR_CALL_SECONDS", "5"))
+
+ADMISSION_REQUESTS = Counter(
+    "astrobot_admission_requests", "LLM calls by priority and outcome: admitted, shed, expired.",
+    ("priority", "outcome"))
+ADMISSION_WAIT_SECONDS = Histogram(
+    "astrobot_admission_wait_seconds", "Time admitted LLM calls spent queued.", ("priority",))
+
+
+def max_wait(priority):
+    return float(os.getenv(f"ADMISSION_MAX_WAIT_{priority.upper()}", DEFAULT_MAX_WAIT[priority]))
+
+
+def _tokens_per_minute(provider):
+    value = os.getenv(f"LLM_TPM_{provider.upper()}", os.getenv("LLM_TPM", ""))
+    return float(value) if value else None
+
+
+def _tokens(chars):
+    return -(-chars // 4)
+
+
+class Overloaded(Exception):
+    """The provider's budget is spent and the call would wait past its deadline."""
+
+    def __init__(self, retry_after, message=None):
+        super().__init__(message or f"Too many requests right now, please retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One LLM call, from queueing until release()."""
+    __slots__ = ("provider", "priority", "prompt_tokens", "tokens", "queued", "deadline", "started",
+                 "granted", "cancelled", "wake")
+
+    def __init__(self, provider, priority, prompt_tokens, now):
+        self.provider = provider
+        self.priority = priority
+        self.prompt_tokens = prompt_tokens
+        self.tokens = prompt_tokens + OUTPUT_TOKENS
+        self.queued = now
+        self.deadline = now + max_wait(priority)
+        self.started = None
+        self.granted = False
+        self.cancelled = False
+        self.wake = None
+
+
+class ProviderBudget:
+    """Running calls, token bucket and wait queue of one provider."""
+
+    def __init__(self, name, concurrency, tokens_per_minute=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = tokens_per_minute or 0.0
+        self.refilled = time.monotonic()
+        self.running = 0
+        self.queue = []
+        self.waiting = dict.fromkeys(PRIORITIES, 0)
+        self.call_seconds = PRIOR_CALL_SECONDS
+
+    def _refill(self, now):
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute,
+                              self.tokens + (now - self.refilled) * self.tokens_per_minute / 60)
+        self.refilled = now
+
+    def token_wait(self, tokens, now):
+        """Seconds until the bucket can pay for `tokens` (0 without a token budget)."""
+        if not self.tokens_per_minute:
+            return 0.0
+        self._refill(now)
+        # A call larger than the whole bucket only needs a full bucket
+        missing = min(tokens, self.tokens_per_minute) - self.tokens
+        return max(missing, 0.0) * 60 / self.tokens_per_minute
+
+    def can_start(self, tokens, now):
+        return self.running < self.concurrency and self.token_wait(tokens, now) == 0
+
+    def ahead(self, rank):
+        """Queued calls that would run before a new call of this priority rank."""
+        return [ticket for r, _, ticket in self.queue if r <= rank and not ticket.cancelled]
+
+    def estimated_wait(self, rank, tokens, now):
+        """Seconds a new call of this priority rank would spend queued."""
+        ahead = self.ahead(rank)
+        if not ahead and self.can_start(tokens, now):
+            return 0.0
+        # Calls that must finish before a slot is free for this one, run `concurrency` at a time
+        behind = len(ahead) + self.running - self.concurrency + 1
+        slot_wait = math.ceil(max(behind, 0) / self.concurrency) * self.call_seconds
+        token_wait = self.token_wait(sum(ticket.tokens for ticket in ahead) + tokens, now)
+        return max(slot_wait, token_wait)
+
+
+class AdmissionController:
+    def __init__(self):
+        self._budgets = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def budget(self, provider):
+        with self._lock:
+            return self._budget(provider)
+
+    def _budget(self, provider):
+        budget = self._budgets.get(provider)
+        if budget is None:
+            budget = self._budgets[provider] = ProviderBudget(
+                provider, concurrency_limit(provider), _tokens_per_minute(provider))
+        return budget
+
+    # ===== QUEUE =====
+    def _start(self, budget, ticket, now):
+        budget.running += 1
+        if budget.tokens_per_minute:
+            budget.tokens -= ticket.tokens
+        ticket.started = now
+        ticket.granted = True
+        ADMISSION_REQUESTS.inc(priority=ticket.priority, outcome="admitted")
+        ADMISSION_WAIT_SECONDS.observe(now - ticket.queued, priority=ticket.priority)
+
+    def _dispatch(self, budget, now):
+        """Start queued calls, highest priority first, while the budget allows."""
+        while budget.queue:
+            ticket = budget.queue[0][2]
+            if not ticket.cancelled:
+                if not budget.can_start(ticket.tokens, now):
+                    return
+                budget.waiting[ticket.priority] -= 1
+                self._start(budget, ticket, now)
+            heapq.heappop(budget.queue)
+            if ticket.granted and ticket.wake is not None:
+                ticket.wake()
+
+    def _shed(self, budget, priority, tokens, now, outcome="shed"):
+        """Overloaded for a call of this priority, with the current estimated wait as Retry-After."""
+        ADMISSION_REQUESTS.inc(priority=priority, outcome=outcome)
+        wait = budget.estimated_wait(PRIORITIES[priority], tokens, now)
+        return Overloaded(max(1, math.ceil(wait)))
+
+    def _enter(self, priority, prompt, provider, wake):
+        """Start the call now, queue it, or raise Overloaded."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown admission priority: {priority}")
+        provider = provider or get_router().rank()[0].name
+        now = time.monotonic()
+        ticket = Ticket(provider, priority, _tokens(len(prompt)), now)
+        rank = PRIORITIES[priority]
+        with self._lock:
+            budget = self._budget(provider)
+            wait = budget.estimated_wait(rank, ticket.tokens, now)
+            if wait == 0:
+                self._start(budget, ticket, now)
+                return ticket
+            if wait > ticket.deadline - now or len(budget.queue) >= MAX_QUEUE:
+                raise self._shed(budget, priority, ticket.tokens, now)
+            ticket.wake = wake
+            heapq.heappush(budget.queue, (rank, next(self._seq), ticket))
+            budget.waiting[priority] += 1
+        return ticket
+
+    def _poll(self, ticket):
+        """Seconds to wait before polling again, 0 once admitted; Overloaded past the deadline."""
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budget(ticket.provider)
+            self._dispatch(budget, now)
+            if ticket.granted:
+                return 0
+            if now >= ticket.deadline:
+                self._cancel(budget, ticket)
+                raise self._shed(budget, ticket.priority, ticket.tokens, now, "expired")
+            timeout = ticket.deadline - now
+            if budget.queue and budget.running < budget.concurrency:
+                # Blocked on the token bucket, which no release() will signal
+                timeout = min(timeout, budget.token_wait(budget.queue[0][2].tokens, now))
+            return max(timeout, 0.001)
+
+    def _cancel(self, budget, ticket):
+        if not ticket.cancelled and not ticket.granted:
+            ticket.cancelled = True
+            budget.waiting[ticket.priority] -= 1
+
+    # ===== ADMISSION =====
+    def check(self, priority, provider=None):
+        """Raise Overloaded if a call of this priority would be shed now.
+
+        For routes that must answer 503 before they start streaming.
+        """
+        provider = provider or get_router().rank()[0].name
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budget(provider)
+            if len(budget.queue) >= MAX_QUEUE or \
+                    budget.estimated_wait(PRIORITIES[priority], OUTPUT_TOKENS, now) > max_wait(priority):
+                raise self._shed(budget, priority, OUTPUT_TOKENS, now)
+
+    def acquire(self, priority, prompt, provider=None):
+        """Block until the call may run; the returned ticket must be release()d."""
+        event = threading.Event()
+        ticket = self._enter(priority, prompt, provider, event.set)
+        token = cancellation.current()
+        unregister = cancellation.on_cancel(event.set)
+        try:
+            while not ticket.granted:
+                if token is not None and token.cancelled:
+                    # The client went away while queued
+                    with self._lock:
+                        self._cancel(self._budget(ticket.provider), ticket)
+                    if ticket.granted:
+                        self.release(ticket)
+                    raise cancellation.Cancelled()
+                timeout = self._poll(ticket)
+                if timeout:
+                    event.wait(timeout)
+                    event.clear()
+        finally:
+            unregister()
+        return ticket
+
+    async def acquire_async(self, priority, prompt, provider=None):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        ticket = self._enter(priority, prompt, provider, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            while not ticket.granted:
+                timeout = self._poll(ticket)
+                if timeout:
+                    try:
+                        await asyncio.wait_for(event.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    event.clear()
+        except asyncio.CancelledError:
+            # The client went away while queued
+            with self._lock:
+                self._cancel(self._budget(ticket.provider), ticket)
+            if ticket.granted:
+                self.release(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket, output_chars=0):
+        """End an admitted call and let the next queued ones start."""
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budget(ticket.provider)
+            budget.running -= 1
+            if output_chars:
+                # Recent call durations drive the wait estimate
+                budget.call_seconds = 0.8 * budget.call_seconds + 0.2 * (now - ticket.started)
+            if budget.tokens_per_minute:
+                budget.tokens += ticket.tokens - (ticket.prompt_tokens + _tokens(output_chars))
+            self._dispatch(budget, now)
+
+    def try_acquire(self, priority, prompt, provider):
+        """A started ticket if the provider's budget has room right now, else None; never queues."""
+        now = time.monotonic()
+        ticket = Ticket(provider, priority, _tokens(len(prompt)), now)
+        with self._lock:
+            budget = self._budget(provider)
+            if budget.estimated_wait(PRIORITIES[priority], ticket.tokens, now) > 0:
+                return None
+            self._start(budget, ticket, now)
+        return ticket
+
+    def _admitter(self, priority, prompt):
+        """admit(provider) for the router's hedge and failover attempts: a release function, or None."""
+        def admit(provider):
+            ticket = self.try_acquire(priority, prompt, provider)
+            if ticket is None:
+                return None
+            return lambda output_chars=0: self.release(ticket, output_chars)
+        return admit
+
+    def stream(self, priority, prompt, open_stream, provider=None):
+        """Yield from open_stream(prompt, admit) once admitted, holding the slot until it ends."""
+        ticket = self.acquire(priority, prompt, provider)
+        output_chars = 0
+        try:
+            for chunk in open_stream(prompt, self._admitter(priority, prompt)):
+                output_chars += len(chunk)
+                yield chunk
+        finally:
+            self.release(ticket, output_chars)
+
+    async def astream(self, priority, prompt, open_stream, provider=None):
+        ticket = await self.acquire_async(priority, prompt, provider)
+        output_chars = 0
+        try:
+            async for chunk in open_stream(prompt, self._admitter(priority, prompt)):
+                output_chars += len(chunk)
+                yield chunk
+        finally:
+            self.release(ticket, output_chars)
+
+    # ===== METRICS =====
+    def queue_depths(self):
+        with self._lock:
+            return {(name, priority): count for name, budget in self._budgets.items()
+                    for priority, count in budget.waiting.items()}
+
+    def running(self):
+        with self._lock:
+            return {(name,): budget.running for name, budget in self._budgets.items()}
+
+
+admission = AdmissionController()
+
+Gauge("astrobot_admission_queue_depth", "LLM calls waiting for admission, by provider and priority.",
+      ("provider", "priority"), function=admission.queue_depths)
+Gauge("astrobot_admission_running", "Admitted LLM calls in progress, by provider.",
+      ("provider",), function=admission.running)
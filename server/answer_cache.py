@@ -0,0 +1,128 @@
+"""Persistent cache of LLM answers.
+
+Answers are keyed by a hash of the formatted chart text, the charts that were
+sent to the model and the normalized question, so two users asking "How will
+my marriage be?" and "how will my marriage be" about the same chart share one
+Gemini generation. Entries live in a small SQLite file and are dropped after
+``ANSWER_CACHE_TTL`` seconds; once the table holds more than
+``ANSWER_CACHE_MAX_ENTRIES`` rows the least recently used ones are evicted.
+
+Set ``ANSWER_CACHE_PATH`` to an empty string to disable the cache.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.getenv("ANSWER_CACHE_PATH", "cache/answers.sqlite3")
+DEFAULT_TTL = float(os.getenv("ANSWER_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+# Characters per chunk when a cached answer is replayed on a streaming route
+REPLAY_CHUNK_CHARS = 80
+
+ANSWER_CACHE_REQUESTS = Counter(
+    "astrobot_answer_cache_requests", "Answer cache lookups by result.", ("result",))
+
+
+# ===== KEYS =====
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def answer_key(chart_text, charts, question):
+    payload = "\x1f".join([chart_text, ",".join(c.upper() for c in charts), normalize_question(question)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def replay_chunks(answer, size=REPLAY_CHUNK_CHARS):
+    """Split a stored answer into stream-sized chunks, breaking after whitespace."""
+    start = 0
+    while start < len(answer):
+        end = min(start + size, len(answer))
+        if end < len(answer):
+            space = answer.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield answer[start:end]
+        start = end
+
+
+# ===== STORE =====
+class AnswerCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, answer TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+        return self._conn
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE answers SET accessed = ? WHERE key = ?", (now, key))
+        ANSWER_CACHE_REQUESTS.inc(result="hit" if row else "miss")
+        return row[0] if row else None
+
+    def put(self, key, answer):
+        if not self.enabled or not answer:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)", (key, answer, now, now))
+            conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                " SELECT key FROM answers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._connect().execute("DELETE FROM answers")
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {"enabled": True, "entries": entries, "ttl": self.ttl, "max_entries": self.max_entries}
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,273 @@
+# asgi_server.py
+"""Async (ASGI) serving mode with the same routes as main_server.py.
+
+Streaming chats use Gemini's async streaming API, so one process multiplexes
+many concurrent /chat/stream responses instead of pinning a worker thread to
+each one. Chart computation runs in the default executor (and from there on
+the chart engine's process pool), so it never blocks the event loop.
+
+Run with:
+
+    uvicorn asgi_server:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytz
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from admission import Overloaded, admission
+from chart_engine import get_engine
+from combined import get_chart_details_cached
+from chat import (analyze_user_question_async, analyze_user_question_stream_async,
+                  generate_next_questions_async)
+from llm_registry import registry
+from metrics import REQUEST_SECONDS, render, stage
+from places import UnknownPlace, apply_place, gazetteer
+from sessions import UnknownSession, session_for, sessions
+from sse import SSE_HEADERS, AsyncStreamBuffer, parse_last_event_id, streams
+from suggestions import suggestion_service
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+def compute_chart(data, charts, fields):
+    with stage("localize"):
+        dt_local = datetime.strptime(f"{data['dob']} {data['tob']}", "%Y-%m-%d %H:%M")
+        local_tz = pytz.timezone(data.get("timezone", "Asia/Kolkata"))
+        birth_utc = local_tz.localize(dt_local).astimezone(pytz.utc)
+    # A registered user's chart is read from the chart store before it is computed
+    result = get_chart_details_cached(birth_utc, data["lat"], data["lon"], charts=charts, fields=fields,
+                                      user_id=data.get("user_id"))
+    return result.to_dict()
+
+
+def compute_chart_batch(birth_utcs, lats, lons):
+    return [result.to_dict() for result in get_engine().compute_batch(birth_utcs, lats, lons)]
+
+
+async def charts(request):
+    try:
+        # An optional "place" fills in lat, lon and timezone from the gazetteer
+        data = apply_place(await request.json())
+        if not data.get("dob") or not data.get("tob"):
+            return JSONResponse({"error": "Missing 'dob' or 'tob'"}, status_code=400)
+        chart_sel = request.query_params.get("charts", data.get("charts"))
+        field_sel = request.query_params.get("fields", data.get("fields"))
+        return JSONResponse(await run_blocking(compute_chart, data, chart_sel, field_sel))
+
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def charts_batch(request):
+    try:
+        data = await request.json()
+        utc, lats, lons = data.get("utc"), data.get("lat"), data.get("lon")
+        if utc is None or lats is None or lons is None:
+            return JSONResponse({"error": "Missing 'utc', 'lat' or 'lon'"}, status_code=400)
+        if not (len(utc) == len(lats) == len(lons)):
+            return JSONResponse({"error": "'utc', 'lat' and 'lon' must have the same length"}, status_code=400)
+
+        birth_utcs = [datetime.strptime(dt_str, "%Y-%m-%d %H:%M") for dt_str in utc]
+        results = await run_blocking(compute_chart_batch, birth_utcs, lats, lons)
+        return JSONResponse({"charts": results})
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def search_places(request):
+    """?q=<prefix>[&country=IN][&limit=10] to search, ?lat=&lon= for the timezone there."""
+    try:
+        params = request.query_params
+        if params.get("lat") is not None and params.get("lon") is not None:
+            lat, lon = float(params["lat"]), float(params["lon"])
+            place, distance = gazetteer.nearest(lat, lon)
+            return JSONResponse({"timezone": gazetteer.timezone_at(lat, lon), "nearest": place,
+                                 "distance_km": round(distance, 1)})
+        query = params.get("q", "")
+        if not query:
+            return JSONResponse({"error": "Missing 'q' or 'lat' and 'lon'"}, status_code=400)
+        limit = min(int(params.get("limit", 10)), 50)
+        return JSONResponse({"places": gazetteer.search(query, limit, params.get("country"))})
+
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def chat_args(data):
+    return (data["dob"], data["tob"], data.get("timezone", "Asia/Kolkata"),
+            data["lat"], data["lon"], data["question"], data.get("user_id"))
+
+
+async def start_session(request):
+    """Start a multi-turn session; pass its session_id to /chat and /chat/stream."""
+    try:
+        data = apply_place(await request.json())
+        if not data.get("dob") or not data.get("tob"):
+            return JSONResponse({"error": "Missing 'dob' or 'tob'"}, status_code=400)
+        session = await run_blocking(sessions.create, data["dob"], data["tob"],
+                                     data.get("timezone", "Asia/Kolkata"), data["lat"], data["lon"],
+                                     data.get("user_id"))
+        return JSONResponse({"session_id": session.id})
+
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def end_session(request):
+    if not sessions.delete(request.path_params["session_id"]):
+        return JSONResponse({"error": "Unknown session"}, status_code=404)
+    return Response(status_code=204)
+
+
+async def astrology_chat(request):
+    try:
+        data = apply_place(await request.json())
+        # Recreating an expired session computes its chart, so keep it off the loop
+        session = await run_blocking(session_for, data)
+        if session is not None:
+            result = await session.ask_async(data["question"])
+            return JSONResponse({"response": result, "session_id": session.id})
+
+        result = await analyze_user_question_async(*chat_args(data))
+        return JSONResponse({"response": result})
+
+    except UnknownPlace as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except UnknownSession as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    except Overloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def astrology_chat_stream(request):
+    try:
+        stream_id, last_seq = parse_last_event_id(request.headers.get("last-event-id"))
+        headers = dict(SSE_HEADERS)
+        if stream_id is not None:
+            buffer = streams.get(stream_id)
+            if buffer is None:
+                return JSONResponse({"error": "Stream expired, please ask again"}, status_code=410)
+        else:
+            # Shed before the 200 and the event stream have started
+            admission.check("chat_stream")
+            data = apply_place(await request.json())
+            session = await run_blocking(session_for, data)
+            if session is not None:
+                chunks = session.ask_stream_async(data["question"])
+                headers["X-Session-Id"] = session.id
+            else:
+                chunks = analyze_user_question_stream_async(*chat_args(data))
+            buffer = streams.add(AsyncStreamBuffer().start(chunks))
+
+        # Starlette cancels the response when the client disconnects, which
+        # detaches this consumer and, if it was the last, cancels the upstream
+        return StreamingResponse(buffer.follow(last_seq), media_type="text/event-stream",
+                                 headers={**headers, "X-Stream-Id": buffer.id})
+
+    except UnknownPlace as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except UnknownSession as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    except Overloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def next_questions(request):
+    try:
+        data = await request.json()
+        questions = await generate_next_questions_async(data.get("question", ""))
+        return JSONResponse({"questions": questions})
+
+    except Overloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def metrics(request):
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+
+class RequestTimer:
+    """Record per-route handler latency, like main_server's after_request hook."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # The router stores the matched route in the scope; label by its
+                # template so /chat/sessions/<id> is one series, not one per id
+                route = getattr(scope.get("route"), "path", "unmatched")
+                REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, status=message["status"])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if multiprocessing.parent_process() is None:
+        get_engine()
+    suggestion_service.warm()
+    gazetteer.open()
+    registry.warm_in_background()
+    yield
+    get_engine().shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route("/charts", charts, methods=["POST"]),
+        Route("/charts/batch", charts_batch, methods=["POST"]),
+        Route("/places", search_places, methods=["GET"]),
+        Route("/chat/sessions", start_session, methods=["POST"]),
+        Route("/chat/sessions/{session_id}", end_session, methods=["DELETE"]),
+        Route("/chat", astrology_chat, methods=["POST"]),
+        Route("/chat/stream", astrology_chat_stream, methods=["POST"]),
+        Route("/chat/next-questions", next_questions, methods=["POST"]),
+        Route("/metrics", metrics, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["X-Session-Id", "X-Stream-Id", "Retry-After"]),
+        Middleware(RequestTimer),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("PORT", "5000")))
@@ -0,0 +1,106 @@
+"""Cold-start benchmark: process start to first /charts response.
+
+Launches a fresh Python process that imports main_server and POSTs one
+/charts request through the Flask test client, and reports, per run:
+
+    interpreter_s   process start until our first line of code runs
+    import_s        import main_server (engine start, suggestion warm-up)
+    first_charts_s  the first /charts request, served cold
+    total_s         process start to first /charts response
+
+Medians over --runs go to stdout (and --out as JSON), followed by the
+modules that cost most under ``python -X importtime``. With --budget the
+run fails (exit code 1) when the median total exceeds that many seconds:
+
+    python benchmarks/cold_start.py --runs 5 --budget 1.5
+
+The child inherits the environment, so CHART_WORKERS, GENAI_BACKEND and
+LLM_WARMUP apply exactly as they would in production. Modules imported by
+the background LLM warm-up (google.*) show up in the profile too; set
+LLM_WARMUP=0 to see only the import path of the server itself.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+started = time.time()
+import main_server
+imported = time.time()
+response = main_server.app.test_client().post("/charts", json={
+    "dob": "2003-09-20", "tob": "03:37", "timezone": "Asia/Kolkata", "lat": 12.97, "lon": 77.59})
+assert response.status_code == 200, response.get_data(as_text=True)
+answered = time.time()
+print(json.dumps({"started": started, "imported": imported, "answered": answered}), flush=True)
+main_server.get_engine().shutdown()
+"""
+
+
+def run_once():
+    """Timings in seconds for one cold process."""
+    launched = time.time()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=SERVER_DIR,
+                            capture_output=True, text=True, check=True)
+    stamps = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        "interpreter_s": stamps["started"] - launched,
+        "import_s": stamps["imported"] - stamps["started"],
+        "first_charts_s": stamps["answered"] - stamps["imported"],
+        "total_s": stamps["answered"] - launched,
+    }
+
+
+def import_profile(top):
+    """The `top` slowest modules under -X importtime as (self, cumulative, name), in seconds."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main_server"],
+                            cwd=SERVER_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        rows.append((int(own) / 1e6, int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold processes to start")
+    parser.add_argument("--top", type=int, default=15, help="modules to list from -X importtime")
+    parser.add_argument("--budget", type=float, help="max median seconds from process start to first /charts")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    medians = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    profile = import_profile(args.top)
+
+    print(f"{'stage':<18}{'p50 ms':>10}{'max ms':>10}")
+    for key, value in medians.items():
+        print(f"{key:<18}{value * 1e3:>10.1f}{max(run[key] for run in runs) * 1e3:>10.1f}")
+    print(f"\n{'self ms':>9}{'cum ms':>9}  module (-X importtime)")
+    for own, cumulative, name in profile:
+        print(f"{own * 1e3:>9.1f}{cumulative * 1e3:>9.1f}  {name}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"runs": runs, "median": medians, "budget_s": args.budget,
+                       "import_profile": [{"module": name, "self_s": own, "cumulative_s": cumulative}
+                                          for own, cumulative, name in profile]}, f, indent=2)
+
+    if args.budget is not None:
+        if medians["total_s"] > args.budget:
+            print(f"\nOVER BUDGET: first /charts after {medians['total_s']:.3f}s (budget {args.budget:.3f}s)")
+            sys.exit(1)
+        print(f"\nFirst /charts after {medians['total_s']:.3f}s, within the {args.budget:.3f}s budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Load generator for the chat routes.
+
+Keeps ``--concurrency`` requests in flight against a running server for
+``--duration`` seconds (or ``--requests`` in total), mixing /chat,
+/chat/stream and /chat/next-questions, and reports throughput plus
+p50/p95/p99 of total latency and time to first byte per route (for
+/chat/stream, time to the first data: event, so the retry: preamble and
+keep-alive comments do not count as the answer starting):
+
+    GENAI_BACKEND=fake FAKE_LLM_TTFT=0.5 python main_server.py
+    python benchmarks/loadgen.py --url http://127.0.0.1:5000 --concurrency 64 --duration 30
+
+Run the server against fake_genai (GENAI_BACKEND=fake) to size workers
+without spending Gemini quota. Every request uses a different birth, so
+neither the chart cache nor the answer cache short-circuits the pipeline.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+QUESTIONS = [
+    "How will my marriage be?",
+    "When will I have children?",
+    "What does my chart say about my career?",
+    "Will I grow spiritually this year?",
+    "How is my health this year?",
+]
+
+ROUTES = {"chat": "/chat", "stream": "/chat/stream", "next": "/chat/next-questions"}
+
+
+def parse_mix(text):
+    """'chat=1,stream=3,next=1' -> {'chat': 1.0, 'stream': 3.0, 'next': 1.0}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ROUTES:
+            raise ValueError(f"unknown route in mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def request_body(rng, route):
+    question = rng.choice(QUESTIONS)
+    if route == "next":
+        return {"question": question}
+    birth = datetime(1950, 1, 1) + timedelta(minutes=rng.randrange(70 * 365 * 24 * 60))
+    return {"dob": birth.strftime("%Y-%m-%d"), "tob": birth.strftime("%H:%M"), "timezone": "UTC",
+            "lat": round(rng.uniform(-50, 60), 4), "lon": round(rng.uniform(-120, 150), 4),
+            "question": question}
+
+
+async def one_request(client, route, body):
+    """(status, time to first byte, total latency) for one request."""
+    start = time.perf_counter()
+    ttfb = None
+    async with client.stream("POST", ROUTES[route], json=body) as response:
+        event_stream = response.headers.get("content-type", "").startswith("text/event-stream")
+        received = b""
+        async for raw in response.aiter_raw():
+            if ttfb is None:
+                received += raw
+                if not event_stream or b"data:" in received:
+                    ttfb = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return response.status_code, ttfb if ttfb is not None else total, total
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+    samples = {name: {"ttfb": [], "latency": [], "errors": 0} for name in names}
+    deadline = time.perf_counter() + args.duration
+    remaining = [args.requests]
+
+    def more():
+        if args.requests:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+        return time.perf_counter() < deadline
+
+    async def worker(client):
+        while more():
+            route = rng.choices(names, weights)[0]
+            try:
+                status, ttfb, latency = await one_request(client, route, request_body(rng, route))
+            except httpx.HTTPError:
+                samples[route]["errors"] += 1
+                continue
+            if status >= 400:
+                samples[route]["errors"] += 1
+                continue
+            samples[route]["ttfb"].append(ttfb)
+            samples[route]["latency"].append(latency)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - start
+
+    report = {"url": args.url, "concurrency": args.concurrency, "elapsed_s": elapsed, "routes": {}}
+    for name, s in samples.items():
+        done = len(s["latency"])
+        report["routes"][name] = {
+            "requests": done,
+            "errors": s["errors"],
+            "throughput_rps": done / elapsed,
+            **{f"latency_p{q}_s": percentile(s["latency"], q / 100) for q in (50, 95, 99)},
+            **{f"ttfb_p{q}_s": percentile(s["ttfb"], q / 100) for q in (50, 95, 99)},
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{report['url']}  concurrency {report['concurrency']}  {report['elapsed_s']:.1f}s")
+    print(f"{'route':<8}{'ok':>7}{'err':>6}{'rps':>8}"
+          f"{'lat p50':>9}{'p95':>8}{'p99':>8}{'ttfb p50':>10}{'p95':>8}{'p99':>8}")
+
+    def ms(value):
+        return f"{value * 1e3:.0f}" if value is not None else "-"
+
+    for name, r in report["routes"].items():
+        print(f"{name:<8}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>8.1f}"
+              f"{ms(r['latency_p50_s']):>9}{ms(r['latency_p95_s']):>8}{ms(r['latency_p99_s']):>8}"
+              f"{ms(r['ttfb_p50_s']):>10}{ms(r['ttfb_p95_s']):>8}{ms(r['ttfb_p99_s']):>8}")
+    print("(latencies in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests instead")
+    parser.add_argument("--mix", default="chat=1,stream=3,next=1", help="route weights")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
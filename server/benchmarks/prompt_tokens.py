@@ -0,0 +1,99 @@
+"""Compare verbose and compact prompt encodings of chart data.
+
+Builds a corpus of random birth charts, encodes each one with both
+encodings from prompt_format.py and reports input size (approximate tokens
+and characters) and formatting time:
+
+    python benchmarks/prompt_tokens.py --charts 200
+
+Token counts use tiktoken's cl100k_base encoding when it is installed and a
+regex approximation (words, numbers and punctuation, long words split into
+4-character pieces) otherwise; absolute numbers differ per model tokenizer,
+the verbose/compact ratio is what matters.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from combined import get_chart_details  # noqa: E402
+from prompt_format import ENCODINGS, format_chart  # noqa: E402
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def approx_tokens(text):
+    return sum(-(-len(piece) // 4) if piece.isalpha() else 1 for piece in TOKEN_PATTERN.findall(text))
+
+
+def token_counter():
+    try:
+        import tiktoken
+    except ImportError:
+        return "approx", approx_tokens
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return "cl100k_base", lambda text: len(encoding.encode(text))
+
+
+def sample_corpus(n, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        birth_utc = datetime(1950, 1, 1) + timedelta(minutes=rng.randrange(70 * 365 * 24 * 60))
+        lat, lon = rng.uniform(-50, 60), rng.uniform(-120, 150)
+        # Lazy chart builders log at debug level; keep benchmark output clean
+        with contextlib.redirect_stdout(io.StringIO()):
+            corpus.append(get_chart_details(birth_utc, lat, lon).to_dict())
+    return corpus
+
+
+def run(n, seed, charts_needed, repeat):
+    tokenizer_name, count_tokens = token_counter()
+    corpus = sample_corpus(n, seed)
+    results = {}
+    for encoding in ENCODINGS:
+        texts = [format_chart(chart, charts_needed, encoding) for chart in corpus]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for chart in corpus:
+                format_chart(chart, charts_needed, encoding)
+        elapsed = time.perf_counter() - start
+        tokens = [count_tokens(text) for text in texts]
+        results[encoding] = {
+            "tokens_mean": statistics.mean(tokens),
+            "tokens_max": max(tokens),
+            "chars_mean": statistics.mean(len(text) for text in texts),
+            "format_us": elapsed / (repeat * n) * 1e6,
+        }
+    return tokenizer_name, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=200, help="number of sample charts")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--vargas", default="d1,d9,d20,d7", help="charts included in each prompt")
+    parser.add_argument("--repeat", type=int, default=20, help="formatting passes over the corpus")
+    args = parser.parse_args()
+
+    charts_needed = [c.strip() for c in args.vargas.split(",") if c.strip()]
+    tokenizer_name, results = run(args.charts, args.seed, charts_needed, args.repeat)
+
+    print(f"{args.charts} charts, vargas {','.join(charts_needed)}, tokenizer {tokenizer_name}")
+    print(f"{'encoding':<10}{'tokens':>10}{'max':>8}{'chars':>10}{'format us':>12}")
+    for encoding, r in results.items():
+        print(f"{encoding:<10}{r['tokens_mean']:>10.1f}{r['tokens_max']:>8}{r['chars_mean']:>10.1f}{r['format_us']:>12.1f}")
+    saving = 1 - results["compact"]["tokens_mean"] / results["verbose"]["tokens_mean"]
+    print(f"compact saves {saving:.1%} of chart tokens")
+
+
+if __name__ == "__main__":
+    main()
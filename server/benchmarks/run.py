@@ -0,0 +1,269 @@
+"""Benchmark suite for the chart and chat pipeline.
+
+Times the hot paths and writes machine-readable JSON so runs can be compared:
+
+    python benchmarks/run.py --out bench.json
+    python benchmarks/run.py --baseline bench.json --threshold 0.25
+
+Benchmarks:
+    chart_single        get_chart_details + to_dict for one chart
+    chart_bulk          get_chart_details_batch for --bulk charts
+    chart_bulk_to_dict  to_dict over --bulk already computed batch charts
+    route_charts        chat.determine_required_charts over sample questions
+    format_verbose      chat.format_chart_for_llm, verbose encoding
+    format_compact      chat.format_chart_for_llm, compact encoding
+    http_chat           POST /chat through the Flask test client
+    http_chat_stream    POST /chat/stream, read to the end
+    legacy_astro_core   the D1/D9/D20 pipeline in the root astro_core.py
+    legacy_main         the root main.py script, executed top to bottom
+    legacy_d_nine       the root d-nine.py script
+    legacy_combined     the root legacy_combined.py script
+
+The HTTP benchmarks run against a StubProvider (--stub-ttft, --stub-tps)
+with the answer cache disabled, so they measure our overhead rather than the
+model's. Each birth is different, so the chart cache does not hide the chart
+work either, and the persistent chart store is disabled so runs stay cold and
+leave no cache/charts.sqlite3 behind. With --baseline, the run fails (exit code 1) when any
+benchmark's median is more than --threshold slower than in the baseline.
+Legacy scripts reconfigure swisseph globally, so they run last.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import runpy
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SERVER_DIR)
+sys.path.insert(0, SERVER_DIR)
+
+# Benchmark the in-process path with no answer cache, chart store or LLM warm-up
+os.environ.setdefault("CHART_WORKERS", "0")
+os.environ.setdefault("ANSWER_CACHE_PATH", "")
+os.environ.setdefault("CHART_STORE_PATH", "")
+os.environ.setdefault("LLM_WARMUP", "0")
+
+QUESTIONS = [
+    "How will my marriage be?",
+    "When will I have children?",
+    "What does my chart say about my career?",
+    "Will I grow spiritually this year?",
+    "Is my son going to do well in school?",
+    "Tell me about my health and meditation practice",
+]
+
+LEGACY_SCRIPTS = ("main.py", "d-nine.py", "legacy_combined.py")
+
+
+def random_births(n, seed):
+    rng = random.Random(seed)
+    births = []
+    for _ in range(n):
+        birth_utc = datetime(1950, 1, 1) + timedelta(minutes=rng.randrange(70 * 365 * 24 * 60))
+        births.append((birth_utc, rng.uniform(-50, 60), rng.uniform(-120, 150)))
+    return births
+
+
+def measure(fn, repeat, warmup=2):
+    """Per-call timings in seconds; `fn(i)` gets the iteration number."""
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples, items=1):
+    ordered = sorted(samples)
+    return {
+        "n": len(samples),
+        "items": items,
+        "mean_s": statistics.mean(samples),
+        "p50_s": statistics.median(samples),
+        "p95_s": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "min_s": ordered[0],
+        "items_per_s": items / statistics.median(samples),
+    }
+
+
+# ===== BENCHMARKS =====
+def bench_charts(args, births):
+    from combined import get_chart_details, get_chart_details_batch
+
+    results = {}
+    results["chart_single"] = summarize(measure(
+        lambda i: get_chart_details(*births[i % len(births)]).to_dict(), args.repeat))
+
+    bulk = births[:args.bulk]
+    utcs, lats, lons = zip(*bulk)
+    results["chart_bulk"] = summarize(measure(
+        lambda i: [chart.to_dict() for chart in get_chart_details_batch(list(utcs), list(lats), list(lons))],
+        max(3, args.repeat // 20)), items=len(bulk))
+
+    # Serialization alone, which runs per row after the vectorized batch math
+    charts = get_chart_details_batch(list(utcs), list(lats), list(lons))
+    results["chart_bulk_to_dict"] = summarize(measure(
+        lambda i: [chart.to_dict() for chart in charts], max(3, args.repeat // 20)), items=len(bulk))
+    return results
+
+
+def bench_prompt(args, births):
+    from chat import determine_required_charts, format_chart_for_llm
+    from combined import get_chart_details
+
+    results = {}
+    results["route_charts"] = summarize(measure(
+        lambda i: determine_required_charts(QUESTIONS[i % len(QUESTIONS)]), args.repeat * 10))
+
+    charts = [get_chart_details(*birth).to_dict() for birth in births[:50]]
+    needed = ["D1", "D9", "D20", "D7"]
+    for encoding in ("verbose", "compact"):
+        results[f"format_{encoding}"] = summarize(measure(
+            lambda i: format_chart_for_llm(charts[i % len(charts)], needed, encoding), args.repeat * 10))
+    return results
+
+
+def bench_http(args, births):
+    from llm_router import LLMRouter, StubProvider, set_router
+    set_router(LLMRouter([StubProvider("stub", ttft=args.stub_ttft, tokens_per_second=args.stub_tps)]))
+    with contextlib.redirect_stderr(io.StringIO()):
+        import main_server
+    client = main_server.app.test_client()
+
+    def body(i):
+        birth_utc, lat, lon = births[i % len(births)]
+        return {"dob": birth_utc.strftime("%Y-%m-%d"), "tob": birth_utc.strftime("%H:%M"),
+                "timezone": "UTC", "lat": lat, "lon": lon, "question": QUESTIONS[i % len(QUESTIONS)]}
+
+    def chat(i):
+        response = client.post("/chat", json=body(i))
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    def chat_stream(i):
+        response = client.post("/chat/stream", json=body(i + args.repeat))
+        assert response.get_data(as_text=True).endswith("[DONE]\n\n")
+
+    return {
+        "http_chat": summarize(measure(chat, args.repeat)),
+        "http_chat_stream": summarize(measure(chat_stream, args.repeat)),
+    }
+
+
+def bench_legacy(args, births):
+    sys.path.insert(0, REPO_DIR)
+    import astro_core
+
+    def astro_core_chart(i):
+        birth_utc, lat, lon = births[i % len(births)]
+        jd = astro_core.swe.julday(birth_utc.year, birth_utc.month, birth_utc.day,
+                                   birth_utc.hour + birth_utc.minute / 60)
+        lagna_deg, lagna_sign = astro_core.get_sidereal_lagna(jd, lat, lon)
+        positions = astro_core.get_planet_positions(jd)
+        for division in (None, astro_core.get_navamsa_sign, astro_core.get_vimsamsa_sign):
+            sign = division(lagna_deg) if division else lagna_sign
+            chart = astro_core.build_chart(sign, positions, division)
+            astro_core.get_house_lords(astro_core.build_house_signs(sign), chart)
+
+    results = {"legacy_astro_core": summarize(measure(astro_core_chart, args.repeat))}
+
+    def run_script(path):
+        with contextlib.redirect_stdout(io.StringIO()):
+            runpy.run_path(path, run_name="__bench__")
+
+    for script in LEGACY_SCRIPTS:
+        path = os.path.join(REPO_DIR, script)
+        name = "legacy_" + os.path.splitext(script)[0].replace("-", "_").removeprefix("legacy_")
+        results[name] = summarize(measure(lambda i: run_script(path), max(3, args.repeat // 10), warmup=1))
+    return results
+
+
+SUITES = {"charts": bench_charts, "prompt": bench_prompt, "http": bench_http, "legacy": bench_legacy}
+
+
+# ===== REPORTING =====
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Benchmarks whose median got slower than baseline * (1 + threshold)."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        ratio = result["p50_s"] / base["p50_s"]
+        if ratio > 1 + threshold:
+            regressions.append((name, base["p50_s"], result["p50_s"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suites", default=",".join(SUITES), help="comma-separated: " + ", ".join(SUITES))
+    parser.add_argument("--repeat", type=int, default=100, help="timed iterations per benchmark")
+    parser.add_argument("--bulk", type=int, default=1000, help="charts per chart_bulk batch")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--stub-ttft", type=float, default=0.0, help="stub LLM time to first token (s)")
+    parser.add_argument("--stub-tps", type=float, default=10000.0, help="stub LLM tokens per second")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    args = parser.parse_args()
+
+    births = random_births(max(args.bulk, args.repeat * 2 + 10), args.seed)
+    results = {}
+    for suite in [s.strip() for s in args.suites.split(",") if s.strip()]:
+        if suite not in SUITES:
+            parser.error(f"unknown suite: {suite}")
+        results.update(SUITES[suite](args, births))
+
+    import combined
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "ephemeris_mode": combined.EPHEMERIS_MODE,
+            "repeat": args.repeat,
+            "bulk": args.bulk,
+        },
+        "results": results,
+    }
+
+    print(f"{'benchmark':<24}{'p50 ms':>10}{'p95 ms':>10}{'items/s':>12}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['p50_s'] * 1e3:>10.3f}{r['p95_s'] * 1e3:>10.3f}{r['items_per_s']:>12.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, base, now, ratio in regressions:
+            print(f"REGRESSION {name}: {base * 1e3:.3f} ms -> {now * 1e3:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Cancelling blocking stream work from another thread.
+
+A generator blocked in next() on one thread cannot be closed from another
+(close() raises "generator already executing"), and a flag it checks between
+chunks is only seen once the next chunk arrives. The threaded stream layers
+(sse.StreamBuffer, single_flight's shared streams, the LLM router and its
+provider attempts) therefore run their pumps under a CancelToken. Code on
+that thread registers a callback with on_cancel() that wakes whatever it is
+blocked on (a condition, a queue, the provider's HTTP stream), and
+token.cancel() from any thread runs those callbacks at once:
+
+    token = CancelToken()
+    with bound(token):              # on the pump thread
+        for chunk in upstream:
+            ...
+    token.cancel()                  # from the thread that gave up
+
+The woken layer raises Cancelled, which unwinds the stream's generators on
+their own thread, closing them as it goes. The asyncio paths need none of
+this: they cancel the pumping task.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Cancelled(Exception):
+    """The stream was cancelled through its CancelToken."""
+
+
+class CancelToken:
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        self._event.set()
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Run callback when cancelled (now, if already); returns a function that unregisters it."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def sleep(self, seconds):
+        """time.sleep that raises Cancelled as soon as the token is cancelled."""
+        if self._event.wait(seconds):
+            raise Cancelled()
+
+
+_local = threading.local()
+
+
+def current():
+    """The token the calling thread's work runs under, or None."""
+    return getattr(_local, "token", None)
+
+
+@contextmanager
+def bound(token):
+    previous = current()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def on_cancel(callback):
+    """CancelToken.on_cancel on the current token; a no-op outside one."""
+    token = current()
+    return token.on_cancel(callback) if token is not None else (lambda: None)
+
+
+def sleep(seconds):
+    token = current()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
@@ -0,0 +1,117 @@
+"""Process-pool chart execution engine.
+
+swisseph calculations are not safe to run concurrently, so inside one
+process they are serialised by ``combined._swe_lock``. The engine instead owns
+a pool of worker processes: each worker configures swisseph once in its
+initializer and then takes chart jobs off the pool's call queue on that same
+thread (swisseph's ephemeris path and sidereal mode are per-thread state). A
+worker runs one job at a time, so the ayanamsha a job asks for cannot leak
+into a concurrent job.
+
+With ``CHART_WORKERS=0`` charts are computed in the calling process, with the
+swisseph stage serialised by ``combined._swe_lock``. The same in-process path
+serves charts while a freshly started pool is still spawning its workers, so
+a cold instance answers its first /charts request without waiting for them.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import combined
+
+
+# ===== WORKER SIDE =====
+def _init_worker(ephemeris_mode, ayanamsha):
+    combined.set_ephemeris_mode(ephemeris_mode)
+    if ephemeris_mode == "swisseph":
+        combined.configure_ephemeris(ayanamsha)
+    else:
+        import ephemeris_table
+        ephemeris_table.get_table()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_chart(birth_utc, lat, lon, ayanamsha):
+    return combined.get_chart_details(birth_utc, lat, lon, ayanamsha)
+
+
+def _run_batch(birth_utcs, lats, lons, ayanamsha):
+    return combined.get_chart_details_batch(birth_utcs, lats, lons, ayanamsha)
+
+
+# ===== ENGINE =====
+class ChartEngine:
+    def __init__(self, workers=None, start_method=None):
+        if workers is None:
+            workers = int(os.getenv("CHART_WORKERS", os.cpu_count() or 1))
+        self.workers = workers
+        self.start_method = start_method or os.getenv("CHART_ENGINE_START_METHOD", "spawn")
+        self._executor = None
+        self._warmup = []
+
+    def start(self):
+        if self.workers > 0 and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(combined.EPHEMERIS_MODE, combined.AYANAMSHA),
+            )
+            # One no-op job per worker spawns the whole pool in the background
+            self._warmup = [self._executor.submit(_ping) for _ in range(self.workers)]
+        return self
+
+    @property
+    def ready(self):
+        """True once every worker process has started and run its initializer."""
+        return self._executor is not None and all(future.done() for future in self._warmup)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, birth_utc, lat, lon, ayanamsha=combined.AYANAMSHA):
+        """Queue one chart job and return a Future for its result."""
+        if self._executor is None:
+            raise RuntimeError("ChartEngine is not running (workers=0 or not started)")
+        return self._executor.submit(_run_chart, birth_utc, lat, lon, ayanamsha)
+
+    def compute(self, birth_utc, lat, lon, ayanamsha=combined.AYANAMSHA):
+        if not self.ready:
+            return _run_chart(birth_utc, lat, lon, ayanamsha)
+        return self.submit(birth_utc, lat, lon, ayanamsha).result()
+
+    def compute_batch(self, birth_utcs, lats, lons, ayanamsha=combined.AYANAMSHA):
+        """Split a batch into one chunk per worker and run the chunks in parallel."""
+        if not self.ready or len(birth_utcs) < 2:
+            return _run_batch(birth_utcs, lats, lons, ayanamsha)
+
+        chunk = -(-len(birth_utcs) // self.workers)
+        futures = [
+            self._executor.submit(_run_batch, birth_utcs[i:i + chunk], lats[i:i + chunk],
+                                  lons[i:i + chunk], ayanamsha)
+            for i in range(0, len(birth_utcs), chunk)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Process-wide engine, started on first use and plugged into the chart cache."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ChartEngine().start()
+            combined.set_chart_executor(_engine.compute)
+    return _engine
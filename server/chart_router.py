@@ -0,0 +1,116 @@
+"""Single-pass keyword router that decides which divisional charts a question needs.
+
+The chart -> keywords registry lives in chart_keywords.json (override with
+CHART_KEYWORDS_PATH). At import the keywords are compiled into one
+Aho-Corasick automaton, so classifying a question is a single scan over its
+text no matter how many keywords or vargas are registered. Adding a varga is
+a registry edit, not a code change.
+
+Matching honours the registry's "boundary" setting:
+    "none"  - plain substring match (the original behaviour)
+    "start" - keyword must start at a word boundary ("son" no longer matches
+              "person", but "marriage" still matches "marriages")
+    "word"  - keyword must be a whole word or phrase
+"""
+import json
+import os
+from collections import deque
+
+DEFAULT_REGISTRY = os.getenv(
+    "CHART_KEYWORDS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chart_keywords.json"))
+
+BOUNDARIES = ("none", "start", "word")
+
+
+class ChartRouter:
+    def __init__(self, registry):
+        self.boundary = registry.get("boundary", "start")
+        if self.boundary not in BOUNDARIES:
+            raise ValueError(f"Unsupported boundary mode: {self.boundary}")
+        self.always = list(registry.get("always", []))
+        self.charts = list(registry["charts"])
+        self.topics = {chart: spec.get("topic", chart.lower()) for chart, spec in registry["charts"].items()}
+
+        # ===== BUILD AUTOMATON =====
+        # goto[node] maps a character to the next node; out[node] holds
+        # (keyword length, chart index) for every keyword ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for chart_index, spec in enumerate(registry["charts"].values()):
+            for keyword in spec["keywords"]:
+                self._add(" ".join(keyword.lower().split()), chart_index)
+        self._link()
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_REGISTRY):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _add(self, keyword, chart_index):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(keyword), chart_index))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    # ===== MATCHING =====
+    def match(self, text):
+        """Indices of the charts whose keywords occur in `text`, in one pass."""
+        text = " ".join(text.lower().split())
+        found = set()
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for end, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, chart_index in out[node]:
+                if chart_index in found or not self._at_boundary(text, end - length + 1, end):
+                    continue
+                found.add(chart_index)
+                if len(found) == len(self.charts):
+                    return found
+        return found
+
+    def _at_boundary(self, text, start, end):
+        if self.boundary == "none":
+            return True
+        if start > 0 and text[start - 1].isalnum():
+            return False
+        if self.boundary == "word" and end + 1 < len(text) and text[end + 1].isalnum():
+            return False
+        return True
+
+    def route(self, question):
+        """Charts needed for a question, e.g. ['D1', 'D9'], in registry order."""
+        found = self.match(question)
+        return self.always + [chart for i, chart in enumerate(self.charts) if i in found]
+
+    def topic(self, question):
+        """Topic name of the charts a question routes to, e.g. 'marriage' or 'general'."""
+        found = self.match(question)
+        names = [self.topics[chart] for i, chart in enumerate(self.charts) if i in found]
+        return "+".join(names) if names else "general"
+
+
+# Built once at import and shared by chat.py and langchain_pipeline.py
+router = ChartRouter.from_file()
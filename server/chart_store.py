@@ -0,0 +1,202 @@
+"""Persistent store of computed charts.
+
+The in-memory chart cache starts empty with every worker and every restart,
+so registered users' charts were recomputed on each new session. The store
+keeps each chart's packed bytes (Chart.to_bytes(), 83 bytes) in a SQLite
+file, keyed by its birth fingerprint, and maps user ids to the fingerprint of
+their current birth details:
+
+    charts   fingerprint -> packed chart
+    users    user_id -> fingerprint
+
+get_chart_details_cached looks here after the in-memory cache and before
+computing, and writes what it computes back, linking the request's user_id
+when it has one. A user whose birth details change gets a new fingerprint, so
+the stale chart is never served; the users row simply moves to the new one.
+Fingerprints include the ephemeris mode, so swisseph and table charts are
+kept apart. precompute.py backfills the store in bulk.
+
+The file is opened in WAL mode, so readers never block on a writer, and every
+write is one transaction that waits up to ``CHART_STORE_TIMEOUT`` seconds for
+the write lock; any number of server workers, threads and backfills can share
+one file. Set ``CHART_STORE_PATH`` to an empty string to disable the store.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+DEFAULT_PATH = os.getenv("CHART_STORE_PATH", "cache/charts.sqlite3")
+DEFAULT_TIMEOUT = float(os.getenv("CHART_STORE_TIMEOUT", "30"))
+# Bound parameters per query when checking many fingerprints at once
+LOOKUP_CHUNK = 500
+# User links remembered per process, so repeat requests skip the database
+KNOWN_LINKS = int(os.getenv("CHART_STORE_KNOWN_LINKS", "10000"))
+
+CHART_STORE_REQUESTS = Counter(
+    "astrobot_chart_store_requests", "Chart store lookups by result.", ("result",))
+
+
+# Part of every key; bumped when stored charts must stop being served. 2:
+# charts computed off the first configured thread were in the wrong ayanamsha
+KEY_VERSION = 2
+
+
+def store_key(fingerprint):
+    """A combined.chart_fingerprint tuple as the store's text key."""
+    ephemeris_mode, jd, lat, lon, ayanamsha = fingerprint
+    return f"v{KEY_VERSION}:{ephemeris_mode}:{jd:.6f}:{lat:.6f}:{lon:.6f}:{ayanamsha}"
+
+
+class ChartStore:
+    def __init__(self, path=DEFAULT_PATH, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._links = OrderedDict()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        # A connection must not cross a fork, so a forked worker opens its own
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                                         isolation_level=None)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS charts ("
+                " fingerprint TEXT PRIMARY KEY, chart BLOB NOT NULL, created REAL NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                " user_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, updated REAL NOT NULL)")
+        return self._conn
+
+    def _write(self, conn, statements):
+        # BEGIN IMMEDIATE takes the write lock up front (waiting out other
+        # writers), so a batch lands whole or not at all
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in statements:
+                conn.executemany(sql, rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    _PUT_CHART = "INSERT OR REPLACE INTO charts VALUES (?, ?, ?)"
+    # Rewrites a users row only when the user's fingerprint changed
+    _LINK_USER = ("INSERT INTO users VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE"
+                  " SET fingerprint = excluded.fingerprint, updated = excluded.updated"
+                  " WHERE users.fingerprint != excluded.fingerprint")
+
+    def get(self, fingerprint, user_id=None):
+        """Packed chart for a fingerprint, or None; links user_id to it on a hit."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT c.chart, u.fingerprint FROM charts c LEFT JOIN users u ON u.user_id = ?"
+                " WHERE c.fingerprint = ?", (str(user_id), fingerprint)).fetchone()
+            # Reads take no write lock unless the user is new or their birth changed
+            if row is not None and user_id is not None:
+                if row[1] != fingerprint:
+                    conn.execute(self._LINK_USER, (str(user_id), fingerprint, time.time()))
+                self._remember([(user_id, fingerprint)])
+        CHART_STORE_REQUESTS.inc(result="hit" if row else "miss")
+        return row[0] if row else None
+
+    def get_user(self, user_id):
+        """(fingerprint, packed chart) last stored for a user, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._connect().execute(
+                "SELECT u.fingerprint, c.chart FROM users u JOIN charts c USING (fingerprint)"
+                " WHERE u.user_id = ?", (str(user_id),)).fetchone()
+
+    def put(self, fingerprint, chart, user_id=None):
+        self.put_many([(fingerprint, chart, user_id)])
+
+    def put_many(self, rows):
+        """Store (fingerprint, packed chart, user_id or None) rows in one transaction."""
+        if not self.enabled or not rows:
+            return
+        now = time.time()
+        charts = [(fingerprint, chart, now) for fingerprint, chart, _ in rows]
+        users = [(str(user_id), fingerprint, now) for fingerprint, _, user_id in rows if user_id is not None]
+        with self._lock:
+            self._write(self._connect(), [(self._PUT_CHART, charts), (self._LINK_USER, users)])
+            self._remember([(user_id, fingerprint) for fingerprint, _, user_id in rows if user_id is not None])
+
+    def link(self, user_id, fingerprint):
+        """Link a user to a stored chart unless this process already has."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._links.get(str(user_id)) == fingerprint:
+                self._links.move_to_end(str(user_id))
+                return
+        self.link_users([(user_id, fingerprint)])
+
+    def link_users(self, links):
+        """Point (user_id, fingerprint) pairs at charts that are already stored."""
+        if not self.enabled or not links:
+            return
+        now = time.time()
+        with self._lock:
+            self._write(self._connect(), [(self._LINK_USER, [(str(u), f, now) for u, f in links])])
+            self._remember(links)
+
+    def _remember(self, links):
+        for user_id, fingerprint in links:
+            self._links[str(user_id)] = fingerprint
+            self._links.move_to_end(str(user_id))
+        while len(self._links) > KNOWN_LINKS:
+            self._links.popitem(last=False)
+
+    def missing(self, fingerprints):
+        """The fingerprints that have no stored chart."""
+        fingerprints = list(dict.fromkeys(fingerprints))
+        if not self.enabled:
+            return set(fingerprints)
+        found = set()
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(fingerprints), LOOKUP_CHUNK):
+                chunk = fingerprints[i:i + LOOKUP_CHUNK]
+                found.update(row[0] for row in conn.execute(
+                    f"SELECT fingerprint FROM charts WHERE fingerprint IN ({','.join('?' * len(chunk))})", chunk))
+        return set(fingerprints) - found
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connect()
+            self._write(conn, [("DELETE FROM users", [()]), ("DELETE FROM charts", [()])])
+            self._links.clear()
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            conn = self._connect()
+            charts = conn.execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+            users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        return {"enabled": True, "charts": charts, "users": users}
+
+
+chart_store = ChartStore()
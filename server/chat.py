@@ -1,136 +1,63 @@
-import google.generativeai as genai
-from combined import get_chart_details
+from admission import Overloaded, admission
+from answer_cache import answer_cache, answer_key, replay_chunks
+from chart_router import router
+from combined import get_chart_details_cached
 from dotenv import load_dotenv
-import os
+from llm_router import get_router
+from metrics import LLM_FIRST_TOKEN_SECONDS, LLM_GENERATION_SECONDS, stage
+from prompt_format import format_chart
+from single_flight import AsyncSingleFlight, SingleFlight
+from suggestions import suggestion_service
+import asyncio
+import logging
+import re
+import time
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))  # OR load from os.environ
-
-model = genai.GenerativeModel("gemini-2.5-flash")
+logger = logging.getLogger(__name__)
 
 # Determine which divisional charts are needed
 def determine_required_charts(user_question: str):
-    question = user_question.lower()
-    charts = ['D1']  # Always include D1
-
-    # D7 - Saptamsa Chart - Children
-    d7_keywords = [
-        # Correct terms
-        "children", "child", "offspring", "progeny", "kids", "parenting", "parenthood",
-        "birth", "pregnancy", "fertility", "procreation", "family", "lineage", "descendants",
-        "son", "daughter", "childbirth", "nurturing", "raising children", "parental",
-        # Misspellings  
-        "childen", "offsprings", "progeny", "kid", "paranting", "parenthod", "fertillity",
-        "procreatoin", "familly", "lineagee", "descendents", "sonn", "daugter", "childbrith",
-        "nurturingg", "raisingg children", "parental"
-        # Indian usage
-        "saptamsa", "saptamsha", "putra", "putri", "santaan", "santan", "santati", "santati chart",
-        "putra karaka", "putra bhava", "saptamsa chart","d7"
-
-    ]
-
-    # D9 - Marriage, Relationships
-    d9_keywords = [
-        # Correct terms
-        "marriage", "partner", "relationship", "spouse", "husband", "wife", "love", "romantic",
-        "wedding", "marital", "conjugal", "matchmaking", "compatibility",
-        "boyfriend", "girlfriend", "affair", "commitment", "dating",
-        # Misspellings
-        "marraige", "mariage", "relashionship", "relatnship", "spouce", "husbund", "wief", 
-        "romence", "romatic", "compability", "compatiblity", "mathcmaking",
-        "boyfreind", "girfreind", "gurlfriend", "bf", "gf", "dateing",
-        # Indian usage
-        "shaadi", "vivah", "rishta", "kundli match", "kundli milan", "lagan", "mangal dosha","d9"
-    ]
-
-    # D20 - Spiritual Growth
-    d20_keywords = [
-        # Correct terms
-        "spiritual", "moksha", "liberation", "enlightenment", "soul", "atma", "inner peace",
-        "spirituality", "transcendence", "sadhana", "meditation", "karma", "bhakti", "jnana",
-        "dhyana", "ascetic", "monk", "yogi", "yogini", "kundalini", "awakening", "samadhi",
-        "inner self", "soul path", "purpose of life", "inner journey", "detachment",
-        # Misspellings and typos
-        "spritiual", "spritiul", "moksh", "liberasion", "liberration", "entlightenment",
-        "medatation", "mediation", "mediatation", "spiritulity", "transendance", "sadhna",
-        "karma yoga", "dian", "samadi", "enlightnment", "soull", "bhakthi", "gnana",
-        # Slang or common modern phrasing
-        "soul searching", "finding myself", "purpose", "life path", "destiny", "divine","d20"
-    ]
-
-    # Check for keywords in the question
-    if any(keyword in question for keyword in d7_keywords):
-        charts.append('D7')
-    if any(keyword in question for keyword in d9_keywords):
-        charts.append('D9')
-    if any(keyword in question for keyword in d20_keywords):
-        charts.append('D20')
-
-    print(f"seelected charts: {charts}")
-
+    # Keyword registry and single-pass matcher live in chart_router.py
+    charts = router.route(user_question)
+    logger.debug("Selected charts: %s", charts)
     return charts
 
 
 # Format the chart data for Gemini input
-def format_chart_for_llm(chart_data: dict, charts_needed: list):
-    def format_chart(chart_name: str, chart: dict):
-        lines = [f"**{chart_name} Chart**"]
-        asc = chart.get("ascendant", "Unknown")
-        lines.append(f"Ascendant: {asc}")
-        lines.append("House Positions:")
-        for house, planets in chart.get("chart", {}).items():
-            planet_list = ', '.join(planets) if planets else 'None'
-            lines.append(f"  House {house}: {planet_list}")
-        lines.append("House Lords:")
-        for house, details in chart.get("lords", {}).items():
-            lines.append(
-                f"  House {house}: Lord is {details['lord']} placed in House {details['lord_house']} ({details['sign']})"
-            )
-        return "\n".join(lines)
-
-    def format_planetary_data(planets: dict):
-        lines = ["**Planetary Positions (D1)**"]
-        for planet, info in planets.items():
-            lines.append(
-                f"  {planet}: {info['sign']} {round(info['degree'], 2)}°, "
-                f"Nakshatra: {info['nakshatra']} Pada {info['pada']}"
-            )
-        return "\n".join(lines)
-
-    sections = []
-
-    # Always add planetary data from D1
-    if 'planets' in chart_data:
-        sections.append(format_planetary_data(chart_data["planets"]))
-
-    for chart_key in charts_needed:
-        chart_upper = chart_key.upper()
-        if chart_key.lower() in chart_data:
-            chart = chart_data[chart_key.lower()]
-            sections.append(format_chart(chart_upper, chart))
-
-    return "\n\n".join(sections)
+def format_chart_for_llm(chart_data: dict, charts_needed: list, encoding: str = None):
+    # Verbose and compact encodings live in prompt_format.py (PROMPT_ENCODING picks the default)
+    return format_chart(chart_data, charts_needed, encoding)
 
-# Main logic
-def analyze_user_question(dob, tob, timezone, lat, lon, question):
-    # Step 1: Get UTC datetime
+def get_birth_utc(dob, tob, timezone):
     from datetime import datetime
     import pytz
 
-    dt_local = datetime.strptime(f"{dob} {tob}", "%Y-%m-%d %H:%M")
-    local_tz = pytz.timezone(timezone)
-    dt_localized = local_tz.localize(dt_local)
-    birth_utc = dt_localized.astimezone(pytz.utc)
+    with stage("localize"):
+        dt_local = datetime.strptime(f"{dob} {tob}", "%Y-%m-%d %H:%M")
+        local_tz = pytz.timezone(timezone)
+        dt_localized = local_tz.localize(dt_local)
+        return dt_localized.astimezone(pytz.utc)
+
+def build_prompt(dob, tob, timezone, lat, lon, question, user_id=None):
+    # Step 1: Get UTC datetime
+    birth_utc = get_birth_utc(dob, tob, timezone)
+
+    # Step 2: Determine which charts to use
+    with stage("route_charts"):
+        charts_needed = determine_required_charts(question)
 
-    # Step 2: Get chart data
-    full_chart_data = get_chart_details(birth_utc, lat, lon)
+    # Step 3: Get chart data, building only the charts sent to the model
+    full_chart_data = get_chart_details_cached(
+        birth_utc, lat, lon, charts=[chart.lower() for chart in charts_needed], user_id=user_id)
 
-    # Step 3: Determine which charts to use
-    charts_needed = determine_required_charts(question)
+    return render_prompt(full_chart_data, charts_needed, dob, tob, timezone, lat, lon, question)
 
+def render_prompt(chart_data, charts_needed, dob, tob, timezone, lat, lon, question):
+    """The prompt and answer-cache key for a computed chart (reports.py brings its own charts)."""
     # Step 4: Format chart data
-    chart_text = format_chart_for_llm(full_chart_data, charts_needed)
+    with stage("format_prompt"):
+        chart_text = format_chart_for_llm(chart_data, charts_needed)
 
     # Step 5: Generate prompt
     prompt = f"""You are a learned Vedic astrologer. A user has provided their birth chart data.
@@ -148,77 +75,152 @@ Chart Data:
 
 Please answer clearly and concisely in astrological terms. contemplate and answer.
 """
+    # The answer depends only on the chart text, the charts and the question
+    return prompt, answer_key(chart_text, charts_needed, question)
+
+def stream_llm(prompt, endpoint):
+    """Stream LLM chunks for a prompt, recording time to first token and total time."""
+    # The router picks the fastest healthy provider and hedges slow ones (llm_router.py);
+    # admission.py queues the call by endpoint priority while the provider is at its budget
+    chunks = admission.stream(endpoint, prompt, get_router().stream)
+    start = time.perf_counter()
+    first_token = True
+    for chunk in chunks:
+        if first_token:
+            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            first_token = False
+        yield chunk
+    LLM_GENERATION_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+async def stream_llm_async(prompt, endpoint):
+    """Async counterpart of stream_llm using the providers' async streaming APIs."""
+    chunks = admission.astream(endpoint, prompt, get_router().astream)
+    start = time.perf_counter()
+    first_token = True
+    async for chunk in chunks:
+        if first_token:
+            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            first_token = False
+        yield chunk
+    LLM_GENERATION_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+# Identical questions about the same chart in flight at once (double submits,
+# client retries) share one generation; followers replay it from the start.
+answer_flights = SingleFlight("answer")
+answer_flights_async = AsyncSingleFlight("answer")
+
+def cached_stream(prompt, key, endpoint):
+    """Replay a cached answer, or stream from Gemini and cache the completed answer."""
+    cached = answer_cache.get(key)
+    if cached is not None:
+        yield from replay_chunks(cached)
+        return
+    yield from answer_flights.stream(key, lambda: generate_and_cache(prompt, key, endpoint))
+
+def generate_and_cache(prompt, key, endpoint):
+    chunks = []
+    for chunk in stream_llm(prompt, endpoint):
+        chunks.append(chunk)
+        yield chunk
+    # Only reached when the stream ran to completion
+    answer_cache.put(key, "".join(chunks))
 
-    # Step 6: Call Gemini with streaming
-    # print("prompt to gemini-->",prompt)
-    response = model.generate_content(prompt, stream=True)
-    
-    # Collect all chunks and return the complete response
-    full_response = ""
-    for chunk in response:
-        if chunk.text:
-            full_response += chunk.text
-    
-    return full_response
-
-# Streaming version of the analyze function
-def analyze_user_question_stream(dob, tob, timezone, lat, lon, question):
-    # Step 1: Get UTC datetime
-    from datetime import datetime
-    import pytz
-
-    dt_local = datetime.strptime(f"{dob} {tob}", "%Y-%m-%d %H:%M")
-    local_tz = pytz.timezone(timezone)
-    dt_localized = local_tz.localize(dt_local)
-    birth_utc = dt_localized.astimezone(pytz.utc)
-
-    # Step 2: Get chart data
-    full_chart_data = get_chart_details(birth_utc, lat, lon)
-
-    # Step 3: Determine which charts to use
-    charts_needed = determine_required_charts(question)
-
-    # Step 4: Format chart data
-    chart_text = format_chart_for_llm(full_chart_data, charts_needed)
+# Main logic
+def analyze_user_question(dob, tob, timezone, lat, lon, question, user_id=None):
+    prompt, key = build_prompt(dob, tob, timezone, lat, lon, question, user_id)
 
-    # Step 5: Generate prompt
-    prompt = f"""You are a learned Vedic astrologer. A user has provided their birth chart data.
-Use the data below to answer their question.
+    # Step 6: Call Gemini with streaming and collect the complete response
+    return "".join(cached_stream(prompt, key, "chat"))
 
-User Question:
-"{question}"
+# Streaming version of the analyze function
+def analyze_user_question_stream(dob, tob, timezone, lat, lon, question, user_id=None):
+    prompt, key = build_prompt(dob, tob, timezone, lat, lon, question, user_id)
 
-Date of Birth: {dob}
-Time of Birth: {tob}
-Location: lat={lat}, lon={lon}, Timezone={timezone}
+    # Step 6: Call Gemini with streaming and yield each chunk as it arrives
+    yield from cached_stream(prompt, key, "chat_stream")
 
-Chart Data:
-{chart_text}
+NEXT_QUESTIONS_PROMPT = "Based on the question given to a vedic astrology chatbot suggest additional questions(user could ask so they dont have to type it out).Additional questions can be followups,etc. Question: '{question}'. Suggest 4 questions and one from different category so user has a little variety.RESPONSE SHOULD BE A STRING WITH QUESTIONS SEPARATED BY NEWLINE(\n)"
 
-Please answer clearly and concisely in astrological terms. contemplate and answer.
-"""
+# Leading list markers the model sometimes adds: "1.", "2)", "-", "*", "•"
+LIST_MARKER = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s*")
 
-    # Step 6: Call Gemini with streaming
-    response = model.generate_content(prompt, stream=True)
-    
-    # Yield each chunk as it arrives
-    for chunk in response:
-        if chunk.text:
-            yield chunk.text
+def parse_questions(text):
+    # Parse the response to extract questions (assuming response is a string with questions separated by newlines)
+    logger.debug("Next questions: %s", text)
+    questions = (LIST_MARKER.sub("", line).strip() for line in text.splitlines())
+    return [q for q in questions if q]
 
 def generate_next_questions(current_question):
+    """
+    Suggest follow-up questions, going to the LLM only when no cached
+    suggestions exist for the question's topic.
+    """
+    return suggestion_service.suggest(current_question, llm_next_questions)
+
+def llm_next_questions(current_question):
     """
     Calls the LLM to generate the next set of relevant questions.
     """
     try:
-        # Simulate LLM call using Google Generative AI
-        prompt = f"Based on the question given to a vedic astrology chatbot suggest additional questions(user could ask so they dont have to type it out).Additional questions can be followups,etc. Question: '{current_question}'. Suggest 4 questions and one from different category so user has a little variety.RESPONSE SHOULD BE A STRING WITH QUESTIONS SEPARATED BY NEWLINE(\n)"
-        response = model.generate_content(prompt)
-        print(response.text)
-        # Parse the response to extract questions (assuming response is a string with questions separated by newlines)
-        questions = response.text.split("\n")
-        return [q.strip() for q in questions if q.strip()]
+        prompt = NEXT_QUESTIONS_PROMPT.format(question=current_question)
+        start = time.perf_counter()
+        text = "".join(admission.stream("next_questions", prompt, get_router().stream))
+        LLM_GENERATION_SECONDS.observe(time.perf_counter() - start, endpoint="next_questions")
+        return parse_questions(text)
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.warning("Error generating next questions: %s", e)
+        return []
 
+
+# ===== ASYNC VARIANTS (asgi_server.py) =====
+# Chart work is CPU-bound and may block on the chart engine, so the prompt is
+# built in the default executor to keep the event loop free.
+async def build_prompt_async(dob, tob, timezone, lat, lon, question, user_id=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, build_prompt, dob, tob, timezone, lat, lon, question, user_id)
+
+async def cached_stream_async(prompt, key, endpoint):
+    # Answer cache lookups are single-row SQLite queries, cheap enough to run inline
+    cached = answer_cache.get(key)
+    if cached is not None:
+        for chunk in replay_chunks(cached):
+            yield chunk
+        return
+    async for chunk in answer_flights_async.stream(key, lambda: generate_and_cache_async(prompt, key, endpoint)):
+        yield chunk
+
+async def generate_and_cache_async(prompt, key, endpoint):
+    chunks = []
+    async for chunk in stream_llm_async(prompt, endpoint):
+        chunks.append(chunk)
+        yield chunk
+    answer_cache.put(key, "".join(chunks))
+
+async def analyze_user_question_async(dob, tob, timezone, lat, lon, question, user_id=None):
+    prompt, key = await build_prompt_async(dob, tob, timezone, lat, lon, question, user_id)
+    return "".join([chunk async for chunk in cached_stream_async(prompt, key, "chat")])
+
+async def analyze_user_question_stream_async(dob, tob, timezone, lat, lon, question, user_id=None):
+    prompt, key = await build_prompt_async(dob, tob, timezone, lat, lon, question, user_id)
+    async for chunk in cached_stream_async(prompt, key, "chat_stream"):
+        yield chunk
+
+async def generate_next_questions_async(current_question):
+    return await suggestion_service.suggest_async(current_question, llm_next_questions_async)
+
+async def llm_next_questions_async(current_question):
+    try:
+        prompt = NEXT_QUESTIONS_PROMPT.format(question=current_question)
+        start = time.perf_counter()
+        text = "".join([chunk async for chunk in admission.astream("next_questions", prompt, get_router().astream)])
+        LLM_GENERATION_SECONDS.observe(time.perf_counter() - start, endpoint="next_questions")
+        return parse_questions(text)
+
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"Error generating next questions: {e}")
+        logger.warning("Error generating next questions: %s", e)
         return []
@@ -1,9 +1,51 @@
 import swisseph as swe
-from datetime import datetime
+import numpy as np
+import os
+import struct
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+import logging
+import sqlite3
+import ephemeris_table
+from chart_store import chart_store, store_key
+from metrics import Gauge, stage
+from single_flight import SingleFlight
+from varga import VARGA_NAMES, compute_vargas
+
+logger = logging.getLogger(__name__)
 
 # ===== CONFIGURATION =====
-swe.set_ephe_path('./ephe')
-swe.set_sid_mode(swe.SIDM_LAHIRI)
+AYANAMSHA = swe.SIDM_LAHIRI
+
+# swisseph keeps the ephemeris path and sidereal mode in per-thread C state:
+# a thread that never configured it calculates with the default (Fagan/Bradley)
+# ayanamsha. Every calculating thread therefore configures it lazily before its
+# first calculation, and again when a job asks for a different ayanamsha;
+# _swe_state.ayanamsha is the mode the calling thread is set to. _swe_lock
+# serialises the calculations, which are not safe to run concurrently.
+_swe_lock = threading.RLock()
+_swe_state = threading.local()
+
+
+def configure_ephemeris(ayanamsha=AYANAMSHA):
+    with _swe_lock:
+        if getattr(_swe_state, "ayanamsha", None) != ayanamsha:
+            swe.set_ephe_path('./ephe')
+            swe.set_sid_mode(ayanamsha)
+            _swe_state.ayanamsha = ayanamsha
+
+
+# "swisseph" calls the Swiss Ephemeris per chart; "table" serves positions
+# from the precomputed, memory-mapped table in ephemeris_table.py
+EPHEMERIS_MODE = os.getenv("EPHEMERIS_MODE", "swisseph")
+
+
+def set_ephemeris_mode(mode):
+    global EPHEMERIS_MODE
+    if mode not in ("swisseph", "table"):
+        raise ValueError(f"Unsupported ephemeris mode: {mode}")
+    EPHEMERIS_MODE = mode
 
 # ===== CONSTANTS =====
 ZODIAC_SIGNS = [
@@ -27,19 +69,41 @@ PLANETS = {
     'Rahu': swe.MEAN_NODE, 'Ketu': swe.MEAN_NODE
 }
 
-# ===== INPUTS =====
-birth_utc = datetime(2003, 9, 19, 22, 7)  # UTC time
-latitude = 19.3919
-longitude = 72.8397
-location_name = "Vasai"
+PLANET_NAMES = list(PLANETS)
 
-# ===== JULIAN DAY and LOCATION =====
-jd = swe.julday(birth_utc.year, birth_utc.month, birth_utc.day,
-                birth_utc.hour + birth_utc.minute / 60)
-swe.set_topo(longitude, latitude, 0)
+# Divisional charts returned by get_chart_details, in response order
+CHART_DIVISIONS = {"d1": 1, "d9": 9, "d20": 20, "d7": 7}
+assert PLANET_NAMES == ephemeris_table.PLANET_ORDER
+
+# ===== HOUSE LORDS TABLE =====
+HOUSE_LORDS = {
+    0: 'Mars', 1: 'Venus', 2: 'Mercury', 3: 'Moon',
+    4: 'Sun', 5: 'Mercury', 6: 'Venus', 7: 'Mars',
+    8: 'Jupiter', 9: 'Saturn', 10: 'Saturn', 11: 'Jupiter'
+}
+
+# Column of each sign's lord in PLANET_NAMES, for array lookups
+LORD_INDEX = np.array([PLANET_NAMES.index(HOUSE_LORDS[s]) for s in range(12)])
+
+# (sign, lord) of houses 1-12 for each lagna sign, for building lord tables
+HOUSE_SIGN_LORDS = [[(ZODIAC_SIGNS[(lagna + i) % 12], HOUSE_LORDS[(lagna + i) % 12]) for i in range(12)]
+                    for lagna in range(12)]
+
+NAKSHATRA_SPAN = 360 / 27
+PADA_SPAN = NAKSHATRA_SPAN / 4
 
 # ===== COMMON FUNCTIONS =====
+def julian_day(birth_utc):
+    if EPHEMERIS_MODE == "table":
+        return ephemeris_table.julday(birth_utc.year, birth_utc.month, birth_utc.day,
+                                      birth_utc.hour + birth_utc.minute / 60)
+    return swe.julday(birth_utc.year, birth_utc.month, birth_utc.day,
+                      birth_utc.hour + birth_utc.minute / 60)
+
 def get_sidereal_lagna(jd, lat, lon):
+    if EPHEMERIS_MODE == "table":
+        sidereal_lagna_deg = float(ephemeris_table.get_table().sidereal_lagna([jd], [lat], [lon])[0])
+        return sidereal_lagna_deg, int(sidereal_lagna_deg // 30)
     cusps, ascmc = swe.houses_ex(jd, lat, lon, b'W')
     tropical_lagna_deg = ascmc[0] % 360
     ayanamsha = swe.get_ayanamsa(jd)
@@ -48,6 +112,9 @@ def get_sidereal_lagna(jd, lat, lon):
     return sidereal_lagna_deg, lagna_sign_num
 
 def get_planet_positions(jd):
+    if EPHEMERIS_MODE == "table":
+        longitudes = ephemeris_table.get_table().longitudes([jd])[0]
+        return dict(zip(PLANET_NAMES, longitudes.tolist()))
     positions = {}
     for name, code in PLANETS.items():
         pos, _ = swe.calc_ut(jd, code, swe.FLG_SIDEREAL)
@@ -58,192 +125,506 @@ def get_planet_positions(jd):
     return positions
 
 def get_nakshatra(lon):
-    nak_len = 360 / 27
-    index = int(lon // nak_len)
-    deg_in_nak = lon % nak_len
-    pada = int(deg_in_nak // (nak_len / 4)) + 1  # Padas 1 to 4
+    index = int(lon // NAKSHATRA_SPAN)
+    deg_in_nak = lon % NAKSHATRA_SPAN
+    pada = int(deg_in_nak // PADA_SPAN) + 1  # Padas 1 to 4
     return NAKSHATRAS[index], deg_in_nak, pada
 
-def get_saptamsa_sign(lon):
-    sign = int(lon // 30)
-    deg_in_sign = lon % 30
-    saptamsa_div = int(deg_in_sign // (30 / 7))  # 0 to 6
-    saptamsa_sign = (sign * 7 + saptamsa_div) % 12
-
-    return saptamsa_sign
-def get_navamsa_sign(lon):
-    sign = int(lon // 30)
-    deg_in_sign = lon % 30
-    nav_div = int(deg_in_sign // (30 / 9))
-    nav_sign = (sign * 9 + nav_div) % 12
-    return nav_sign
-
-def get_vimsamsa_sign(lon):
-    sign = int(lon // 30)
-    deg_in_sign = lon % 30
-    vimsamsa_div = int(deg_in_sign // (30 / 20))
-    vimsamsa_sign = (sign * 20 + vimsamsa_div) % 12
-    return vimsamsa_sign
-
-
-def build_house_chart(lagna_sign, planet_positions, is_navamsa=False):
+def build_house_chart(lagna_sign, planet_signs):
+    """Place planets in houses from their (already computed) varga signs."""
     house_chart = {i + 1: [] for i in range(12)}
     house_chart[1].append('Ascendant')
 
-    for planet, lon in planet_positions.items():
-        sign = get_navamsa_sign(lon) if is_navamsa else int(lon // 30)
+    for planet, sign in planet_signs.items():
         relative_house = ((sign - lagna_sign) % 12) + 1
         house_chart[relative_house].append(planet)
 
     return house_chart
 
-def get_chart_details(birth_utc,lat,lon):
-    import swisseph as swe
-    from datetime import datetime
-
-    # ===== CONFIGURATION =====
-    swe.set_ephe_path('./ephe')
-    swe.set_sid_mode(swe.SIDM_LAHIRI)
-    jd = swe.julday(birth_utc.year, birth_utc.month, birth_utc.day,
-                birth_utc.hour + birth_utc.minute / 60)
-    longitude = lon
-    latitude = lat
-    swe.set_topo(longitude, latitude, 0)
-    
-
-    # ===== D-1 CHART =====
-    d1_lagna_deg, d1_lagna_sign = get_sidereal_lagna(jd, latitude, longitude)
-    planet_positions = get_planet_positions(jd)
-    house_signs_d1 = [(d1_lagna_sign + i) % 12 for i in range(12)]
-    house_chart_d1 = build_house_chart(d1_lagna_sign, planet_positions, is_navamsa=False)
-
-    print(f"\n🪐 D-1 Rāśi Chart for {birth_utc.strftime('%Y-%m-%d %H:%M UTC')} in {location_name}")
-    print(f"Ascendant: {ZODIAC_SIGNS[d1_lagna_sign]} ({d1_lagna_deg:.2f}°) | Nakshatra: {get_nakshatra(d1_lagna_deg)[0]}")
-    print("== D-1 Houses ==")
-    for i in range(12):
-        sign = ZODIAC_SIGNS[house_signs_d1[i]]
-        planets = ', '.join(house_chart_d1[i + 1]) or '—'
-        print(f"House {i+1:2} ({sign}): {planets}")
-
-    # ===== D-7 CHART =====
-    d7_lagna_sign = get_saptamsa_sign(d1_lagna_deg)
-    house_signs_d7 = [(d7_lagna_sign + i) % 12 for i in range(12)]
-    house_chart_d7 = {i + 1: [] for i in range(12)}
-    house_chart_d7[1].append('Ascendant')
-
-    # Place planets in D7
-    for planet, lon in planet_positions.items():
-        saptamsa_sign = get_saptamsa_sign(lon)
-        relative_house = ((saptamsa_sign - d7_lagna_sign) % 12) + 1
-        house_chart_d7[relative_house].append(planet)
-
-    print(f"\n🕉️ D-7 Saptamsa Chart (Derived from same birth details)")
-    print(f"Ascendant: {ZODIAC_SIGNS[d7_lagna_sign]} Saptamsa")
-    print("== D-7 Houses ==")
-    for i in range(12):
-        sign = ZODIAC_SIGNS[house_signs_d7[i]]
-        planets = ', '.join(house_chart_d7[i + 1]) or '—'
-        print(f"House {i+1:2} ({sign} Saptamsa): {planets}")
-
-
-
-    # ===== D-9 CHART =====
-    d9_lagna_sign = get_navamsa_sign(d1_lagna_deg)
-    house_signs_d9 = [(d9_lagna_sign + i) % 12 for i in range(12)]
-    house_chart_d9 = build_house_chart(d9_lagna_sign, planet_positions, is_navamsa=True)
-
-    print(f"\n🕉️ D-9 Navamsa Chart (Derived from same birth details)")
-    print(f"Ascendant: {ZODIAC_SIGNS[d9_lagna_sign]} Navamsa")
-    print("== D-9 Houses ==")
-    for i in range(12):
-        sign = ZODIAC_SIGNS[house_signs_d9[i]]
-        planets = ', '.join(house_chart_d9[i + 1]) or '—'
-        print(f"House {i+1:2} ({sign} Navamsa): {planets}")
-
-    # ===== D-20 CHART =====
-    d20_lagna_sign = get_vimsamsa_sign(d1_lagna_deg)
-    house_signs_d20 = [(d20_lagna_sign + i) % 12 for i in range(12)]
-    house_chart_d20 = {i + 1: [] for i in range(12)}
-    house_chart_d20[1].append('Ascendant')
-
-    # Place planets in D20
-    for planet, lon in planet_positions.items():
-        vimsamsa_sign = get_vimsamsa_sign(lon)
-        relative_house = ((vimsamsa_sign - d20_lagna_sign) % 12) + 1
-        house_chart_d20[relative_house].append(planet)
-
-    print(f"\n🕉️ D-20 Vimsamsa Chart (Derived from same birth details)")
-    print(f"Ascendant: {ZODIAC_SIGNS[d20_lagna_sign]} Vimsamsa")
-    print("== D-20 Houses ==")
+def get_house_lords(chart_name, house_signs, house_chart):
+    logger.debug("== %s House Lords and Their Positions ==", chart_name)
+    house_lords_data = {}
+    # Planet -> house, so each lord is found in one lookup
+    planet_house = {planet: house for house, planets in house_chart.items() for planet in planets}
     for i in range(12):
-        sign = ZODIAC_SIGNS[house_signs_d20[i]]
-        planets = ', '.join(house_chart_d20[i + 1]) or '—'
-        print(f"House {i+1:2} ({sign} Vimsamsa): {planets}")
-
-
-        
-
-    # ===== Planet Details =====
-    print("\nPlanet Positions with Nakshatras and Padas:")
-    planet_positions_data = {} 
-    for planet, lon in planet_positions.items():
-        nak, deg_in, pada = get_nakshatra(lon)
-        sign = ZODIAC_SIGNS[int(lon // 30)]
-        print(f"{planet:7}: {lon:.2f}° {sign} | Nakshatra: {nak} ({deg_in:.2f}°) | Pada: {pada}")
-        planet_positions_data[planet] = {
-            'planet':planet,
-            'degree':lon,
-            'sign':sign,
-            'nakshatra':nak,
-            'nak_deg':deg_in,
-            'pada':pada
+        house_num = i + 1
+        sign_num = house_signs[i]
+        sign_name = ZODIAC_SIGNS[sign_num]
+        lord = HOUSE_LORDS[sign_num]
+
+        # Find where lord planet sits
+        lord_house = planet_house.get(lord, "Not Found")
+
+        house_lords_data[house_num] = {
+            'sign': sign_name,
+            'lord': lord,
+            'lord_house': lord_house
         }
-
-    # ===== HOUSE LORDS TABLE =====
-    house_lords = {
-        0: 'Mars', 1: 'Venus', 2: 'Mercury', 3: 'Moon',
-        4: 'Sun', 5: 'Mercury', 6: 'Venus', 7: 'Mars',
-        8: 'Jupiter', 9: 'Saturn', 10: 'Saturn', 11: 'Jupiter'
+        logger.debug("House %s (%s) → Lord: %s → Sits in House: %s", house_num, sign_name, lord, lord_house)
+
+    return house_lords_data
+
+def check_ayanamsha(ayanamsha):
+    if EPHEMERIS_MODE == "table" and ayanamsha != AYANAMSHA:
+        raise ValueError("The ephemeris table only supports the Lahiri ayanamsha")
+
+# ===== COMPACT CHART =====
+def chart_arrays(longitudes):
+    """Every Chart array but the longitudes, for longitudes of shape (..., 10).
+
+    The batch path passes all its rows at once, so the varga, house, lord
+    and nakshatra math runs as NumPy operations over the whole batch.
+    """
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    vargas = compute_vargas(longitudes, Chart.DIVISIONS)
+    signs = np.stack([vargas[division] for division in Chart.DIVISIONS], axis=-2)
+    houses = (signs[..., 1:] - signs[..., :1]) % 12 + 1
+    # House n's sign is n - 1 signs on from the lagna's; its lord's house is
+    # where that planet sits
+    lords = LORD_INDEX[(signs[..., :1] + np.arange(12)) % 12]
+    planets = longitudes[..., 1:]
+    nak_degrees = planets % NAKSHATRA_SPAN
+    return {
+        "signs": signs.astype(np.uint8),
+        "houses": houses.astype(np.uint8),
+        "lord_houses": np.take_along_axis(houses, lords, axis=-1).astype(np.uint8),
+        "nakshatras": (planets // NAKSHATRA_SPAN).astype(np.uint8),
+        "nak_degrees": nak_degrees,
+        "padas": (nak_degrees // PADA_SPAN + 1).astype(np.uint8),
     }
 
-    # ===== FUNCTION TO PRINT HOUSE LORDS =====
-    def get_house_lords(chart_name, house_signs, house_chart):
-        print(f"\n== 🏠 {chart_name} House Lords and Their Positions ==")
-        house_lords_data = {}
-        for i in range(12):
-            house_num = i + 1
-            sign_num = house_signs[i]
-            sign_name = ZODIAC_SIGNS[sign_num]
-            lord = house_lords[sign_num]
-
-            # Find where lord planet sits
-            lord_house = next((h for h, plist in house_chart.items() if lord in plist), "Not Found")
-
-            house_lords_data[house_num] = {
-                'sign': sign_name,
-                'lord': lord,
-                'lord_house': lord_house
+
+class Chart:
+    """One birth's chart as small arrays instead of nested dicts.
+
+    longitudes   float64[10]: the lagna, then the planets in PLANET_NAMES order
+    signs        uint8[4, 10]: varga sign of each of those, one row per
+                 CHART_DIVISIONS entry
+    houses       uint8[4, 9]: house of each planet per varga, the planet ->
+                 house index that makes lord placement a single lookup
+    lord_houses  uint8[4, 12]: house the lord of each house sits in, per varga
+    nakshatras   uint8[9], nak_degrees float64[9], padas uint8[9]: each
+                 planet's nakshatra, degrees into it and pada
+
+    Other supported vargas are computed on request from the longitudes. A
+    Chart is about a kilobyte where the dicts it replaces took tens of
+    kilobytes, and to_bytes() packs it into 83 for process pool results
+    and storage (the other arrays are rebuilt from the longitudes). Dicts
+    are only built at the API boundary by ChartResult, as lookups into
+    these arrays.
+    """
+    __slots__ = ("longitudes", "signs", "houses", "lord_houses", "nakshatras", "nak_degrees", "padas")
+
+    DIVISIONS = tuple(CHART_DIVISIONS.values())
+    _ROW = {division: row for row, division in enumerate(DIVISIONS)}
+    _FORMAT = struct.Struct(f"<2sB{len(PLANET_NAMES) + 1}d")
+    _MAGIC = b"CH"
+    _VERSION = 1
+
+    def __init__(self, longitudes):
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        for name, array in chart_arrays(self.longitudes).items():
+            setattr(self, name, array)
+
+    @classmethod
+    def from_positions(cls, lagna_deg, planet_positions):
+        return cls([lagna_deg] + [planet_positions[p] for p in PLANET_NAMES])
+
+    @classmethod
+    def from_arrays(cls, longitudes, **arrays):
+        """Wrap one row of chart_arrays() (the batch path) without recomputing it."""
+        chart = cls.__new__(cls)
+        chart.longitudes = longitudes
+        for name, array in arrays.items():
+            setattr(chart, name, array)
+        return chart
+
+    def varga(self, division):
+        """(sign of the lagna and each planet, house of each planet) for one varga."""
+        row = self._ROW.get(division)
+        if row is not None:
+            return self.signs[row], self.houses[row]
+        signs = compute_vargas(self.longitudes, [division])[division]
+        return signs, (signs[1:] - signs[0]) % 12 + 1
+
+    def lagna_sign(self, division=1):
+        return int(self.varga(division)[0][0])
+
+    def house_of(self, planet, division=1):
+        return int(self.varga(division)[1][PLANET_NAMES.index(planet)])
+
+    def lord_houses_of(self, division=1):
+        """House the lord of each of houses 1-12 sits in, for one varga."""
+        row = self._ROW.get(division)
+        if row is not None:
+            return self.lord_houses[row]
+        signs, houses = self.varga(division)
+        return houses[LORD_INDEX[(signs[0] + np.arange(12)) % 12]]
+
+    def lord_house(self, house, division=1):
+        """House the lord of `house` sits in."""
+        return int(self.lord_houses_of(division)[house - 1])
+
+    # ===== SERIALIZATION =====
+    def to_bytes(self):
+        """Magic, version and the longitudes; the varga arrays are rebuilt on load."""
+        return self._FORMAT.pack(self._MAGIC, self._VERSION, *self.longitudes.tolist())
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, *longitudes = cls._FORMAT.unpack(data)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError("Not a serialized Chart")
+        return cls(longitudes)
+
+    def __reduce__(self):
+        # Pickles (process pool results) carry the packed longitudes only
+        return Chart.from_bytes, (self.to_bytes(),)
+
+    def __eq__(self, other):
+        return isinstance(other, Chart) and np.array_equal(self.longitudes, other.longitudes)
+
+    def __hash__(self):
+        return hash(self.to_bytes())
+
+    def __repr__(self):
+        return f"Chart(lagna={self.longitudes[0]:.4f})"
+
+
+# ===== CHART RESULT =====
+CHART_FIELDS = ("ascendant", "chart", "lords", "planets")
+
+
+def parse_chart_selection(charts=None, fields=None):
+    """Normalise a chart/field selection such as charts="d1,d9", fields="chart,lords".
+
+    Either argument may be a comma-separated string or a list; None selects
+    the default charts (d1, d9, d20, d7) and every field.
+    """
+    if isinstance(charts, str):
+        charts = charts.split(",")
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    charts = [c.strip().lower() for c in charts if c.strip()] if charts else list(CHART_DIVISIONS)
+    fields = [f.strip().lower() for f in fields if f.strip()] if fields else list(CHART_FIELDS)
+
+    for key in charts:
+        if not (key.startswith("d") and key[1:].isdigit() and int(key[1:]) in VARGA_NAMES):
+            raise ValueError(f"Unsupported chart: {key}")
+    for field in fields:
+        if field not in CHART_FIELDS:
+            raise ValueError(f"Unsupported field: {field}")
+    return tuple(dict.fromkeys(charts)), tuple(dict.fromkeys(fields))
+
+
+# Parsed once: the selection of every batch row and default single chart
+DEFAULT_SELECTION = parse_chart_selection()
+
+
+class ChartResult(Mapping):
+    """Dict view of a Chart for the API and the prompt formatter.
+
+    Behaves like the plain dict get_chart_details used to return, but each
+    varga chart, lord table and the planet details are built from the
+    Chart's arrays when read and not kept, so cached charts stay compact.
+    select() returns another view over the same Chart; to_dict()
+    materialises the selection for JSON.
+    """
+
+    def __init__(self, chart, charts=None, fields=None):
+        self.chart = chart
+        if charts is None and fields is None:
+            self.charts, self.fields = DEFAULT_SELECTION
+        else:
+            self.charts, self.fields = parse_chart_selection(charts, fields)
+        self._keys = self.charts + (("planets",) if "planets" in self.fields else ())
+
+    def select(self, charts=None, fields=None):
+        return ChartResult(self.chart, charts, fields)
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key == "planets":
+            return self._planets()
+        division = int(key[1:])
+        signs, houses = self.chart.varga(division)
+        chart = {}
+        if "ascendant" in self.fields:
+            chart["ascendant"] = ZODIAC_SIGNS[signs[0]]
+        if "chart" in self.fields:
+            chart["chart"] = self._house_chart(division, houses.tolist())
+        if "lords" in self.fields:
+            chart["lords"] = self._lords(int(signs[0]), self.chart.lord_houses_of(division).tolist())
+        return chart
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"ChartResult(charts={list(self.charts)}, fields={list(self.fields)})"
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
+
+    def _house_chart(self, division, houses):
+        house_chart = {i + 1: [] for i in range(12)}
+        house_chart[1].append('Ascendant')
+        for planet, house in zip(PLANET_NAMES, houses):
+            house_chart[house].append(planet)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            suffix = f" {VARGA_NAMES[division]}" if division != 1 else ""
+            lagna_sign = self.chart.lagna_sign(division)
+            logger.debug("== D-%s %s Houses ==", division, VARGA_NAMES[division])
+            for i in range(12):
+                sign = ZODIAC_SIGNS[(lagna_sign + i) % 12]
+                planets = ', '.join(house_chart[i + 1]) or '—'
+                logger.debug("House %2d (%s%s): %s", i + 1, sign, suffix, planets)
+
+        return house_chart
+
+    @staticmethod
+    def _lords(lagna_sign, lord_houses):
+        return {house: {'sign': sign, 'lord': lord, 'lord_house': lord_house}
+                for house, (sign, lord), lord_house
+                in zip(range(1, 13), HOUSE_SIGN_LORDS[lagna_sign], lord_houses)}
+
+    def _planets(self):
+        chart = self.chart
+        # Looked up from the Chart's arrays; only the dicts are built here
+        rows = zip(PLANET_NAMES, chart.longitudes[1:].tolist(), chart.signs[Chart._ROW[1], 1:].tolist(),
+                   chart.nakshatras.tolist(), chart.nak_degrees.tolist(), chart.padas.tolist())
+        planet_positions_data = {}
+        for planet, lon, sign, nak, deg_in, pada in rows:
+            planet_positions_data[planet] = {
+                'planet': planet,
+                'degree': lon,
+                'sign': ZODIAC_SIGNS[sign],
+                'nakshatra': NAKSHATRAS[nak],
+                'nak_deg': deg_in,
+                'pada': pada
             }
-            print(f"House {house_num} ({sign_name}) → Lord: {lord} → Sits in House: {lord_house}")
-        
-        return house_lords_data
+        if logger.isEnabledFor(logging.DEBUG):
+            for planet, data in planet_positions_data.items():
+                logger.debug("%-7s: %.2f° %s | Nakshatra: %s (%.2f°) | Pada: %s", planet, data['degree'],
+                             data['sign'], data['nakshatra'], data['nak_deg'], data['pada'])
+        return planet_positions_data
+
 
-    # ===== CALL FOR D1 =====
-    d1_lords = get_house_lords("D-1 Rāśi Chart", house_signs_d1, house_chart_d1)
+def get_chart_details(birth_utc, lat, lon, ayanamsha=AYANAMSHA, charts=None, fields=None):
+    """Chart for one birth as a ChartResult over a compact Chart.
 
-    # ===== CALL FOR D7 House Lords =====
-    d7_lords = get_house_lords("D-7 Saptamsa Chart", house_signs_d7, house_chart_d7)
+    `charts` / `fields` select what the result exposes (see
+    parse_chart_selection).
+    """
+    # ===== CONFIGURATION =====
+    # No swe.set_topo: positions are geocentric (no FLG_TOPOCTR) and houses_ex
+    # takes lat/lon explicitly, so topocentric state never affected the chart.
+    check_ayanamsha(ayanamsha)
+    jd = julian_day(birth_utc)
+    longitude = lon
+    latitude = lat
 
+    with _swe_lock, stage("ephemeris"):
+        if EPHEMERIS_MODE == "swisseph":
+            configure_ephemeris(ayanamsha)
+        lagna_deg, lagna_sign = get_sidereal_lagna(jd, latitude, longitude)
+        planet_positions = get_planet_positions(jd)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("D-1 Rāśi Chart for %s at lat=%s, lon=%s", birth_utc.strftime('%Y-%m-%d %H:%M UTC'), lat, lon)
+        logger.debug("Ascendant: %s (%.2f°) | Nakshatra: %s", ZODIAC_SIGNS[lagna_sign], lagna_deg, get_nakshatra(lagna_deg)[0])
+
+    with stage("varga"):
+        chart = Chart.from_positions(lagna_deg, planet_positions)
+    return ChartResult(chart, charts, fields)
+
+
+# ===== BATCH CHARTS =====
+def get_batch_positions(birth_utcs, lats, lons, ayanamsha=AYANAMSHA):
+    """Swiss Ephemeris stage of the batch path: one row per birth.
+
+    Returns (lagna_deg, longitudes) where longitudes has one column per
+    planet in PLANET_NAMES order.
+    """
+    check_ayanamsha(ayanamsha)
+    if EPHEMERIS_MODE == "table":
+        table = ephemeris_table.get_table()
+        jds = [julian_day(birth_utc) for birth_utc in birth_utcs]
+        return table.sidereal_lagna(jds, lats, lons), table.longitudes(jds)
+
+    n = len(birth_utcs)
+    lagna_deg = np.empty(n)
+    longitudes = np.empty((n, len(PLANET_NAMES)))
+    rahu = PLANET_NAMES.index('Rahu')
+    ketu = PLANET_NAMES.index('Ketu')
+    with _swe_lock:
+        configure_ephemeris(ayanamsha)
+        for row, (birth_utc, lat, lon) in enumerate(zip(birth_utcs, lats, lons)):
+            jd = julian_day(birth_utc)
+            lagna_deg[row], _ = get_sidereal_lagna(jd, lat, lon)
+            for col, name in enumerate(PLANET_NAMES):
+                if col == ketu:
+                    continue
+                pos, _ = swe.calc_ut(jd, PLANETS[name], swe.FLG_SIDEREAL)
+                longitudes[row, col] = pos[0]
+
+    longitudes %= 360
+    longitudes[:, ketu] = (longitudes[:, rahu] + 180) % 360
+    return lagna_deg, longitudes
+
+
+def get_chart_details_batch(birth_utcs, lats, lons, ayanamsha=AYANAMSHA):
+    """Compute charts for many births at once.
+
+    Returns one ChartResult per row, the same as get_chart_details would.
+    The vargas, houses, lords and nakshatras of all rows are computed as
+    NumPy array operations in one pass; only the ephemeris calls are per row.
+    """
+    with stage("batch_ephemeris"):
+        lagna_deg, longitudes = get_batch_positions(birth_utcs, lats, lons, ayanamsha)
+
+    # ===== Divisional Charts =====
+    # Column 0 is the lagna, then the planets: every varga in one pass
+    longitudes = np.column_stack([lagna_deg, longitudes])
+    arrays = chart_arrays(longitudes)
+
+    # Copies, so a cached row does not keep the whole batch alive
+    return [ChartResult(Chart.from_arrays(longitudes[row].copy(),
+                                          **{name: array[row].copy() for name, array in arrays.items()}))
+            for row in range(len(longitudes))]
+
+
+# ===== CHART CACHE =====
+class ChartCache:
+    """Process-wide LRU cache of computed charts.
+
+    Keys are normalised (ephemeris mode, Julian day, lat, lon, ayanamsha)
+    fingerprints, so the same birth entered with a different float repr still
+    hits, and a chart computed before set_ephemeris_mode() is never served
+    after it. Cached charts
+    are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            chart = self._data.get(key)
+            if chart is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return chart
+
+    def put(self, key, chart):
+        with self._lock:
+            self._data[key] = chart
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
 
-    # ===== CALL FOR D9 =====
-    d9_lords = get_house_lords("D-9 Navamsa Chart", house_signs_d9, house_chart_d9)
 
-    # ===== CALL FOR D20 House Lords =====
-    d20_lords = get_house_lords("D-20 Vimsamsa Chart", house_signs_d20, house_chart_d20)
-    return {
-            "d1": {"ascendant": ZODIAC_SIGNS[d1_lagna_sign], "chart": house_chart_d1, "lords": d1_lords},
-            "d9": {"ascendant": ZODIAC_SIGNS[d9_lagna_sign], "chart": house_chart_d9, "lords": d9_lords},
-            "d20": {"ascendant": ZODIAC_SIGNS[d20_lagna_sign], "chart": house_chart_d20, "lords": d20_lords},
-             "d7": {"ascendant": ZODIAC_SIGNS[d7_lagna_sign], "chart": house_chart_d7, "lords": d7_lords},
-            "planets": planet_positions_data
-        }
+chart_cache = ChartCache(maxsize=int(os.getenv("CHART_CACHE_SIZE", "1024")))
+
+Gauge("astrobot_chart_cache", "Chart cache size and hit/miss/eviction counts.", ("stat",),
+      function=lambda: {(k,): v for k, v in chart_cache.stats().items()})
+
+
+def chart_fingerprint(birth_utc, lat, lon, ayanamsha=AYANAMSHA):
+    jd = julian_day(birth_utc)
+    return (EPHEMERIS_MODE, round(jd, 6), round(float(lat), 6), round(float(lon), 6), ayanamsha)
+
+
+# Function that computes a chart on a cache miss. The server swaps in the
+# process-pool engine from chart_engine.py; scripts keep the in-process path.
+_chart_executor = get_chart_details
+chart_flights = SingleFlight("chart")
+
+
+def set_chart_executor(executor):
+    global _chart_executor
+    _chart_executor = executor or get_chart_details
+
+
+def get_chart_details_cached(birth_utc, lat, lon, ayanamsha=AYANAMSHA, charts=None, fields=None, user_id=None):
+    """get_chart_details through the process-wide chart cache and the chart store.
+
+    The cache holds one compact Chart per birth; each call gets a
+    ChartResult view with its own chart/field selection. On a cache miss the
+    chart is loaded from chart_store.py, or computed and written there,
+    linked to `user_id` when given.
+    """
+    selection = parse_chart_selection(charts, fields)
+    key = chart_fingerprint(birth_utc, lat, lon, ayanamsha)
+    chart = chart_cache.get(key)
+    if chart is None:
+        # Concurrent misses for the same birth (double submits, retries) share one computation
+        chart = chart_flights.do(key, lambda: _compute_cached(key, birth_utc, lat, lon, ayanamsha, user_id))
+    elif user_id is not None:
+        _link_user(user_id, key)
+    return ChartResult(chart, *selection)
+
+
+def _compute_cached(key, birth_utc, lat, lon, ayanamsha, user_id=None):
+    fingerprint = store_key(key)
+    chart = _load_stored(fingerprint, user_id)
+    if chart is None:
+        with stage("chart_compute"):
+            chart = _chart_executor(birth_utc, lat, lon, ayanamsha).chart
+        try:
+            chart_store.put(fingerprint, chart.to_bytes(), user_id)
+        except sqlite3.Error as e:
+            logger.warning("Could not store chart %s: %s", fingerprint, e)
+    chart_cache.put(key, chart)
+    return chart
+
+
+def _link_user(user_id, key):
+    """Keep the store's user -> chart link current when the chart came from memory."""
+    try:
+        chart_store.link(user_id, store_key(key))
+    except sqlite3.Error as e:
+        logger.warning("Could not link user %s: %s", user_id, e)
+
+
+def _load_stored(fingerprint, user_id):
+    """The stored Chart for a fingerprint, or None to compute it."""
+    try:
+        with stage("chart_store"):
+            data = chart_store.get(fingerprint, user_id)
+        return Chart.from_bytes(data) if data is not None else None
+    except sqlite3.Error as e:
+        # An unavailable store only costs a recomputation
+        logger.warning("Chart store lookup failed: %s", e)
+    except (ValueError, struct.error):
+        # Written by an older Chart format; the recomputed chart replaces it
+        pass
+    return None
@@ -0,0 +1,105 @@
+"""Local stand-in for the parts of google.generativeai the server uses.
+
+Selected with ``GENAI_BACKEND=fake``: llm_registry then builds its Gemini
+models from this module, so the whole app (routes, router, caches) runs
+unchanged without spending API quota. The simulated model is shaped by:
+
+    FAKE_LLM_TTFT          seconds before the first chunk (default 0.4)
+    FAKE_LLM_TPS           tokens per second after that (default 80)
+    FAKE_LLM_TOKENS        tokens per answer (default 300)
+    FAKE_LLM_CHUNK_TOKENS  tokens per streamed chunk (default 8)
+    FAKE_LLM_ERROR_RATE    fraction of requests that fail up front (default 0)
+
+Sync calls block the calling thread for the simulated time, exactly like a
+real blocking HTTP read, so worker sizing measured against the fake carries
+over to production; a cancelled request (cancellation.py) ends the wait
+early, like an aborted read.
+"""
+import asyncio
+import os
+import random
+
+import cancellation
+
+WORDS = ("the", "planet", "house", "lord", "sign", "dasha", "marriage", "career", "strong",
+         "favourable", "period", "Jupiter", "Venus", "Saturn", "aspect", "placement", "indicates")
+
+
+class FakeLLMError(RuntimeError):
+    """Simulated upstream failure (stands in for a 503 from the API)."""
+
+
+def _setting(name, default):
+    return float(os.getenv(name, default))
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.text = "".join(chunks)
+
+
+def configure(**kwargs):
+    pass
+
+
+def get_model(name):
+    return {"name": name}
+
+
+class GenerativeModel:
+    def __init__(self, model_name, ttft=None, tokens_per_second=None, tokens=None,
+                 chunk_tokens=None, error_rate=None, seed=None):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.ttft = _setting("FAKE_LLM_TTFT", 0.4) if ttft is None else ttft
+        self.tokens_per_second = _setting("FAKE_LLM_TPS", 80) if tokens_per_second is None else tokens_per_second
+        self.tokens = int(_setting("FAKE_LLM_TOKENS", 300) if tokens is None else tokens)
+        self.chunk_tokens = int(_setting("FAKE_LLM_CHUNK_TOKENS", 8) if chunk_tokens is None else chunk_tokens)
+        self.error_rate = _setting("FAKE_LLM_ERROR_RATE", 0) if error_rate is None else error_rate
+        self._random = random.Random(seed)
+
+    def _plan(self, prompt):
+        """Chunks of the answer, or FakeLLMError for a failed request."""
+        if self._random.random() < self.error_rate:
+            raise FakeLLMError("503 fake upstream unavailable")
+        words = [self._random.choice(WORDS) for _ in range(self.tokens)]
+        return [" ".join(words[i:i + self.chunk_tokens]) + " "
+                for i in range(0, len(words), self.chunk_tokens)]
+
+    def _interval(self):
+        return self.chunk_tokens / self.tokens_per_second
+
+    def _stream(self, chunks):
+        cancellation.sleep(self.ttft)
+        for i, text in enumerate(chunks):
+            if i:
+                cancellation.sleep(self._interval())
+            yield _Chunk(text)
+
+    async def _astream(self, chunks):
+        await asyncio.sleep(self.ttft)
+        for i, text in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self._interval())
+            yield _Chunk(text)
+
+    def generate_content(self, prompt, stream=False):
+        chunks = self._plan(prompt)
+        if stream:
+            return self._stream(chunks)
+        for _ in self._stream(chunks):
+            pass
+        return _Response(chunks)
+
+    async def generate_content_async(self, prompt, stream=False):
+        chunks = self._plan(prompt)
+        if stream:
+            return self._astream(chunks)
+        async for _ in self._astream(chunks):
+            pass
+        return _Response(chunks)
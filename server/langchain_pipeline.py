@@ -1,12 +1,11 @@
 from datetime import datetime
-import os
-from langgraph.graph import StateGraph, END
 from typing import TypedDict, List
-from langchain_google_genai import ChatGoogleGenerativeAI
 import pytz
 from dotenv import load_dotenv
-import os
+from chart_router import router
 from combined import get_chart_details
+from llm_registry import registry
+from prompt_format import PROMPT_ENCODING, format_compact
 load_dotenv()
 
 
@@ -23,12 +22,8 @@ class GraphState(TypedDict):
 # ---------------- Chart Classifier ----------------
 
 def classify_charts(state: GraphState) -> GraphState:
-    question = state["question"].lower()
-    charts = ["d1"]
-    if any(k in question for k in ["spiritual", "moksha", "meditation", "liberation"]):
-        charts.append("d20")
-    if any(k in question for k in ["marriage", "partner", "love", "relationship"]):
-        charts.append("d9")
+    # Same keyword router as chat.determine_required_charts
+    charts = [chart.lower() for chart in router.route(state["question"])]
     return {**state, "charts": charts}
 
 
@@ -60,6 +55,11 @@ def fetch_chart_data(state: GraphState) -> GraphState:
 def format_prompt(state: GraphState) -> GraphState:
     chart_data = state["chart_data"]
     charts = state["charts"]
+    if PROMPT_ENCODING == "compact":
+        full_prompt = "My placements:\n" + format_compact(chart_data, charts)
+        full_prompt += f"\n\nNow based on the above placements, please answer this question:\n{state['question']}"
+        return {**state, "final_prompt": full_prompt}
+
     output = ["I'll tell you my placements house wise:\n"]
 
     for chart_key in charts:
@@ -89,19 +89,20 @@ def format_prompt(state: GraphState) -> GraphState:
 # ---------------- Call Gemini LLM ----------------
 
 def call_gemini(state: GraphState) -> GraphState:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.5
-    )
+    # Shared client from the LLM registry instead of a new one per invocation
+    llm = registry.langchain("gemini", model="gemini-1.5-flash", temperature=0.5)
     print(state)
-    result = llm.predict(state["final_prompt"])
+    with registry.limit("gemini"):
+        result = llm.predict(state["final_prompt"])
     return {**state, "llm_response": result}
 
 
 # ---------------- Graph Builder ----------------
 
 def build_astrology_graph():
+    # LangGraph is heavy to import; only load it when a graph is actually built
+    from langgraph.graph import StateGraph, END
+
     print("building")
     graph = StateGraph(GraphState)
 
@@ -118,7 +119,15 @@ def build_astrology_graph():
 
     return graph.compile()
 
-graph = build_astrology_graph()
-result = graph.invoke({"question": "How will my marriage be? "})
+_graph = None
+
+def run_astrology_graph(question: str) -> str:
+    """Run the graph for one question, building it on first use."""
+    global _graph
+    if _graph is None:
+        _graph = build_astrology_graph()
+    result = _graph.invoke({"question": question})
+    return result["llm_response"]
 
-print(result["llm_response"])
+if __name__ == "__main__":
+    print(run_astrology_graph("How will my marriage be? "))
@@ -0,0 +1,173 @@
+"""Process-wide registry of long-lived LLM clients.
+
+Building a chat model per request means a fresh client, a fresh TLS
+handshake and no connection reuse. The registry instead creates one client
+per (provider, model) on first use and hands the same instance to every
+caller: chat.py (google.generativeai), langchain_pipeline.py and
+config.get_llm (LangChain chat models). google.generativeai is configured
+once, so every Gemini model shares one pooled transport.
+
+Each provider also gets a concurrency limit (``LLM_CONCURRENCY_<PROVIDER>``,
+default ``LLM_CONCURRENCY`` or 16) so a burst of requests queues here instead
+of tripping the provider's rate limits:
+
+    with registry.limit("gemini"):
+        response = model.generate_content(prompt)
+
+``registry.warm()`` builds the default clients and, unless ``LLM_WARMUP=0``,
+makes one cheap metadata call to open the Gemini connection before the first
+user request. The servers call it through ``warm_in_background()`` so SDK
+import and connection setup stay off the cold-start path; with
+``LLM_WARMUP=0`` that does nothing at all, and the first LLM request builds
+its client.
+``GENAI_BACKEND=fake`` swaps Gemini for the local stand-in in fake_genai.py.
+"""
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# "google" for the real API, "fake" for the local stand-in in fake_genai.py
+GENAI_BACKEND = os.getenv("GENAI_BACKEND", "google")
+
+# provider -> (default model, API key environment variable)
+PROVIDERS = {
+    "gemini": ("gemini-1.5-flash", "GOOGLE_API_KEY"),
+    "openai": ("gpt-4", "OPENAI_API_KEY"),
+    "anthropic": ("claude-3", "ANTHROPIC_API_KEY"),
+}
+
+DEFAULT_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+
+
+def _api_key(provider):
+    env = PROVIDERS[provider][1]
+    api_key = os.getenv(env)
+    if not api_key:
+        raise ValueError(f"Missing {env} environment variable")
+    return api_key
+
+
+def _genai():
+    if GENAI_BACKEND == "fake":
+        import fake_genai
+        return fake_genai
+    import google.generativeai as genai
+    return genai
+
+
+def concurrency_limit(provider):
+    return int(os.getenv(f"LLM_CONCURRENCY_{provider.upper()}", DEFAULT_CONCURRENCY))
+
+
+# ===== CLIENT FACTORIES =====
+# LangChain is only needed by the LangChain pipeline, so it is imported lazily
+def _langchain_client(provider, model, temperature):
+    api_key = _api_key(provider)
+    if provider == "openai":
+        from langchain.chat_models import ChatOpenAI
+        return ChatOpenAI(model_name=model, openai_api_key=api_key, temperature=temperature)
+    if provider == "anthropic":
+        from langchain.chat_models import ChatAnthropic
+        return ChatAnthropic(model=model, anthropic_api_key=api_key, temperature=temperature)
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, google_api_key=api_key, temperature=temperature)
+
+
+class LLMRegistry:
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._genai_configured = False
+        self._semaphores = {}
+        self._async_semaphores = {}
+
+    # ===== CLIENTS =====
+    def _get(self, key, factory):
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory()
+                    logger.info("Created LLM client %s", "/".join(map(str, key)))
+        return client
+
+    def genai_model(self, model=GEMINI_MODEL):
+        """Shared google.generativeai model, used by chat.py for native streaming."""
+        def factory():
+            genai = _genai()
+            if not self._genai_configured:
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                self._genai_configured = True
+            return genai.GenerativeModel(model)
+        return self._get(("genai", model), factory)
+
+    def langchain(self, provider, model=None, temperature=0.3):
+        """Shared LangChain chat model for a provider."""
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+        model = model or PROVIDERS[provider][0]
+        return self._get(("langchain", provider, model, temperature),
+                         lambda: _langchain_client(provider, model, temperature))
+
+    # ===== CONCURRENCY LIMITS =====
+    def _semaphore(self, provider):
+        with self._lock:
+            semaphore = self._semaphores.get(provider)
+            if semaphore is None:
+                semaphore = self._semaphores[provider] = threading.BoundedSemaphore(concurrency_limit(provider))
+            return semaphore
+
+    @contextmanager
+    def limit(self, provider):
+        """Hold one of the provider's concurrency slots for the duration of a call."""
+        semaphore = self._semaphore(provider)
+        with semaphore:
+            yield
+
+    @asynccontextmanager
+    async def limit_async(self, provider):
+        # asyncio semaphores belong to one event loop, so keep one per loop
+        key = (provider, asyncio.get_running_loop())
+        semaphore = self._async_semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._async_semaphores[key] = asyncio.Semaphore(concurrency_limit(provider))
+        async with semaphore:
+            yield
+
+    # ===== STARTUP =====
+    def warm_in_background(self):
+        """Run warm() on a daemon thread so the SDK import and connection
+        setup do not delay server start or the first non-LLM request.
+
+        With LLM_WARMUP=0 nothing is started: neither the SDK import nor the
+        clients, which the first LLM request then builds.
+        """
+        if os.getenv("LLM_WARMUP", "1") == "0":
+            return None
+        thread = threading.Thread(target=self.warm, name="llm-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def warm(self, ping=None):
+        """Build the default clients, and open the Gemini connection unless LLM_WARMUP=0."""
+        if ping is None:
+            ping = os.getenv("LLM_WARMUP", "1") != "0"
+        model = self.genai_model()
+        if not ping:
+            return self
+        try:
+            _genai().get_model(model.model_name)
+        except Exception as e:
+            # Warm-up is best effort; the first real request will retry the connection
+            logger.warning("LLM warm-up failed: %s", e)
+        return self
+
+
+registry = LLMRegistry()
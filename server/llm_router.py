@@ -0,0 +1,490 @@
+"""Latency-aware LLM routing with hedged requests.
+
+Every provider behind the router exposes the same streaming interface
+(``stream(prompt)`` / ``astream(prompt)`` yielding text chunks). For each
+request the router:
+
+    1. ranks providers by rolling median time to first token (TTFT),
+       skipping providers that recently failed several times in a row
+    2. streams from the fastest one
+    3. if no token has arrived after ``hedge_delay`` seconds, fires the same
+       prompt at the next provider; the first to produce a token wins and
+       the loser is cancelled
+    4. fails over to the next provider immediately if an attempt errors
+       before its first token, and gives up after ``timeout`` seconds
+    5. gives up on the winner if it then stalls for ``chunk_timeout``
+       seconds between chunks
+
+Every attempt holds its provider's registry slot (``registry.limit``).
+Called through admission.py, attempts after the first also take a slot in
+their own provider's admission budget: a hedge is only fired when that
+budget has room right away, so hedging uses spare capacity instead of
+doubling upstream load, and a failover is charged to the provider that
+serves it.
+
+Providers are configured with ``LLM_PROVIDERS`` (default ``gemini``; e.g.
+``gemini,openai,anthropic``), ``LLM_HEDGE_DELAY``, ``LLM_TIMEOUT`` and
+``LLM_CHUNK_TIMEOUT``. With a single provider the router only adds the
+timeouts.
+``StubProvider`` simulates a provider locally for tests.
+
+On threads, each attempt runs under its own CancelToken (cancellation.py):
+a cancelled request or a lost race wakes the router at once and cancels the
+attempts, and providers that can abort their HTTP stream register that with
+on_cancel (others stop at their next chunk).
+"""
+import asyncio
+import logging
+import os
+import queue
+import random
+import re
+import statistics
+import threading
+import time
+from collections import deque
+
+import cancellation
+from llm_registry import GEMINI_MODEL, registry
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDERS = os.getenv("LLM_PROVIDERS", "gemini")
+DEFAULT_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30.0"))
+DEFAULT_CHUNK_TIMEOUT = float(os.getenv("LLM_CHUNK_TIMEOUT", "30.0"))
+
+PROVIDER_FIRST_TOKEN_SECONDS = Histogram(
+    "astrobot_llm_provider_first_token_seconds", "Time to first token per LLM provider.", ("provider",))
+ROUTER_EVENTS = Counter(
+    "astrobot_llm_router_events", "LLM router decisions: win, hedge, hedge_skipped, cancel, error, stall.",
+    ("provider", "event"))
+
+
+# ===== PROVIDERS =====
+class GeminiProvider:
+    """Gemini through google.generativeai's native streaming API."""
+
+    def __init__(self, model=GEMINI_MODEL):
+        self.name = "gemini"
+        self.model = model
+
+    def stream(self, prompt):
+        with registry.limit(self.name):
+            response = registry.genai_model(self.model).generate_content(prompt, stream=True)
+            unregister = cancellation.on_cancel(lambda: _abort(response))
+            try:
+                for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+            finally:
+                unregister()
+
+    async def astream(self, prompt):
+        async with registry.limit_async(self.name):
+            response = await registry.genai_model(self.model).generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+
+
+def _abort(response):
+    """Cancel the gRPC call behind a streaming Gemini response, when it has one."""
+    cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+    if cancel is not None:
+        cancel()
+
+
+class LangChainProvider:
+    """Any provider config.get_llm can build (openai, anthropic, gemini)."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _llm(self):
+        from config import get_llm
+        return get_llm(self.name)
+
+    def stream(self, prompt):
+        llm = self._llm()
+        with registry.limit(self.name):
+            for chunk in llm.stream(prompt):
+                if chunk.content:
+                    yield chunk.content
+
+    async def astream(self, prompt):
+        llm = self._llm()
+        async with registry.limit_async(self.name):
+            async for chunk in llm.astream(prompt):
+                if chunk.content:
+                    yield chunk.content
+
+
+class StubProvider:
+    """Local stand-in with a fixed time to first token, token rate and failure rate."""
+
+    def __init__(self, name, ttft=0.05, tokens_per_second=200.0, text="stub answer " * 8,
+                 error_rate=0.0, seed=None):
+        self.name = name
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.text = text
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _chunks(self):
+        self.calls += 1
+        if self._random.random() < self.error_rate:
+            raise ConnectionError(f"{self.name} stub failure")
+        return re.findall(r"\S+\s*", self.text)
+
+    def stream(self, prompt):
+        chunks = self._chunks()
+        cancellation.sleep(self.ttft)
+        for i, chunk in enumerate(chunks):
+            if i:
+                cancellation.sleep(1 / self.tokens_per_second)
+            yield chunk
+
+    async def astream(self, prompt):
+        chunks = self._chunks()
+        await asyncio.sleep(self.ttft)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield chunk
+
+
+def make_provider(name):
+    if name == "gemini":
+        return GeminiProvider()
+    return LangChainProvider(name)
+
+
+# ===== STATS =====
+class ProviderStats:
+    """Rolling TTFT window and consecutive-failure circuit breaker for one provider."""
+
+    def __init__(self, window=50, prior=1.0, max_failures=3, cooldown=30.0):
+        self.ttfts = deque(maxlen=window)
+        self.prior = prior
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_ttft(self, seconds):
+        with self._lock:
+            self.ttfts.append(seconds)
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.unhealthy_until = time.monotonic() + self.cooldown
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def score(self):
+        with self._lock:
+            return statistics.median(self.ttfts) if self.ttfts else self.prior
+
+
+class _Attempt:
+    def __init__(self, provider):
+        self.provider = provider
+        self.started = time.perf_counter()
+        self.cancelled = False
+        self.task = None
+        self.token = cancellation.CancelToken()
+        self.output_chars = 0
+        # Releases the attempt's admission slot, when it took one
+        self.release = None
+
+    def finish(self):
+        if self.release is not None:
+            self.release(self.output_chars)
+            self.release = None
+
+    def cancel(self):
+        self.cancelled = True
+        self.token.cancel()
+
+
+# ===== ROUTER =====
+class LLMRouter:
+    def __init__(self, providers, hedge_delay=DEFAULT_HEDGE_DELAY, timeout=DEFAULT_TIMEOUT,
+                 chunk_timeout=DEFAULT_CHUNK_TIMEOUT):
+        if not providers:
+            raise ValueError("LLMRouter needs at least one provider")
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.chunk_timeout = chunk_timeout
+        self.stats = {provider.name: ProviderStats() for provider in self.providers}
+
+    @classmethod
+    def from_env(cls, names=DEFAULT_PROVIDERS):
+        return cls([make_provider(name.strip()) for name in names.split(",") if name.strip()])
+
+    def rank(self):
+        """Healthy providers fastest first, then unhealthy ones as a last resort."""
+        order = {provider.name: i for i, provider in enumerate(self.providers)}
+        return sorted(self.providers, key=lambda p: (not self.stats[p.name].healthy(),
+                                                     self.stats[p.name].score(), order[p.name]))
+
+    def _on_first_token(self, winner, attempts):
+        elapsed = time.perf_counter() - winner.started
+        self.stats[winner.provider.name].record_ttft(elapsed)
+        PROVIDER_FIRST_TOKEN_SECONDS.observe(elapsed, provider=winner.provider.name)
+        ROUTER_EVENTS.inc(provider=winner.provider.name, event="win")
+        for attempt in attempts:
+            if attempt is not winner and not attempt.cancelled:
+                # The loser was at least this slow; count that against it
+                self.stats[attempt.provider.name].record_ttft(time.perf_counter() - attempt.started)
+                ROUTER_EVENTS.inc(provider=attempt.provider.name, event="cancel")
+
+    def _on_error(self, attempt, error):
+        self.stats[attempt.provider.name].record_failure()
+        ROUTER_EVENTS.inc(provider=attempt.provider.name, event="error")
+        logger.warning("LLM provider %s failed: %s", attempt.provider.name, error)
+
+    def _next_wait(self, attempts, order, hedged, deadline):
+        now = time.perf_counter()
+        wait = deadline - now
+        if not hedged and len(attempts) < len(order):
+            wait = min(wait, attempts[0].started + self.hedge_delay - now)
+        return max(wait, 0)
+
+    def _new_attempt(self, provider, attempts, admit, hedge):
+        """An _Attempt at `provider`, or None when a hedge finds its admission budget full.
+
+        The first attempt runs on the caller's admission ticket; later ones
+        need their own, so they count against the provider that serves them.
+        """
+        attempt = _Attempt(provider)
+        if attempts and admit is not None:
+            attempt.release = admit(provider.name)
+            if attempt.release is None and hedge:
+                ROUTER_EVENTS.inc(provider=provider.name, event="hedge_skipped")
+                return None
+        if hedge:
+            ROUTER_EVENTS.inc(provider=provider.name, event="hedge")
+        attempts.append(attempt)
+        return attempt
+
+    def _stalled(self, winner):
+        ROUTER_EVENTS.inc(provider=winner.provider.name, event="stall")
+        self.stats[winner.provider.name].record_failure()
+        return TimeoutError(f"LLM provider {winner.provider.name} sent nothing for {self.chunk_timeout}s")
+
+    # ===== SYNC =====
+    def _run(self, attempt, prompt, events):
+        try:
+            with cancellation.bound(attempt.token):
+                stream = attempt.provider.stream(prompt)
+                try:
+                    for chunk in stream:
+                        if attempt.cancelled:
+                            break
+                        attempt.output_chars += len(chunk)
+                        events.put((attempt, "chunk", chunk))
+                finally:
+                    stream.close()
+            events.put((attempt, "done", None))
+        except Exception as e:
+            events.put((attempt, "error", e))
+        finally:
+            attempt.finish()
+
+    def stream(self, prompt, admit=None):
+        """Yield text chunks from whichever provider answers first.
+
+        admit(provider name), passed by admission.stream, returns a function
+        releasing a slot in that provider's budget, or None if it is full.
+        """
+        order = self.rank()
+        events = queue.Queue()
+        attempts = []
+
+        def launch(hedge=False):
+            attempt = self._new_attempt(order[len(attempts)], attempts, admit, hedge)
+            if attempt is not None:
+                threading.Thread(target=self._run, args=(attempt, prompt, events), daemon=True).start()
+
+        # A cancelled request wakes whichever wait below it is in
+        unregister = cancellation.on_cancel(lambda: events.put((None, "cancel", None)))
+        launch()
+        deadline = time.perf_counter() + self.timeout
+        hedged = False
+        failed = 0
+        winner, first = None, None
+        try:
+            # ===== RACE FOR THE FIRST TOKEN =====
+            while winner is None:
+                if time.perf_counter() >= deadline:
+                    raise TimeoutError(f"No LLM token within {self.timeout}s")
+                try:
+                    attempt, kind, payload = events.get(timeout=self._next_wait(attempts, order, hedged, deadline))
+                except queue.Empty:
+                    if not hedged and len(attempts) < len(order) and time.perf_counter() < deadline:
+                        hedged = True
+                        launch(hedge=True)
+                    continue
+                if kind == "cancel":
+                    raise cancellation.Cancelled()
+                if attempt.cancelled:
+                    continue
+                if kind == "error":
+                    self._on_error(attempt, payload)
+                    attempt.cancelled = True
+                    failed += 1
+                    if failed == len(attempts):
+                        if len(attempts) == len(order):
+                            raise payload
+                        launch()
+                    continue
+                winner, first = attempt, payload
+                self._on_first_token(winner, attempts)
+                for other in attempts:
+                    if other is not winner:
+                        # Stops the loser's paid generation now, not at its next chunk
+                        other.cancel()
+
+            # ===== STREAM THE WINNER =====
+            if first is None:
+                return
+            yield first
+            stall_deadline = time.perf_counter() + self.chunk_timeout
+            while True:
+                try:
+                    attempt, kind, payload = events.get(timeout=max(stall_deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    raise self._stalled(winner) from None
+                if kind == "cancel":
+                    raise cancellation.Cancelled()
+                if attempt is not winner:
+                    continue
+                if kind == "chunk":
+                    stall_deadline = time.perf_counter() + self.chunk_timeout
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+        finally:
+            unregister()
+            for attempt in attempts:
+                attempt.cancel()
+
+    # ===== ASYNC =====
+    async def _arun(self, attempt, prompt, events):
+        try:
+            async for chunk in attempt.provider.astream(prompt):
+                attempt.output_chars += len(chunk)
+                await events.put((attempt, "chunk", chunk))
+            await events.put((attempt, "done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await events.put((attempt, "error", e))
+
+    async def astream(self, prompt, admit=None):
+        """Async counterpart of stream(); losing attempts are cancelled as tasks."""
+        order = self.rank()
+        events = asyncio.Queue()
+        attempts = []
+
+        def launch(hedge=False):
+            attempt = self._new_attempt(order[len(attempts)], attempts, admit, hedge)
+            if attempt is not None:
+                attempt.task = asyncio.ensure_future(self._arun(attempt, prompt, events))
+                # A done callback also runs for a task cancelled before it started
+                attempt.task.add_done_callback(lambda _: attempt.finish())
+
+        def cancel(attempt):
+            attempt.cancelled = True
+            if attempt.task is not None:
+                attempt.task.cancel()
+
+        launch()
+        deadline = time.perf_counter() + self.timeout
+        hedged = False
+        failed = 0
+        winner, first = None, None
+        try:
+            while winner is None:
+                if time.perf_counter() >= deadline:
+                    raise TimeoutError(f"No LLM token within {self.timeout}s")
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(
+                        events.get(), self._next_wait(attempts, order, hedged, deadline))
+                except asyncio.TimeoutError:
+                    if not hedged and len(attempts) < len(order) and time.perf_counter() < deadline:
+                        hedged = True
+                        launch(hedge=True)
+                    continue
+                if attempt.cancelled:
+                    continue
+                if kind == "error":
+                    self._on_error(attempt, payload)
+                    attempt.cancelled = True
+                    failed += 1
+                    if failed == len(attempts):
+                        if len(attempts) == len(order):
+                            raise payload
+                        launch()
+                    continue
+                winner, first = attempt, payload
+                self._on_first_token(winner, attempts)
+                for other in attempts:
+                    if other is not winner:
+                        cancel(other)
+
+            if first is None:
+                return
+            yield first
+            stall_deadline = time.perf_counter() + self.chunk_timeout
+            while True:
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(
+                        events.get(), max(stall_deadline - time.perf_counter(), 0))
+                except asyncio.TimeoutError:
+                    raise self._stalled(winner) from None
+                if attempt is not winner:
+                    continue
+                if kind == "chunk":
+                    stall_deadline = time.perf_counter() + self.chunk_timeout
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+        finally:
+            for attempt in attempts:
+                cancel(attempt)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Process-wide router built from LLM_PROVIDERS on first use."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter.from_env()
+    return _router
+
+
+def set_router(router):
+    """Swap the process-wide router, e.g. for one built from StubProviders."""
+    global _router
+    with _router_lock:
+        _router = router
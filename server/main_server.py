@@ -1,46 +1,162 @@
 # main.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from datetime import datetime
-import swisseph as swe
+import logging
+import multiprocessing
+import os
+import time
 import pytz
 from flask_cors import CORS
-from combined import get_chart_details
+from combined import get_chart_details_cached
+from chart_engine import get_engine
+from metrics import REQUEST_SECONDS, render, stage
+from places import UnknownPlace, apply_place, gazetteer
 # from langchain_pipeline import run_astrology_graph
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
 app = Flask(__name__)
-CORS(app)  
+# Let browsers read the session and stream ids the chat routes return, and when to retry a 503
+CORS(app, expose_headers=["X-Session-Id", "X-Stream-Id", "Retry-After"])
+
+# Charts run on a pool of worker processes, each with its own swisseph state.
+# Spawned workers re-import this module as __mp_main__ and must not start one.
+if multiprocessing.parent_process() is None:
+    get_engine()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    # Streaming responses are recorded when the handler returns (time to first byte)
+    if request.url_rule is not None and request.url_rule.rule != "/metrics":
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                route=request.url_rule.rule, status=response.status_code)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return app.response_class(render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/charts", methods=["POST"])
 def charts():
     try:
-        data = request.json
+        # An optional "place" fills in lat, lon and timezone from the gazetteer
+        data = apply_place(request.json)
         dob = data.get("dob")       # e.g. "2003-09-20"
         tob = data.get("tob") 
         timezone_str = data.get("timezone", "Asia/Kolkata")      # e.g. "03:37"
         if not dob or not tob:
             return jsonify({"error": "Missing 'dob' or 'tob'"}), 400
 
-        dt_str = f"{dob} {tob}"
-        dt_local = datetime.strptime(f"{dob} {tob}", "%Y-%m-%d %H:%M")
-        local_tz = pytz.timezone(timezone_str)
-        dt_localized = local_tz.localize(dt_local)
-        birth_utc = dt_localized.astimezone(pytz.utc)
+        with stage("localize"):
+            dt_local = datetime.strptime(f"{dob} {tob}", "%Y-%m-%d %H:%M")
+            local_tz = pytz.timezone(timezone_str)
+            dt_localized = local_tz.localize(dt_local)
+            birth_utc = dt_localized.astimezone(pytz.utc)
         # birth_utc = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
 
         lat, lon = data["lat"], data["lon"]
-        result = get_chart_details(birth_utc, lat, lon)
-        return jsonify(result)
 
-    
+        # Optional selection, e.g. ?charts=d1,d9&fields=chart,lords
+        charts = request.args.get("charts", data.get("charts"))
+        fields = request.args.get("fields", data.get("fields"))
+        # A registered user's chart is read from the chart store before it is computed
+        result = get_chart_details_cached(birth_utc, lat, lon, charts=charts, fields=fields,
+                                          user_id=data.get("user_id"))
+        return jsonify(result.to_dict())
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/charts/batch", methods=["POST"])
+def charts_batch():
+    try:
+        data = request.json
+        utc = data.get("utc")       # e.g. ["2003-09-19 22:07", ...]
+        lats = data.get("lat")
+        lons = data.get("lon")
+        if utc is None or lats is None or lons is None:
+            return jsonify({"error": "Missing 'utc', 'lat' or 'lon'"}), 400
+        if not (len(utc) == len(lats) == len(lons)):
+            return jsonify({"error": "'utc', 'lat' and 'lon' must have the same length"}), 400
+
+        birth_utcs = [datetime.strptime(dt_str, "%Y-%m-%d %H:%M") for dt_str in utc]
+        results = get_engine().compute_batch(birth_utcs, lats, lons)
+        return jsonify({"charts": [result.to_dict() for result in results]})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/places", methods=["GET"])
+def search_places():
+    """?q=<prefix>[&country=IN][&limit=10] to search, ?lat=&lon= for the timezone there."""
+    try:
+        if request.args.get("lat") is not None and request.args.get("lon") is not None:
+            lat, lon = float(request.args["lat"]), float(request.args["lon"])
+            place, distance = gazetteer.nearest(lat, lon)
+            return jsonify({"timezone": gazetteer.timezone_at(lat, lon), "nearest": place,
+                            "distance_km": round(distance, 1)})
+        query = request.args.get("q", "")
+        if not query:
+            return jsonify({"error": "Missing 'q' or 'lat' and 'lon'"}), 400
+        limit = min(int(request.args.get("limit", 10)), 50)
+        return jsonify({"places": gazetteer.search(query, limit, request.args.get("country"))})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+from admission import Overloaded, admission
 from chat import analyze_user_question, analyze_user_question_stream, generate_next_questions
+from llm_registry import registry
+from sessions import UnknownSession, session_for, sessions
+from sse import SSE_HEADERS, StreamBuffer, parse_last_event_id, streams
+from suggestions import suggestion_service
+
+# Load follow-up suggestions and map the place index up front so the first
+# request is a table lookup, and open LLM connections in the background so
+# they do not delay startup
+suggestion_service.warm()
+if multiprocessing.parent_process() is None:
+    gazetteer.open()
+    registry.warm_in_background()
+
+@app.route("/chat/sessions", methods=["POST"])
+def start_session():
+    """Start a multi-turn session; pass its session_id to /chat and /chat/stream."""
+    try:
+        data = apply_place(request.json)
+        if not data.get("dob") or not data.get("tob"):
+            return jsonify({"error": "Missing 'dob' or 'tob'"}), 400
+        session = sessions.create(data["dob"], data["tob"], data.get("timezone", "Asia/Kolkata"),
+                                  data["lat"], data["lon"], data.get("user_id"))
+        return jsonify({"session_id": session.id})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/chat/sessions/<session_id>", methods=["DELETE"])
+def end_session(session_id):
+    if not sessions.delete(session_id):
+        return jsonify({"error": "Unknown session"}), 404
+    return "", 204
 
 @app.route("/chat", methods=["POST"])
 def astrology_chat():
     try:
-        data = request.json
+        data = apply_place(request.json)
+        session = session_for(data)
+        if session is not None:
+            return jsonify({"response": session.ask(data["question"]), "session_id": session.id})
+
         dob = data["dob"]
         tob = data["tob"]
         timezone = data.get("timezone", "Asia/Kolkata")
@@ -48,32 +164,58 @@ def astrology_chat():
         lon = data["lon"]
         question = data["question"]
 
-        result = analyze_user_question(dob, tob, timezone, lat, lon, question)
+        result = analyze_user_question(dob, tob, timezone, lat, lon, question, data.get("user_id"))
         return jsonify({"response": result})
 
+    except UnknownPlace as e:
+        return jsonify({"error": str(e)}), 400
+    except UnknownSession as e:
+        return jsonify({"error": str(e)}), 404
+    except Overloaded as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/chat/stream", methods=["POST"])
 def astrology_chat_stream():
     try:
-        data = request.json
-        dob = data["dob"]
-        tob = data["tob"]
-        timezone = data.get("timezone", "Asia/Kolkata")
-        lat = data["lat"]
-        lon = data["lon"]
-        question = data["question"]
-
-        def generate():
-            for chunk in analyze_user_question_stream(dob, tob, timezone, lat, lon, question):
-                yield f"data: {chunk}\n\n"
-            yield "data: [DONE]\n\n"
-
-        return app.response_class(generate(), mimetype='text/plain')
-
+        # A reconnecting client sends the id of the last event it saw
+        stream_id, last_seq = parse_last_event_id(request.headers.get("Last-Event-ID"))
+        headers = dict(SSE_HEADERS)
+        if stream_id is not None:
+            buffer = streams.get(stream_id)
+            if buffer is None:
+                return jsonify({"error": "Stream expired, please ask again"}), 410
+        else:
+            # Shed before the 200 and the event stream have started
+            admission.check("chat_stream")
+            data = apply_place(request.json)
+            session = session_for(data)
+            if session is not None:
+                chunks = session.ask_stream(data["question"])
+                headers["X-Session-Id"] = session.id
+            else:
+                dob = data["dob"]
+                tob = data["tob"]
+                timezone = data.get("timezone", "Asia/Kolkata")
+                lat = data["lat"]
+                lon = data["lon"]
+                question = data["question"]
+
+                chunks = analyze_user_question_stream(dob, tob, timezone, lat, lon, question, data.get("user_id"))
+            buffer = streams.add(StreamBuffer().start(chunks))
+
+        return app.response_class(buffer.follow(last_seq), mimetype="text/event-stream",
+                                  headers={**headers, "X-Stream-Id": buffer.id})
+
+    except UnknownPlace as e:
+        return jsonify({"error": str(e)}), 400
+    except UnknownSession as e:
+        return jsonify({"error": str(e)}), 404
+    except Overloaded as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
-        return jsonify({"error": str(e)}), 500   
+        return jsonify({"error": str(e)}), 500
 
 @app.route("/chat/next-questions", methods=["POST"])
 def next_questions():
@@ -85,6 +227,8 @@ def next_questions():
 
         return jsonify({"questions": next_questions})
 
+    except Overloaded as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,168 @@
+"""Lightweight in-process metrics for the chart and chat pipeline.
+
+Counters, gauges and histograms are kept in plain Python objects guarded by a
+lock and rendered in the Prometheus text exposition format by ``render()``,
+which main_server serves at ``/metrics``. Pipeline stages are timed with
+
+    with stage("swisseph"):
+        ...
+
+Metrics are per process: chart jobs that run in chart_engine workers are
+observed from the web process around the job ("chart_compute").
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+REGISTRY = []
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or read from `function` (returning {label values: value}) at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+        self._function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self):
+        if self._function is not None:
+            values = self._function()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """(bucket counts, sum, count) for one label set."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return (list(series[0]), series[1], series[2]) if series else ([0] * len(self.buckets), 0.0, 0)
+
+    def collect(self):
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        lines = []
+        for key, (counts, total, count) in series.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, ("le", bound))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# ===== PIPELINE METRICS =====
+STAGE_SECONDS = Histogram(
+    "astrobot_stage_seconds", "Latency of chart and chat pipeline stages.", ("stage",))
+REQUEST_SECONDS = Histogram(
+    "astrobot_request_seconds", "Total handler latency per route.", ("route", "status"))
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "astrobot_llm_first_token_seconds", "Time from LLM request to the first streamed chunk.", ("endpoint",))
+LLM_GENERATION_SECONDS = Histogram(
+    "astrobot_llm_generation_seconds", "Time from LLM request to the last streamed chunk.",
+    ("endpoint",), buckets=DEFAULT_BUCKETS + (15.0, 30.0, 60.0))
+
+
+@contextmanager
+def stage(name):
+    """Time a block of work as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+def render():
+    """All registered metrics in Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        body = metric.collect()
+        if body:
+            lines.extend(metric.header())
+            lines.extend(body)
+    return "\n".join(lines) + "\n"
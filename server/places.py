@@ -0,0 +1,344 @@
+"""Offline gazetteer: place names to lat/lon/timezone, and coordinates to a timezone.
+
+Places come from places.tsv (major cities plus the principal city of every
+tzdb timezone) or, with ``PLACES_SOURCE``, from a GeoNames ``cities*.txt``
+dump. The first use builds a compact index under ``PLACES_INDEX`` (default
+``cache/places``) and every later process opens it with
+``np.load(mmap_mode='r')``, like the ephemeris table:
+
+    places.npy        one fixed-size record per place (lat, lon, population,
+                      and ids into the string table for name, admin1,
+                      country and timezone)
+    strings.npy       UTF-8 string table, with string_offsets.npy
+    keys.npy          sorted, normalized search keys (S48), with key_rows.npy
+                      (the place of each key) and key_kinds.npy
+                      (0 name, 1 alternate name, 2 later word of the name)
+
+Because the keys are sorted, every key starting with a prefix is one
+contiguous slice found by two binary searches, the flattened equivalent of
+walking a prefix trie, so autocomplete never scans the table. Reverse lookup
+takes the timezone of the nearest place, falling back to the nominal
+``Etc/GMT`` offset for the longitude when nothing is within
+``PLACES_TZ_MAX_KM``. Near borders the nearest city can be across one, so
+explicit timezones in a request always win.
+
+The index is rebuilt automatically when the source file changes, or with:
+
+    python places.py build --source cities15000.txt
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import unicodedata
+
+import numpy as np
+import pytz
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+SOURCE_PATH = os.getenv(
+    "PLACES_SOURCE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "places.tsv"))
+INDEX_DIR = os.getenv("PLACES_INDEX", "cache/places")
+TZ_MAX_KM = float(os.getenv("PLACES_TZ_MAX_KM", "1000"))
+
+KEY_BYTES = 48
+INDEX_VERSION = 1
+EARTH_RADIUS_KM = 6371.0
+
+NAME, ALTERNATE, WORD = 0, 1, 2
+
+PLACE_DTYPE = np.dtype([
+    ("lat", "<f4"), ("lon", "<f4"), ("population", "<u4"),
+    ("name", "<u4"), ("admin1", "<u4"), ("country", "<u4"), ("timezone", "<u4"),
+])
+
+PLACE_LOOKUPS = Counter(
+    "astrobot_place_lookups", "Gazetteer lookups by kind (search, resolve, reverse) and result.",
+    ("kind", "result"))
+
+
+class UnknownPlace(ValueError):
+    """No place in the gazetteer matches the given name."""
+
+
+def normalize_place(text):
+    """ASCII-fold, lowercase and reduce to words: 'São Paulo ' -> 'sao paulo'."""
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return " ".join("".join(c if c.isalnum() else " " for c in folded.lower()).split())
+
+
+# ===== SOURCE =====
+def read_source(path):
+    """Place dicts from the bundled TSV or a GeoNames cities dump (19 columns)."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) == 19:
+                name, ascii_name, alternates, lat, lon = cols[1:6]
+                country, admin1, population, timezone = cols[8], cols[10], cols[14], cols[17]
+            else:
+                name, ascii_name, alternates, lat, lon, country, admin1, population, timezone = cols
+            yield {
+                "name": name,
+                "names": [ascii_name] + [a for a in alternates.split(",") if a],
+                "lat": float(lat),
+                "lon": float(lon),
+                "country": country,
+                "admin1": admin1,
+                "population": int(population or 0),
+                "timezone": timezone,
+            }
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"source": os.path.abspath(path), "source_size": stat.st_size,
+            "source_mtime": stat.st_mtime, "version": INDEX_VERSION}
+
+
+def build_index(source=SOURCE_PATH, directory=INDEX_DIR):
+    """Build the memory-mappable index for `source` in `directory`."""
+    strings, string_ids = [], {}
+
+    def string_id(text):
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    records, keys = [], {}
+    for row, place in enumerate(read_source(source)):
+        records.append((place["lat"], place["lon"], place["population"], string_id(place["name"]),
+                        string_id(place["admin1"]), string_id(place["country"]),
+                        string_id(place["timezone"])))
+        primary = normalize_place(place["name"])
+        candidates = [(primary, NAME)] + [(normalize_place(n), ALTERNATE) for n in place["names"]]
+        words = primary.split()
+        candidates += [(" ".join(words[i:]), WORD) for i in range(1, len(words))]
+        for key, kind in candidates:
+            key = key.encode("ascii")[:KEY_BYTES]
+            # Keep the strongest kind when a place reaches a key more than one way
+            if key and keys.get((key, row), WORD + 1) > kind:
+                keys[(key, row)] = kind
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    ordered = sorted(keys.items())
+    arrays = {
+        "places": np.array(records, dtype=PLACE_DTYPE),
+        "strings": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "string_offsets": offsets,
+        "keys": np.array([key for (key, _), _ in ordered], dtype=f"S{KEY_BYTES}"),
+        "key_rows": np.array([row for (_, row), _ in ordered], dtype="<u4"),
+        "key_kinds": np.array([kind for _, kind in ordered], dtype=np.uint8),
+    }
+
+    # Write next to the live files and swap them in, so concurrent readers
+    # (or a second worker building at the same time) never see a partial index
+    os.makedirs(directory, exist_ok=True)
+    suffix = f".{os.getpid()}.tmp"
+    for name, array in arrays.items():
+        path = os.path.join(directory, f"{name}.npy")
+        with open(path + suffix, "wb") as f:
+            np.save(f, array)
+        os.replace(path + suffix, path)
+    meta = {**_source_stamp(source), "places": len(records), "keys": len(ordered)}
+    meta_path = os.path.join(directory, "meta.json")
+    with open(meta_path + suffix, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + suffix, meta_path)
+    logger.info("Built place index: %d places, %d keys", meta["places"], meta["keys"])
+    return meta
+
+
+# ===== LOOKUPS =====
+class Gazetteer:
+    def __init__(self, directory=INDEX_DIR, source=SOURCE_PATH):
+        self.directory = directory
+        self.source = source
+        self.meta = None
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        try:
+            with open(os.path.join(self.directory, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return True
+        return {k: meta.get(k) for k in _source_stamp(self.source)} != _source_stamp(self.source)
+
+    def open(self):
+        """Map the index, building it first if it is missing or out of date."""
+        with self._lock:
+            if self.meta is not None:
+                return self
+            if self._stale():
+                build_index(self.source, self.directory)
+
+            def load(name):
+                return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+            self.places = load("places")
+            self._strings = load("strings")
+            self._offsets = load("string_offsets")
+            self._keys = load("keys")
+            self._key_rows = load("key_rows")
+            self._key_kinds = load("key_kinds")
+            self._lat = np.radians(self.places["lat"].astype(np.float64))
+            self._lon = np.radians(self.places["lon"].astype(np.float64))
+            with open(os.path.join(self.directory, "meta.json")) as f:
+                self.meta = json.load(f)
+        return self
+
+    def _string(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+    def place(self, row):
+        record = self.places[row]
+        country = self._string(record["country"])
+        return {
+            "name": self._string(record["name"]),
+            "admin1": self._string(record["admin1"]),
+            "country": country,
+            "country_name": pytz.country_names.get(country.lower(), country),
+            "lat": round(float(record["lat"]), 4),
+            "lon": round(float(record["lon"]), 4),
+            "timezone": self._string(record["timezone"]),
+            "population": int(record["population"]),
+        }
+
+    def _matches(self, key, prefix=True):
+        """Rows for `key` (or every key starting with it), best match first."""
+        self.open()
+        lo = np.searchsorted(self._keys, key, "left")
+        if not prefix:
+            hi = np.searchsorted(self._keys, key, "right")
+        else:
+            # The first key past the prefix: its last byte incremented, which
+            # still fits the fixed-width key array (appending a byte would be
+            # truncated away for a full-width prefix)
+            stripped = key.rstrip(b"\xff")
+            end = stripped[:-1] + bytes([stripped[-1] + 1]) if stripped else None
+            hi = np.searchsorted(self._keys, end, "left") if end else len(self._keys)
+        rows = self._key_rows[lo:hi]
+        if not len(rows):
+            return rows
+        # Exact key first, then names before alternates before later words,
+        # then the most populous place
+        inexact = self._keys[lo:hi] != key
+        population = self.places["population"][rows].astype(np.int64)
+        order = np.lexsort((-population, self._key_kinds[lo:hi], inexact))
+        rows = rows[order]
+        _, first = np.unique(rows, return_index=True)
+        return rows[np.sort(first)]
+
+    def _in_country(self, rows, country):
+        if not country:
+            return rows
+        countries = [self._string(self.places[row]["country"]) for row in rows]
+        return [row for row, code in zip(rows, countries) if code.upper() == country.upper()]
+
+    def search(self, query, limit=10, country=None):
+        """Places whose name (or a later word of it) starts with `query`."""
+        key = normalize_place(query).encode("ascii")[:KEY_BYTES]
+        rows = self._in_country(self._matches(key), country) if key else []
+        PLACE_LOOKUPS.inc(kind="search", result="hit" if len(rows) else "miss")
+        return [self.place(row) for row in rows[:limit]]
+
+    def resolve(self, text):
+        """The best place for 'Name[, admin1][, country]'; raises UnknownPlace."""
+        name, *qualifiers = [part.strip() for part in text.split(",") if part.strip()] or [""]
+        key = normalize_place(name).encode("ascii")[:KEY_BYTES]
+        qualifiers = [normalize_place(q) for q in qualifiers]
+        if key:
+            for prefix in (False, True):
+                for row in self._matches(key, prefix):
+                    place = self.place(row)
+                    labels = {normalize_place(place[f]) for f in ("admin1", "country", "country_name")}
+                    if all(q in labels for q in qualifiers):
+                        PLACE_LOOKUPS.inc(kind="resolve", result="hit")
+                        return place
+        PLACE_LOOKUPS.inc(kind="resolve", result="miss")
+        raise UnknownPlace(f"Unknown place: {text!r}")
+
+    def nearest(self, lat, lon):
+        """(place, distance in km) for the place closest to lat/lon."""
+        lat, lon = float(lat), float(lon)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"Coordinates out of range: {lat}, {lon}")
+        self.open()
+        phi, lam = np.radians(lat), np.radians(lon)
+        h = (np.sin((self._lat - phi) / 2) ** 2
+             + np.cos(phi) * np.cos(self._lat) * np.sin((self._lon - lam) / 2) ** 2)
+        row = int(np.argmin(h))
+        return self.place(row), float(2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h[row])))
+
+    def timezone_at(self, lat, lon):
+        """IANA timezone for coordinates: the nearest place's, else a nominal Etc/GMT zone."""
+        place, distance = self.nearest(lat, lon)
+        if distance <= TZ_MAX_KM:
+            PLACE_LOOKUPS.inc(kind="reverse", result="hit")
+            return place["timezone"]
+        PLACE_LOOKUPS.inc(kind="reverse", result="miss")
+        # Etc/GMT names are sign-inverted: Etc/GMT-5 is UTC+5
+        hours = round(float(lon) / 15)
+        return f"Etc/GMT{-hours:+d}" if hours else "Etc/GMT"
+
+
+gazetteer = Gazetteer()
+
+
+def apply_place(data):
+    """Request body with its optional `place` resolved into lat, lon and timezone.
+
+    Coordinates or a timezone the client sent explicitly win over the place's.
+    """
+    if not data or not data.get("place"):
+        return data
+    has_coords = data.get("lat") is not None and data.get("lon") is not None
+    if has_coords and data.get("timezone"):
+        return data
+    place = gazetteer.resolve(data["place"])
+    resolved = dict(data)
+    if not has_coords:
+        resolved["lat"], resolved["lon"] = place["lat"], place["lon"]
+    if not data.get("timezone"):
+        resolved["timezone"] = place["timezone"]
+    return resolved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline place index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the index from a places file")
+    build.add_argument("--source", default=SOURCE_PATH)
+    build.add_argument("--out", default=INDEX_DIR)
+    search = sub.add_parser("search", help="prefix search")
+    search.add_argument("query")
+    search.add_argument("--country")
+    search.add_argument("--limit", type=int, default=10)
+    reverse = sub.add_parser("reverse", help="timezone and nearest place for coordinates")
+    reverse.add_argument("lat", type=float)
+    reverse.add_argument("lon", type=float)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(json.dumps(build_index(args.source, args.out), indent=2))
+    elif args.command == "search":
+        print(json.dumps(gazetteer.search(args.query, args.limit, args.country), indent=2, ensure_ascii=False))
+    else:
+        place, distance = gazetteer.nearest(args.lat, args.lon)
+        print(json.dumps({"timezone": gazetteer.timezone_at(args.lat, args.lon), "nearest": place,
+                          "distance_km": round(distance, 1)}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Backfill the chart store for a file of births.
+
+    python precompute.py users.jsonl
+    python precompute.py users.csv --batch 1024 --force
+
+Input is JSONL or CSV, like reports.py: dob, tob, timezone, lat and lon (or
+place) per record, and user_id for registered users, whose ids are linked to
+their chart. Births whose chart is already stored are skipped unless --force
+is given, so an interrupted backfill is resumed by running it again.
+
+Records are read as a stream, --batch at a time; each batch's charts are
+computed in one chart_engine.compute_batch call (split across the worker
+pool) and written in one transaction, so the backfill can run next to live
+servers sharing the same store. A JSON summary is printed at the end.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import combined
+from chart_engine import get_engine
+from chart_store import chart_store, store_key
+from chat import get_birth_utc
+from places import apply_place
+from reports import batched, read_records
+
+logger = logging.getLogger("precompute")
+
+
+def precompute_batch(batch, force=False):
+    """Store the charts for one batch of records; (stored, skipped, failed) counts."""
+    births, failed = [], 0
+    for record in batch:
+        try:
+            record = apply_place(record)
+            birth_utc = get_birth_utc(record["dob"], record["tob"], record.get("timezone", "Asia/Kolkata"))
+            lat, lon = float(record["lat"]), float(record["lon"])
+        except (KeyError, ValueError) as e:
+            failed += 1
+            logger.warning("Record %s skipped: %r", record["id"], e)
+            continue
+        fingerprint = store_key(combined.chart_fingerprint(birth_utc, lat, lon))
+        births.append((record.get("user_id"), fingerprint, birth_utc, lat, lon))
+
+    missing = {b[1] for b in births} if force else chart_store.missing(b[1] for b in births)
+    todo = [b for b in births if b[1] in missing]
+    # Already stored charts still get their users linked
+    chart_store.link_users([(user_id, fingerprint) for user_id, fingerprint, *_ in births
+                            if fingerprint not in missing and user_id is not None])
+    if todo:
+        charts = get_engine().compute_batch([b[2] for b in todo], [b[3] for b in todo], [b[4] for b in todo])
+        chart_store.put_many([(fingerprint, result.chart.to_bytes(), user_id)
+                              for (user_id, fingerprint, *_), result in zip(todo, charts)])
+    return len(todo), len(births) - len(todo), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the chart store for a file of births")
+    parser.add_argument("input", help="JSONL or CSV of births")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: by extension)")
+    parser.add_argument("--batch", type=int, default=512, help="births per chart batch and transaction")
+    parser.add_argument("--force", action="store_true", help="recompute charts that are already stored")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    if not chart_store.enabled:
+        parser.error("the chart store is disabled (CHART_STORE_PATH is empty)")
+
+    totals = {"stored": 0, "skipped": 0, "failed": 0}
+    started = time.monotonic()
+    try:
+        for n, batch in enumerate(batched(read_records(args.input, args.format), args.batch), 1):
+            for name, count in zip(totals, precompute_batch(batch, args.force)):
+                totals[name] += count
+            logger.info("Batch %d: %d stored, %d already stored, %d failed so far",
+                        n, totals["stored"], totals["skipped"], totals["failed"])
+    except KeyboardInterrupt:
+        logger.info("Interrupted; run the same command again to resume")
+        sys.exit(130)
+    finally:
+        get_engine().shutdown()
+    elapsed = time.monotonic() - started
+    summary = {**totals, "seconds": round(elapsed, 1),
+               "charts_per_second": round(totals["stored"] / elapsed, 1) if elapsed else None,
+               "store": chart_store.stats()}
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if totals["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
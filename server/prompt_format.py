@@ -0,0 +1,122 @@
+"""Chart-to-text encodings used in LLM prompts.
+
+``verbose`` is the original prose layout: every house and every house lord
+of every chart on its own line, "House N: None" included.
+
+``compact`` carries the same facts in a dense tabular form:
+
+    * empty houses are omitted, and the ascendant is given once per chart
+      instead of as an occupant of house 1
+    * house signs are not repeated: houses are whole-sign, so house N is the
+      Nth sign from the ascendant, which the legend states once for all vargas
+    * lords are grouped by planet ("Jupiter 7,10>1" = Jupiter rules houses 7
+      and 10 and sits in house 1), so a planet ruling two houses is one entry
+
+Pick the default with ``PROMPT_ENCODING`` (``verbose`` or ``compact``);
+``python benchmarks/prompt_tokens.py`` compares the two.
+"""
+import os
+
+ENCODINGS = ("verbose", "compact")
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "verbose")
+
+COMPACT_LEGEND = (
+    "Legend: whole-sign houses, house N is the Nth sign counted from the ascendant "
+    "(Aries Taurus Gemini Cancer Leo Virgo Libra Scorpio Sagittarius Capricorn Aquarius Pisces). "
+    "Only occupied houses are listed. Lords: planet ruled houses>house it occupies."
+)
+
+
+# ===== VERBOSE =====
+def _verbose_chart(chart_name, chart):
+    lines = [f"**{chart_name} Chart**"]
+    asc = chart.get("ascendant", "Unknown")
+    lines.append(f"Ascendant: {asc}")
+    lines.append("House Positions:")
+    for house, planets in chart.get("chart", {}).items():
+        planet_list = ', '.join(planets) if planets else 'None'
+        lines.append(f"  House {house}: {planet_list}")
+    lines.append("House Lords:")
+    for house, details in chart.get("lords", {}).items():
+        lines.append(
+            f"  House {house}: Lord is {details['lord']} placed in House {details['lord_house']} ({details['sign']})"
+        )
+    return "\n".join(lines)
+
+
+def _verbose_planets(planets):
+    lines = ["**Planetary Positions (D1)**"]
+    for planet, info in planets.items():
+        lines.append(
+            f"  {planet}: {info['sign']} {round(info['degree'], 2)}°, "
+            f"Nakshatra: {info['nakshatra']} Pada {info['pada']}"
+        )
+    return "\n".join(lines)
+
+
+def format_verbose(chart_data, charts_needed):
+    sections = []
+
+    # Always add planetary data from D1
+    if 'planets' in chart_data:
+        sections.append(_verbose_planets(chart_data["planets"]))
+
+    for chart_key in charts_needed:
+        if chart_key.lower() in chart_data:
+            sections.append(_verbose_chart(chart_key.upper(), chart_data[chart_key.lower()]))
+
+    return "\n\n".join(sections)
+
+
+# ===== COMPACT =====
+def _compact_planets(planets):
+    entries = [
+        f"{planet} {info['sign']} {info['degree'] % 30:.2f} {info['nakshatra']} {info['pada']}"
+        for planet, info in planets.items()
+    ]
+    return "Planets (D1 sign, degree in sign, nakshatra, pada): " + "; ".join(entries)
+
+
+def _compact_chart(chart_name, chart):
+    parts = [f"{chart_name} asc {chart.get('ascendant', 'Unknown')}."]
+
+    houses = chart.get("chart", {})
+    if houses:
+        occupied = []
+        for house, planets in houses.items():
+            planets = [p for p in planets if p != "Ascendant"]
+            if planets:
+                occupied.append(f"{house} {','.join(planets)}")
+        parts.append("Houses: " + "; ".join(occupied) + ".")
+
+    lords = chart.get("lords", {})
+    if lords:
+        # lord -> (houses ruled, house occupied), in order of first ruled house
+        grouped = {}
+        for house, details in lords.items():
+            ruled, _ = grouped.setdefault(details["lord"], ([], details["lord_house"]))
+            ruled.append(str(house))
+        parts.append("Lords: " + "; ".join(
+            f"{lord} {','.join(ruled)}>{placed}" for lord, (ruled, placed) in grouped.items()) + ".")
+
+    return " ".join(parts)
+
+
+def format_compact(chart_data, charts_needed):
+    sections = [COMPACT_LEGEND]
+    if 'planets' in chart_data:
+        sections.append(_compact_planets(chart_data["planets"]))
+    for chart_key in charts_needed:
+        if chart_key.lower() in chart_data:
+            sections.append(_compact_chart(chart_key.upper(), chart_data[chart_key.lower()]))
+    return "\n".join(sections)
+
+
+def format_chart(chart_data, charts_needed, encoding=None):
+    """Encode the requested charts of `chart_data` for a prompt."""
+    encoding = encoding or PROMPT_ENCODING
+    if encoding == "compact":
+        return format_compact(chart_data, charts_needed)
+    if encoding == "verbose":
+        return format_verbose(chart_data, charts_needed)
+    raise ValueError(f"Unsupported prompt encoding: {encoding}")
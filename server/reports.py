@@ -0,0 +1,286 @@
+"""Resumable bulk readings for a file of births.
+
+    python reports.py births.jsonl --out readings.jsonl
+    python reports.py births.csv --out readings.jsonl --concurrency 8 --rate 120
+
+Input is JSONL or CSV (by extension, or --format), one birth per record:
+id, dob, tob, timezone, lat and lon (or place, resolved through the
+gazetteer), and optionally question. Records without an id are numbered by
+position. Records without a question get --question.
+
+Records are read as a stream, --chart-batch at a time, and each group's
+charts are computed in one chart_engine.compute_batch call. Readings are
+generated --concurrency at a time, at most --rate a minute. They go through
+the answer cache and the admission controller (at "report" priority, and
+retried when shed) like /chat answers. Each reading is appended to --out as
+{"id", "question", "reading"} as soon as it completes.
+
+The checkpoint (--checkpoint, default <out>.checkpoint) gets one line per
+finished record: its id and the size of --out once its reading was written.
+A rerun after a crash or Ctrl-C skips the ids listed there. It first
+truncates --out to the last recorded size, dropping any reading written but
+not checkpointed, so every record appears in --out exactly once. Failed
+records are logged, left out of both files and retried by the next run, and
+the exit code is 1 if any failed.
+
+Progress (records done, throughput, estimated time to completion) is logged
+every --progress seconds, and a JSON summary is printed at the end.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from admission import Overloaded
+from chart_engine import get_engine
+from chat import cached_stream_async, determine_required_charts, get_birth_utc, render_prompt
+from llm_registry import registry
+from places import apply_place
+
+logger = logging.getLogger("reports")
+
+DEFAULT_QUESTION = ("Give me a general reading of my chart: personality, career, relationships "
+                    "and health in the coming year.")
+# Attempts per reading while the admission controller sheds it
+MAX_ATTEMPTS = 5
+
+
+# ===== INPUT =====
+def read_records(path, fmt=None):
+    """Yield the births in a JSONL or CSV file as dicts with a string id."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(f) if fmt == "csv" else (json.loads(line) for line in f if line.strip())
+        for n, row in enumerate(rows, 1):
+            # Empty CSV cells count as missing
+            record = {key: value for key, value in row.items() if value not in ("", None)}
+            record["id"] = str(record.get("id", n))
+            yield record
+
+
+def batched(records, size):
+    records = iter(records)
+    while batch := list(itertools.islice(records, size)):
+        yield batch
+
+
+# ===== CHECKPOINT =====
+class Checkpoint:
+    """Finished record ids, appended as JSON [id, output size] lines."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.size = 0
+        torn = False
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    # A line without its newline was cut off mid-write
+                    torn = not line.endswith("\n")
+                    try:
+                        record_id, size = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not torn:
+                        self.done.add(record_id)
+                        self.size = size
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+
+    def mark(self, record_id, size):
+        self._file.write(json.dumps([record_id, size]) + "\n")
+        self._file.flush()
+        self.done.add(record_id)
+        self.size = size
+
+    def close(self):
+        self._file.close()
+
+
+def open_output(path, size):
+    """Open the output for appending, cut back to the last checkpointed size."""
+    existing = os.path.getsize(path) if os.path.exists(path) else 0
+    if existing < size:
+        raise ValueError(f"{path} is shorter than its checkpoint records; "
+                         "delete the checkpoint to start over")
+    out = open(path, "r+b" if existing else "wb")
+    out.truncate(size)
+    out.seek(size)
+    if existing > size:
+        logger.info("Dropped %d bytes of unfinished readings from %s", existing - size, path)
+    return out
+
+
+# ===== PACING =====
+class RateLimiter:
+    """At most `per_minute` starts a minute, evenly spaced; no limit when 0."""
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute if per_minute else 0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class Progress:
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.written = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.written / elapsed if elapsed else 0.0
+        remaining = self.total - self.skipped - self.written - self.failed
+        return {"records": self.total, "skipped": self.skipped, "written": self.written,
+                "failed": self.failed, "remaining": remaining, "seconds": round(elapsed, 1),
+                "records_per_second": round(rate, 3),
+                "eta_seconds": round(remaining / rate, 1) if rate else None}
+
+    def log(self):
+        s = self.summary()
+        eta = f"{s['eta_seconds']:.0f}s" if s["eta_seconds"] is not None else "unknown"
+        logger.info("%d/%d records done (%d skipped, %d failed), %.2f records/s, ETA %s",
+                    s["skipped"] + s["written"], s["records"], s["skipped"], s["failed"],
+                    s["records_per_second"], eta)
+
+
+# ===== JOB =====
+def prepare(batch, default_question):
+    """(record, prompt, key) for the records of a batch whose charts could be computed, and the failures."""
+    births, failed = [], []
+    for record in batch:
+        try:
+            record = apply_place(record)
+            birth_utc = get_birth_utc(record["dob"], record["tob"], record.get("timezone", "Asia/Kolkata"))
+            births.append((record, birth_utc, float(record["lat"]), float(record["lon"])))
+        except (KeyError, ValueError) as e:
+            failed.append((record["id"], f"bad record: {e!r}"))
+    if not births:
+        return [], failed
+
+    charts = get_engine().compute_batch([b[1] for b in births], [b[2] for b in births], [b[3] for b in births])
+    jobs = []
+    for (record, _, lat, lon), chart in zip(births, charts):
+        question = record.get("question", default_question)
+        prompt, key = render_prompt(chart, determine_required_charts(question), record["dob"], record["tob"],
+                                    record.get("timezone", "Asia/Kolkata"), lat, lon, question)
+        jobs.append((record, question, prompt, key))
+    return jobs, failed
+
+
+async def generate(prompt, key):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return "".join([chunk async for chunk in cached_stream_async(prompt, key, "report")])
+        except Overloaded as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.info("Provider busy, retrying in %ss", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+
+
+async def run(args):
+    checkpoint = Checkpoint(args.checkpoint or f"{args.out}.checkpoint")
+    out = open_output(args.out, checkpoint.size)
+    total = skipped = 0
+    for record in read_records(args.input, args.format):
+        total += 1
+        skipped += record["id"] in checkpoint.done
+    progress = Progress(total, skipped)
+    limiter = RateLimiter(args.rate)
+    queue = asyncio.Queue(maxsize=args.chart_batch)
+    loop = asyncio.get_running_loop()
+
+    def fail(record_id, reason):
+        progress.failed += 1
+        logger.warning("Record %s failed: %s", record_id, reason)
+
+    async def produce():
+        pending = (record for record in read_records(args.input, args.format)
+                   if record["id"] not in checkpoint.done)
+        for batch in batched(pending, args.chart_batch):
+            # Chart batches are CPU-bound, so they run off the loop while readings stream
+            jobs, failed = await loop.run_in_executor(None, prepare, batch, args.question)
+            for record_id, reason in failed:
+                fail(record_id, reason)
+            for job in jobs:
+                await queue.put(job)
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def work():
+        while (job := await queue.get()) is not None:
+            record, question, prompt, key = job
+            await limiter.wait()
+            try:
+                reading = await generate(prompt, key)
+            except Exception as e:
+                fail(record["id"], repr(e))
+                continue
+            line = json.dumps({"id": record["id"], "question": question, "reading": reading}, ensure_ascii=False)
+            out.write(line.encode("utf-8") + b"\n")
+            out.flush()
+            checkpoint.mark(record["id"], out.tell())
+            progress.written += 1
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(args.progress)
+            progress.log()
+
+    reporter = asyncio.ensure_future(report_progress())
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+    finally:
+        reporter.cancel()
+        out.close()
+        checkpoint.close()
+        progress.log()
+    return progress.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable bulk readings for a file of births")
+    parser.add_argument("input", help="JSONL or CSV of births")
+    parser.add_argument("--out", required=True, help="JSONL of readings, appended to")
+    parser.add_argument("--checkpoint", help="finished record ids (default <out>.checkpoint)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: by extension)")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="question for records without one")
+    parser.add_argument("--concurrency", type=int, default=8, help="readings generated at once")
+    parser.add_argument("--rate", type=float, default=0, help="max readings started per minute (0: no limit)")
+    parser.add_argument("--chart-batch", type=int, default=256, help="births per chart batch")
+    parser.add_argument("--progress", type=float, default=10, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    registry.warm_in_background()
+    try:
+        summary = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        logger.info("Interrupted; run the same command again to resume")
+        sys.exit(130)
+    finally:
+        get_engine().shutdown()
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
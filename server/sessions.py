@@ -0,0 +1,298 @@
+"""Multi-turn chat sessions.
+
+A stateless /chat call computes and formats the chart for every question and
+the model never sees earlier turns. A session is created once per birth:
+
+    POST /chat/sessions {"dob", "tob", "timezone", "lat", "lon"} -> {"session_id"}
+    POST /chat {"session_id", "question"}      (and /chat/stream)
+
+and every turn's prompt is laid out as
+
+    prefix    instructions, birth details and chart text, built once per
+              session and byte-identical from turn to turn
+    summary   the model's summary of turns that no longer fit the budget
+    history   the most recent turns, newest last, within
+              SESSION_HISTORY_TOKENS (estimated at 4 characters a token)
+    question
+
+A question that needs a chart the session has not sent yet appends that
+chart to the prefix, so the prefix only ever grows at its end. Keeping it
+stable is what lets the providers' prefix caches (Gemini 2.x and OpenAI
+cache repeated prompt prefixes automatically) skip the chart tokens on
+follow-ups; the chart context is too small for Gemini's explicit
+CachedContent minimum, so no cache objects are created.
+
+When the stored turns outgrow the budget, the oldest ones are folded into
+the summary by an LLM call on a background thread; the turn that triggered
+it does not wait. Sessions live in memory for SESSION_TTL seconds after
+their last use, at most SESSION_MAX of them, so like SSE resumes they need
+sticky routing behind several workers. Session turns bypass the answer
+cache: with history in the prompt, the same question can deserve a
+different answer.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from admission import admission
+from chat import answer_flights, answer_flights_async, determine_required_charts, format_chart_for_llm, get_birth_utc, stream_llm, stream_llm_async
+from combined import get_chart_details_cached
+from llm_router import get_router
+from metrics import Counter, Gauge, stage
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1500"))
+SUMMARY_WORDS = int(os.getenv("SESSION_SUMMARY_WORDS", "150"))
+# Turns kept verbatim even when they alone exceed the budget
+MIN_RECENT_TURNS = 1
+
+SESSION_PREFIX = """You are a learned Vedic astrologer. A user has provided their birth chart data.
+Use the data below to answer their questions in an ongoing conversation.
+
+Date of Birth: {dob}
+Time of Birth: {tob}
+Location: lat={lat}, lon={lon}, Timezone={timezone}
+
+Chart Data:
+{chart_text}
+"""
+
+SESSION_SUMMARY_PROMPT = """Summarize this conversation between a user and a Vedic astrologer in at most {words} words.
+Keep what was said about the user's chart and life and the advice that was given.
+
+{conversation}
+"""
+
+SESSION_TURNS = Counter(
+    "astrobot_session_turns", "Chat session turns, by whether the chart prefix was reused unchanged.", ("prefix",))
+SESSION_PROMPT_TOKENS = Counter(
+    "astrobot_session_prompt_tokens", "Estimated prompt tokens sent on session turns, by prompt part.", ("part",))
+SESSION_SUMMARIES = Counter(
+    "astrobot_session_summaries", "Background history summaries by outcome.", ("outcome",))
+
+
+def estimate_tokens(text):
+    return -(-len(text) // 4)
+
+
+class Turn:
+    __slots__ = ("question", "answer", "tokens")
+
+    def __init__(self, question, answer):
+        self.question = question
+        self.answer = answer
+        self.tokens = estimate_tokens(question) + estimate_tokens(answer)
+
+    def render(self):
+        return f"User: {self.question}\nAstrologer: {self.answer}"
+
+
+class Session:
+    def __init__(self, dob, tob, timezone, lat, lon, history_tokens=HISTORY_TOKENS, user_id=None):
+        self.id = uuid.uuid4().hex
+        self.dob, self.tob, self.timezone, self.lat, self.lon = dob, tob, timezone, lat, lon
+        self.user_id = user_id
+        self.birth_utc = get_birth_utc(dob, tob, timezone)
+        self.history_tokens = history_tokens
+        self.charts = []
+        self.prefix = None
+        self.summary = ""
+        self.turns = []
+        self.summarizing = False
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+        # Compute the chart up front; later questions only add chart sections
+        self._extend_prefix(determine_required_charts(""))
+
+    # ===== PROMPT =====
+    def _extend_prefix(self, charts_needed):
+        """Add charts this session has not sent yet; True if the prefix changed."""
+        missing = [chart for chart in charts_needed if chart not in self.charts]
+        if not missing and self.prefix is not None:
+            return False
+        self.charts.extend(missing)
+        chart_data = get_chart_details_cached(
+            self.birth_utc, self.lat, self.lon, charts=[chart.lower() for chart in self.charts],
+            user_id=self.user_id)
+        with stage("format_prompt"):
+            chart_text = format_chart_for_llm(chart_data, self.charts)
+        self.prefix = SESSION_PREFIX.format(dob=self.dob, tob=self.tob, lat=self.lat, lon=self.lon,
+                                            timezone=self.timezone, chart_text=chart_text)
+        return True
+
+    def _recent_turns(self):
+        """The newest turns that fit the history budget, oldest first."""
+        recent, used = [], 0
+        for turn in reversed(self.turns):
+            if len(recent) >= MIN_RECENT_TURNS and used + turn.tokens > self.history_tokens:
+                break
+            recent.append(turn)
+            used += turn.tokens
+        return recent[::-1]
+
+    def prompt(self, question):
+        with stage("route_charts"):
+            charts_needed = determine_required_charts(question)
+        with self._lock:
+            changed = self._extend_prefix(charts_needed)
+            summary = self.summary
+            history = "\n\n".join(turn.render() for turn in self._recent_turns())
+            prefix = self.prefix
+
+        parts = [prefix]
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}\n")
+        if history:
+            parts.append(f"Recent conversation:\n{history}\n")
+        parts.append(f"User Question:\n\"{question}\"\n\n"
+                     "Please answer clearly and concisely in astrological terms. contemplate and answer.\n")
+
+        SESSION_TURNS.inc(prefix="new" if changed else "reused")
+        SESSION_PROMPT_TOKENS.inc(estimate_tokens(prefix), part="prefix")
+        SESSION_PROMPT_TOKENS.inc(estimate_tokens(summary) + estimate_tokens(history), part="history")
+        SESSION_PROMPT_TOKENS.inc(estimate_tokens(question), part="question")
+        return "\n".join(parts)
+
+    # ===== HISTORY =====
+    def record(self, question, answer):
+        """Store a completed turn and fold older turns into the summary if over budget."""
+        with self._lock:
+            self.turns.append(Turn(question, answer))
+            self.last_used = time.monotonic()
+            overflow = len(self.turns) - len(self._recent_turns())
+            if overflow <= 0 or self.summarizing:
+                return
+            self.summarizing = True
+            folded = self.turns[:overflow]
+            previous = self.summary
+        threading.Thread(target=self._summarize, args=(previous, folded), daemon=True).start()
+
+    def _summarize(self, previous, folded):
+        conversation = "\n\n".join(turn.render() for turn in folded)
+        if previous:
+            conversation = f"Earlier summary: {previous}\n\n{conversation}"
+        try:
+            prompt = SESSION_SUMMARY_PROMPT.format(words=SUMMARY_WORDS, conversation=conversation)
+            summary = "".join(admission.stream("summary", prompt, get_router().stream)).strip()
+        except Exception as e:
+            # The folded turns stay stored (but out of the prompt) and are retried next turn
+            logger.warning("Session %s summary failed: %s", self.id, e)
+            SESSION_SUMMARIES.inc(outcome="error")
+            with self._lock:
+                self.summarizing = False
+            return
+        with self._lock:
+            self.summary = summary
+            # Turns recorded while the summary ran are still after the folded ones
+            del self.turns[:len(folded)]
+            self.summarizing = False
+        SESSION_SUMMARIES.inc(outcome="done")
+
+    # ===== ASKING =====
+    def ask_stream(self, question, endpoint="chat_stream"):
+        """Stream the answer to one turn; the turn is recorded once it completes.
+
+        The same question asked again while its answer is still streaming
+        (a double submit or a retry) joins that answer instead of adding a turn.
+        """
+        return answer_flights.stream(("session", self.id, question), lambda: self._answer(question, endpoint))
+
+    def _answer(self, question, endpoint):
+        prompt = self.prompt(question)
+        chunks = []
+        for chunk in stream_llm(prompt, endpoint):
+            chunks.append(chunk)
+            yield chunk
+        self.record(question, "".join(chunks))
+
+    def ask(self, question):
+        return "".join(self.ask_stream(question, "chat"))
+
+    def ask_stream_async(self, question, endpoint="chat_stream"):
+        return answer_flights_async.stream(("session", self.id, question),
+                                           lambda: self._answer_async(question, endpoint))
+
+    async def _answer_async(self, question, endpoint):
+        # Extending the prefix may compute a chart, so build the prompt off the loop
+        prompt = await asyncio.get_running_loop().run_in_executor(None, self.prompt, question)
+        chunks = []
+        async for chunk in stream_llm_async(prompt, endpoint):
+            chunks.append(chunk)
+            yield chunk
+        self.record(question, "".join(chunks))
+
+    async def ask_async(self, question):
+        return "".join([chunk async for chunk in self.ask_stream_async(question, "chat")])
+
+
+class SessionStore:
+    """Live sessions by id, dropped SESSION_TTL seconds after their last use."""
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, dob, tob, timezone, lat, lon, user_id=None):
+        """Start a session, computing (or loading) the chart and its prompt prefix now."""
+        session = Session(dob, tob, timezone, lat, lon, user_id=user_id)
+        now = time.monotonic()
+        with self._lock:
+            for session_id in [k for k, s in self._sessions.items() if now - s.last_used > self.ttl]:
+                del self._sessions[session_id]
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or time.monotonic() - session.last_used > self.ttl:
+                return None
+            self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+sessions = SessionStore()
+
+Gauge("astrobot_chat_sessions", "Chat sessions held in memory.", function=lambda: {(): len(sessions)})
+
+
+class UnknownSession(LookupError):
+    """The session id is unknown or the session expired."""
+
+
+def session_for(data):
+    """The session a chat request belongs to, or None for a stateless request.
+
+    An unknown or expired session_id starts a new session when the request
+    still carries the birth details, so clients can always send both.
+    """
+    session_id = data.get("session_id")
+    if not session_id:
+        return None
+    session = sessions.get(session_id)
+    if session is not None:
+        return session
+    if not data.get("dob") or not data.get("tob") or data.get("lat") is None or data.get("lon") is None:
+        raise UnknownSession("Session expired, please start a new one")
+    return sessions.create(data["dob"], data["tob"], data.get("timezone", "Asia/Kolkata"),
+                           data["lat"], data["lon"], data.get("user_id"))
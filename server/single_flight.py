@@ -0,0 +1,280 @@
+"""Single-flight coalescing of identical in-flight work.
+
+A double-submitted form or a client retry sends the same request twice while
+the first is still running. Each coalescing group maps a key (a chart
+fingerprint, an answer key, a normalized question) to the work in flight for
+it: the first caller runs it, callers with the same key that arrive before it
+finishes wait for and share its outcome, and the key is forgotten as soon as
+the work completes, so later calls start afresh (and hit the caches the
+leader filled).
+
+    charts = SingleFlight("chart")
+    chart = charts.do(fingerprint, lambda: compute(...))
+
+    answers = SingleFlight("answer")
+    for chunk in answers.stream(key, lambda: llm_chunks(prompt)):
+        ...
+
+For streams, the upstream iterator runs once on a pump, like sse.py's
+buffers, and every subscriber replays it from the first chunk, whether it
+joined before or after that chunk arrived. The upstream is cancelled only
+when every subscriber has gone; on threads, a subscriber blocked here is
+woken by its own CancelToken and the upstream pump is stopped through the
+shared one (cancellation.py). SingleFlight serves threads (Flask),
+AsyncSingleFlight coroutines on one event loop (ASGI). Coalescing is per
+process.
+"""
+import asyncio
+import threading
+
+from cancellation import CancelToken, Cancelled, bound, current
+from metrics import Counter
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "astrobot_single_flight_calls", "Coalesced work by group and role: leader runs it, follower shares it.",
+    ("flight", "role"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# ===== THREADED =====
+class _SharedStream:
+    """Chunks of one upstream iterator, pumped on a daemon thread and replayed to each subscriber."""
+
+    def __init__(self, on_finish):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.subscribers = 0
+        self._cond = threading.Condition()
+        self._token = CancelToken()
+        self._on_finish = on_finish
+
+    def start(self, make_chunks):
+        threading.Thread(target=self._pump, args=(make_chunks,), daemon=True).start()
+        return self
+
+    def _pump(self, make_chunks):
+        error = None
+        upstream = None
+        try:
+            with bound(self._token):
+                upstream = make_chunks()
+                for chunk in upstream:
+                    if self.cancelled:
+                        break
+                    with self._cond:
+                        self.chunks.append(chunk)
+                        self._cond.notify_all()
+        except Cancelled:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(upstream, "close", None)
+            if close is not None:
+                close()
+            self._on_finish(self)
+            with self._cond:
+                self.done = True
+                self.error = error
+                self._cond.notify_all()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def subscribe(self):
+        # Counted once iteration starts, so a generator that is never iterated
+        # (and never reaches the finally below) cannot pin the upstream
+        with self._cond:
+            self.subscribers += 1
+        seq = 0
+        # The caller's own token (e.g. its SSE buffer's) wakes it when it is cancelled
+        token = current()
+        unregister = token.on_cancel(self._wake) if token is not None else None
+        try:
+            while True:
+                with self._cond:
+                    while seq >= len(self.chunks) and not self.done:
+                        if token is not None and token.cancelled:
+                            raise Cancelled()
+                        self._cond.wait()
+                    pending = self.chunks[seq:]
+                    seq = len(self.chunks)
+                    finished = self.done and not pending
+                for chunk in pending:
+                    yield chunk
+                if finished:
+                    if self.error is not None:
+                        raise self.error
+                    if self.cancelled:
+                        raise ConnectionAbortedError("Shared stream was cancelled")
+                    return
+        finally:
+            if unregister is not None:
+                unregister()
+            with self._cond:
+                self.subscribers -= 1
+                if self.subscribers == 0 and not self.done:
+                    # Nobody is reading any more: stop the upstream
+                    self.cancelled = True
+                    self._token.cancel()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key across threads."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """fn(), or the result (or exception) of the identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role="leader" if leader else "follower")
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, make_chunks):
+        """Iterate make_chunks(), sharing one upstream with concurrent callers of the same key."""
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None or shared.cancelled
+            if leader:
+                shared = self._streams[key] = _SharedStream(lambda s: self._forget(key, s))
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role="leader" if leader else "follower")
+        if leader:
+            shared.start(make_chunks)
+        return shared.subscribe()
+
+    def _forget(self, key, shared):
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+
+# ===== ASYNCIO =====
+class _AsyncSharedStream:
+    """Chunks of one async upstream iterator, pumped by a task and replayed to each subscriber."""
+
+    def __init__(self, on_finish):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task = None
+        self._on_finish = on_finish
+
+    def start(self, make_chunks):
+        self._task = asyncio.ensure_future(self._pump(make_chunks))
+        return self
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, make_chunks):
+        error = None
+        upstream = make_chunks()
+        try:
+            async for chunk in upstream:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.cancelled = True
+        except Exception as e:
+            error = e
+        finally:
+            await upstream.aclose()
+            self._on_finish(self)
+            self.done = True
+            self.error = error
+            self._notify()
+
+    async def subscribe(self):
+        # Counted once iteration starts, like the threaded subscribe()
+        self.subscribers += 1
+        seq = 0
+        try:
+            while True:
+                if seq >= len(self.chunks) and not self.done:
+                    await self._changed.wait()
+                    continue
+                pending = self.chunks[seq:]
+                seq = len(self.chunks)
+                for chunk in pending:
+                    yield chunk
+                if self.done and seq >= len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    if self.cancelled:
+                        raise ConnectionAbortedError("Shared stream was cancelled")
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self._task is not None:
+                self.cancelled = True
+                self._task.cancel()
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent coroutine calls with the same key on one event loop."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+
+    async def do(self, key, fn):
+        """await fn(), or share the outcome of the identical call already in flight."""
+        future = self._calls.get(key)
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role="follower" if future is not None else "leader")
+        if future is None:
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda f: self._forget(self._calls, key, f))
+        # A cancelled caller must not cancel the work the others are waiting for
+        return await asyncio.shield(future)
+
+    def stream(self, key, make_chunks):
+        """Async-iterate make_chunks(), sharing one upstream with concurrent callers of the same key."""
+        shared = self._streams.get(key)
+        leader = shared is None or shared.cancelled
+        if leader:
+            shared = self._streams[key] = _AsyncSharedStream(lambda s: self._forget(self._streams, key, s))
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role="leader" if leader else "follower")
+        if leader:
+            shared.start(make_chunks)
+        return shared.subscribe()
+
+    @staticmethod
+    def _forget(flights, key, flight):
+        if flights.get(key) is flight:
+            del flights[key]
@@ -0,0 +1,270 @@
+"""Server-sent events for /chat/stream.
+
+Each answer stream gets an id and a short-lived buffer. A producer pulls
+chunks from the upstream LLM iterator into the buffer; every HTTP response
+attached to the stream is a consumer that follows the buffer and writes
+
+    id: <stream id>:<seq>
+    data: <chunk>
+
+frames, ``: keep-alive`` comments while no chunk is ready, and a final
+``event: done`` (or ``event: error``) frame. A client that loses the
+connection can POST again with ``Last-Event-ID`` and is replayed everything
+after that id, then follows the live stream.
+
+When the last consumer goes away (the browser closed the tab, the network
+dropped) the producer is cancelled and the upstream iterator closed, so we
+stop paying for tokens nobody reads: the asyncio producer task is cancelled,
+and the threaded producer's CancelToken (cancellation.py) wakes the layers it
+is blocked in and aborts the provider call. ``SSE_RESUME_GRACE`` (seconds, default
+0) delays that cancellation to give a reconnecting client time to resume the
+live stream rather than only its buffered part. Finished buffers are kept for
+``SSE_BUFFER_TTL`` seconds for late resumes. Buffers are per process:
+behind several workers, resumes need sticky sessions.
+
+StreamBuffer serves the threaded Flask app, AsyncStreamBuffer the ASGI app.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from cancellation import CancelToken, Cancelled, bound
+from metrics import Counter
+
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT", "15"))
+BUFFER_TTL = float(os.getenv("SSE_BUFFER_TTL", "120"))
+MAX_BUFFERS = int(os.getenv("SSE_MAX_BUFFERS", "1000"))
+RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "0"))
+RETRY_MS = 3000
+
+HEARTBEAT = ": keep-alive\n\n"
+
+SSE_STREAMS = Counter(
+    "astrobot_sse_streams", "Chat streams by outcome: done, error, cancelled, resumed.", ("outcome",))
+
+
+def format_event(data, event_id=None, event=None):
+    """One SSE frame; multi-line data becomes several data: lines."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value):
+    """'<stream id>:<seq>' -> (stream id, seq), or (None, 0) if absent or malformed."""
+    if not value or ":" not in value:
+        return None, 0
+    stream_id, _, seq = value.rpartition(":")
+    try:
+        return stream_id, int(seq)
+    except ValueError:
+        return None, 0
+
+
+class _Buffer:
+    """Events of one stream plus completion state; subclasses add waiting."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.events = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.consumers = 0
+        self.finished_at = None
+
+    def expired(self, now):
+        return self.finished_at is not None and now - self.finished_at > BUFFER_TTL
+
+    def _frames_after(self, seq):
+        return [format_event(text, f"{self.id}:{i}") for i, text in enumerate(self.events[seq:], seq + 1)]
+
+    def _closing_frame(self):
+        event_id = f"{self.id}:{len(self.events)}"
+        if self.error is not None:
+            return format_event(str(self.error), event_id, "error")
+        if self.cancelled:
+            return format_event("stream cancelled", event_id, "error")
+        return format_event("[DONE]", event_id, "done")
+
+    def _finish(self, error=None):
+        self.done = True
+        self.error = error
+        self.finished_at = time.monotonic()
+        SSE_STREAMS.inc(outcome="error" if error is not None else "cancelled" if self.cancelled else "done")
+
+
+# ===== THREADED (Flask) =====
+class StreamBuffer(_Buffer):
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition()
+        self._token = CancelToken()
+
+    def start(self, chunks):
+        """Pump `chunks` (an iterator of text) into the buffer on a daemon thread."""
+        threading.Thread(target=self._pump, args=(chunks,), daemon=True).start()
+        return self
+
+    def _pump(self, chunks):
+        error = None
+        try:
+            with bound(self._token):
+                for chunk in chunks:
+                    if self.cancelled:
+                        break
+                    with self._cond:
+                        self.events.append(chunk)
+                        self._cond.notify_all()
+        except Cancelled:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            # Closing the generator closes the LLM stream behind it
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            with self._cond:
+                self._finish(error)
+                self._cond.notify_all()
+
+    def follow(self, after=0, heartbeat=HEARTBEAT_SECONDS):
+        """SSE frames for one consumer, starting after event number `after`."""
+        with self._cond:
+            self.consumers += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            seq = after
+            while True:
+                with self._cond:
+                    if len(self.events) <= seq and not self.done:
+                        self._cond.wait(heartbeat)
+                    frames = self._frames_after(seq)
+                    seq = len(self.events)
+                    finished = self.done and not frames
+                if frames:
+                    yield "".join(frames)
+                elif finished:
+                    yield self._closing_frame()
+                    return
+                else:
+                    yield HEARTBEAT
+        finally:
+            with self._cond:
+                self.consumers -= 1
+            if RESUME_GRACE > 0:
+                threading.Timer(RESUME_GRACE, self._cancel_if_abandoned).start()
+            else:
+                self._cancel_if_abandoned()
+
+    def _cancel_if_abandoned(self):
+        with self._cond:
+            if self.consumers == 0 and not self.done:
+                # Nobody is reading any more: stop the upstream generation now,
+                # not when its next chunk arrives
+                self.cancelled = True
+                self._token.cancel()
+
+
+# ===== ASYNCIO (ASGI) =====
+class AsyncStreamBuffer(_Buffer):
+    def __init__(self):
+        super().__init__()
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def start(self, chunks):
+        """Pump `chunks` (an async iterator of text) into the buffer as a task."""
+        self._task = asyncio.ensure_future(self._pump(chunks))
+        return self
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, chunks):
+        error = None
+        try:
+            async for chunk in chunks:
+                self.events.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            await chunks.aclose()
+            self._finish(error)
+            self._notify()
+
+    async def follow(self, after=0, heartbeat=HEARTBEAT_SECONDS):
+        self.consumers += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            seq = after
+            while True:
+                if len(self.events) <= seq and not self.done:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT
+                        continue
+                frames = self._frames_after(seq)
+                seq = len(self.events)
+                if frames:
+                    yield "".join(frames)
+                elif self.done:
+                    yield self._closing_frame()
+                    return
+        finally:
+            self.consumers -= 1
+            if RESUME_GRACE > 0:
+                asyncio.get_running_loop().call_later(RESUME_GRACE, self._cancel_if_abandoned)
+            else:
+                self._cancel_if_abandoned()
+
+    def _cancel_if_abandoned(self):
+        if self.consumers == 0 and not self.done and self._task is not None:
+            self.cancelled = True
+            self._task.cancel()
+
+
+# ===== REGISTRY =====
+class StreamRegistry:
+    """Live and recently finished stream buffers, for Last-Event-ID resumes."""
+
+    def __init__(self, max_buffers=MAX_BUFFERS):
+        self.max_buffers = max_buffers
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, buffer):
+        now = time.monotonic()
+        with self._lock:
+            for stream_id in [k for k, b in self._buffers.items() if b.expired(now)]:
+                del self._buffers[stream_id]
+            self._buffers[buffer.id] = buffer
+            while len(self._buffers) > self.max_buffers:
+                self._buffers.popitem(last=False)
+        return buffer
+
+    def get(self, stream_id):
+        with self._lock:
+            buffer = self._buffers.get(stream_id)
+        if buffer is None or buffer.expired(time.monotonic()):
+            return None
+        SSE_STREAMS.inc(outcome="resumed")
+        return buffer
+
+
+streams = StreamRegistry()
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
@@ -0,0 +1,166 @@
+"""Follow-up question suggestions served from cache, with the LLM as fallback.
+
+Suggestions depend on what a question is about far more than on its exact
+wording, so they are stored per chart-router topic ("marriage", "children",
+"children+spirituality", ...). Lookups go through three tiers:
+
+    1. an in-memory LRU keyed by the normalized question
+    2. the per-topic table, warmed at startup from suggestions_seed.json and
+       the on-disk store (SUGGESTIONS_PATH), which is checked again on a miss
+       for topics other workers have learned since
+    3. the LLM, whose answer is written back to the topic table and store
+
+so only the first question of a topic nobody has asked about yet pays for a
+Gemini call. Identical questions that miss at the same time share that call.
+
+The store is a SQLite file with one row per learned topic, written with an
+upsert, so any number of workers can learn topics side by side without losing
+each other's. Set ``SUGGESTIONS_PATH`` to an empty string to keep learned
+topics in memory only.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from answer_cache import normalize_question
+from chart_router import router
+from metrics import Counter
+from single_flight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "suggestions_seed.json")
+DEFAULT_PATH = os.getenv("SUGGESTIONS_PATH", "cache/suggestions.sqlite3")
+DEFAULT_LRU_SIZE = int(os.getenv("SUGGESTIONS_LRU_SIZE", "4096"))
+
+SUGGESTION_REQUESTS = Counter(
+    "astrobot_suggestion_requests", "Follow-up suggestion lookups by the tier that served them.", ("source",))
+
+
+class SuggestionService:
+    def __init__(self, path=DEFAULT_PATH, seed_path=SEED_PATH, lru_size=DEFAULT_LRU_SIZE):
+        self.path = path
+        self.seed_path = seed_path
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._flights = SingleFlight("suggestions")
+        self._async_flights = AsyncSingleFlight("suggestions")
+        self._seeds = {}
+        self._topics = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._warm = False
+
+    def _connect(self):
+        # A connection must not cross a fork, so a forked worker opens its own
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS topics ("
+                " topic TEXT PRIMARY KEY, questions TEXT NOT NULL, updated REAL NOT NULL)")
+        return self._conn
+
+    def warm(self):
+        """Load the seed table and the on-disk store; stored topics override seeds."""
+        seeds, stored = {}, {}
+        if os.path.exists(self.seed_path):
+            with open(self.seed_path, encoding="utf-8") as f:
+                seeds = json.load(f)
+        if self.path:
+            with self._lock:
+                stored = {topic: json.loads(questions) for topic, questions
+                          in self._connect().execute("SELECT topic, questions FROM topics")}
+        with self._lock:
+            self._seeds = seeds
+            self._topics = {**seeds, **stored}
+            self._warm = True
+        logger.info("Loaded follow-up suggestions for %d topics", len(self._topics))
+        return self
+
+    def _remember(self, normalized, questions):
+        with self._lock:
+            self._lru[normalized] = questions
+            self._lru.move_to_end(normalized)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _load(self, topic):
+        """A topic another worker stored since warm(), or None."""
+        if not self.path:
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT questions FROM topics WHERE topic = ?", (topic,)).fetchone()
+            if row is None:
+                return None
+            questions = self._topics[topic] = json.loads(row[0])
+        return questions
+
+    def _store(self, topic, questions):
+        with self._lock:
+            self._topics[topic] = questions
+            # Only topics learned from the LLM go to disk; seeds ship with the code
+            if not self.path or self._seeds.get(topic) == questions:
+                return
+            # One row per topic, so workers learning different topics never
+            # overwrite each other; the same topic keeps the latest answer
+            self._connect().execute(
+                "INSERT INTO topics VALUES (?, ?, ?) ON CONFLICT (topic) DO UPDATE"
+                " SET questions = excluded.questions, updated = excluded.updated",
+                (topic, json.dumps(questions, ensure_ascii=False), time.time()))
+
+    def lookup(self, question):
+        """(normalized question, topic, cached suggestions or None)."""
+        if not self._warm:
+            self.warm()
+        normalized = normalize_question(question)
+        with self._lock:
+            questions = self._lru.get(normalized)
+            if questions is not None:
+                self._lru.move_to_end(normalized)
+        if questions is not None:
+            SUGGESTION_REQUESTS.inc(source="lru")
+            return normalized, None, questions
+
+        topic = router.topic(question)
+        questions = self._topics.get(topic)
+        if questions is None:
+            questions = self._load(topic)
+        if questions is not None:
+            SUGGESTION_REQUESTS.inc(source="table")
+            self._remember(normalized, questions)
+        return normalized, topic, questions
+
+    def learn(self, normalized, topic, questions):
+        SUGGESTION_REQUESTS.inc(source="llm")
+        if questions:
+            self._store(topic, questions)
+            self._remember(normalized, questions)
+        return questions
+
+    def suggest(self, question, generate):
+        """Suggestions for `question`, calling `generate(question)` only on a miss."""
+        normalized, topic, questions = self.lookup(question)
+        if questions is not None:
+            return questions
+        return self._flights.do(normalized, lambda: self.learn(normalized, topic, generate(question)))
+
+    async def suggest_async(self, question, generate):
+        normalized, topic, questions = self.lookup(question)
+        if questions is not None:
+            return questions
+        async def generate_and_learn():
+            return self.learn(normalized, topic, await generate(question))
+        return await self._async_flights.do(normalized, generate_and_learn)
+
+
+suggestion_service = SuggestionService()
@@ -0,0 +1,39 @@
+"""swisseph configuration across threads.
+
+swisseph's sidereal mode is per-thread state, so a chart computed on a thread
+that has not configured it would come out in the default ayanamsha, about
+0.88° off Lahiri.
+
+    cd server && python -m pytest -q test_combined.py
+"""
+import threading
+from datetime import datetime, timezone
+
+import combined
+
+BIRTH = datetime(1990, 5, 17, 4, 30, tzinfo=timezone.utc)
+LAT, LON = 19.076, 72.8777
+
+
+def on_fresh_thread(fn):
+    result = {}
+
+    def run():
+        result["value"] = fn()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return result["value"]
+
+
+def test_chart_on_fresh_thread_matches_main_thread():
+    expected = combined.get_chart_details(BIRTH, LAT, LON).to_dict()
+    assert on_fresh_thread(lambda: combined.get_chart_details(BIRTH, LAT, LON).to_dict()) == expected
+
+
+def test_batch_positions_on_fresh_thread_match_main_thread():
+    expected = combined.get_batch_positions([BIRTH], [LAT], [LON])
+    lagna, longitudes = on_fresh_thread(lambda: combined.get_batch_positions([BIRTH], [LAT], [LON]))
+    assert lagna.tolist() == expected[0].tolist()
+    assert longitudes.tolist() == expected[1].tolist()
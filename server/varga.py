@@ -0,0 +1,111 @@
+"""Table-driven divisional chart (varga) engine.
+
+Every D-N chart splits each 30° sign into N parts and maps (sign, part) to a
+sign of the zodiac. Those mappings are precomputed here as (12, N) lookup
+tables following the Parashari rules, so any varga of any number of
+longitudes is one floor-divide and one table gather:
+
+    signs = compute_vargas(longitudes, [1, 7, 9, 20])
+
+D7, D9 and D20 reproduce the cyclic ``(sign * N + part) % 12`` rule the
+original per-chart helpers used, which agrees with the Parashari start signs
+for those three vargas.
+"""
+import numpy as np
+
+VARGA_NAMES = {
+    1: "Rāśi", 2: "Hora", 3: "Drekkana", 4: "Chaturthamsa", 7: "Saptamsa",
+    9: "Navamsa", 10: "Dasamsa", 12: "Dwadasamsa", 16: "Shodasamsa",
+    20: "Vimsamsa", 24: "Chaturvimsamsa", 27: "Bhamsa", 30: "Trimsamsa",
+    40: "Khavedamsa", 45: "Akshavedamsa", 60: "Shashtiamsa",
+}
+
+SUPPORTED_DIVISIONS = list(VARGA_NAMES)
+
+ARIES, TAURUS, GEMINI, CANCER, LEO, VIRGO, LIBRA, SCORPIO, SAGITTARIUS, \
+    CAPRICORN, AQUARIUS, PISCES = range(12)
+
+# Trimsamsa: (end degree, sign) for odd and even signs, expanded to 1° slots
+TRIMSAMSA_ODD = [(5, ARIES), (10, AQUARIUS), (18, SAGITTARIUS), (25, GEMINI), (30, LIBRA)]
+TRIMSAMSA_EVEN = [(5, TAURUS), (12, VIRGO), (20, PISCES), (25, CAPRICORN), (30, SCORPIO)]
+
+
+def _start_sign(division, sign):
+    """Sign the first part of `sign` maps to in a D-`division` chart."""
+    odd = sign % 2 == 0          # Aries (0) is an odd sign
+    modality = sign % 3          # 0 movable, 1 fixed, 2 dual
+    element = sign % 4           # 0 fire, 1 earth, 2 air, 3 water
+    if division in (1, 3, 4, 12, 60):
+        return sign
+    if division == 7:
+        return sign if odd else (sign + 6) % 12
+    if division == 9:
+        return (sign * 9) % 12
+    if division == 10:
+        return sign if odd else (sign + 8) % 12
+    if division in (16, 45):
+        return (ARIES, LEO, SAGITTARIUS)[modality]
+    if division == 20:
+        return (ARIES, SAGITTARIUS, LEO)[modality]
+    if division == 24:
+        return LEO if odd else CANCER
+    if division == 27:
+        return (ARIES, CANCER, LIBRA, CAPRICORN)[element]
+    if division == 40:
+        return ARIES if odd else LIBRA
+    raise ValueError(f"Unsupported divisional chart: D{division}")
+
+
+def _step(division):
+    """Signs advanced per part within a sign."""
+    return {3: 4, 4: 3}.get(division, 1)
+
+
+def _build_table(division):
+    table = np.empty((12, division), dtype=np.int8)
+    for sign in range(12):
+        odd = sign % 2 == 0
+        if division == 2:
+            table[sign] = (LEO, CANCER) if odd else (CANCER, LEO)
+        elif division == 30:
+            bounds = TRIMSAMSA_ODD if odd else TRIMSAMSA_EVEN
+            table[sign] = [next(s for end, s in bounds if degree < end) for degree in range(30)]
+        else:
+            start = _start_sign(division, sign)
+            table[sign] = [(start + part * _step(division)) % 12 for part in range(division)]
+    return table
+
+
+# (sign, division index) -> varga sign, built once at import
+VARGA_TABLES = {division: _build_table(division) for division in SUPPORTED_DIVISIONS}
+
+
+def compute_vargas(longitudes, divisions):
+    """Varga signs for every longitude and every requested division.
+
+    `longitudes` may be a scalar or an array of any shape (e.g. rows of
+    lagna + planets); each entry of the returned dict has the same shape.
+    """
+    longitudes = np.asarray(longitudes, dtype=float)
+    sign = (longitudes // 30).astype(np.int64)
+    deg_in_sign = longitudes % 30
+    result = {}
+    for division in divisions:
+        table = VARGA_TABLES.get(division)
+        if table is None:
+            raise ValueError(f"Unsupported divisional chart: D{division}")
+        if division == 1:
+            result[division] = sign
+            continue
+        part = np.minimum((deg_in_sign // (30 / division)).astype(np.int64), division - 1)
+        result[division] = table[sign, part].astype(np.int64)
+    return result
+
+
+def varga_signs(longitudes, division):
+    return compute_vargas(longitudes, [division])[division]
+
+
+def varga_sign(lon, division):
+    """Scalar helper: D-`division` sign index (0 = Aries) of one longitude."""
+    return int(varga_signs(lon, division))